@@ -0,0 +1,34 @@
+"""Add high_school_profiles table
+
+Revision ID: 0b7e4c92d5a1
+Revises: f2b6d8a0c4e7
+Create Date: 2026-10-18 15:41:07.523816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4c92d5a1'
+down_revision: Union[str, None] = 'f2b6d8a0c4e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `python -m sql_db.profiles` and kept current by ingestion
+    op.create_table(
+        'high_school_profiles',
+        sa.Column('high_school_id', sa.Integer(), nullable=False),
+        sa.Column('encoding', sa.String(), nullable=False),
+        sa.Column('raw_size', sa.Integer(), nullable=True),
+        sa.Column('body', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('high_school_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('high_school_profiles')
@@ -0,0 +1,33 @@
+"""Add data_generation table
+
+Revision ID: 2f9c4e7b1a85
+Revises: 6e1b3d9f7a24
+Create Date: 2026-10-18 22:41:08.530217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f9c4e7b1a85'
+down_revision: Union[str, None] = '6e1b3d9f7a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One row, bumped by every ingestion transaction (see sql_db/generation.py)
+    op.create_table(
+        'data_generation',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO data_generation (id, generation) VALUES (1, 0)")
+
+
+def downgrade() -> None:
+    op.drop_table('data_generation')
@@ -0,0 +1,49 @@
+"""Add admission_trends table
+
+Revision ID: 4c8a2f6b9d13
+Revises: d3a7c1e9f5b2
+Create Date: 2026-10-18 20:37:12.408816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8a2f6b9d13'
+down_revision: Union[str, None] = 'd3a7c1e9f5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `python -m sql_db.trends` and refreshed after every ingestion run
+    op.create_table(
+        'admission_trends',
+        sa.Column('high_school_id', sa.Integer(), nullable=False),
+        sa.Column('uc_campus_id', sa.Integer(), nullable=False),
+        sa.Column('academic_year', sa.Integer(), nullable=False),
+        sa.Column('applicants', sa.Integer(), nullable=True),
+        sa.Column('admits', sa.Integer(), nullable=True),
+        sa.Column('enrollees', sa.Integer(), nullable=True),
+        sa.Column('female_applicants', sa.Integer(), nullable=True),
+        sa.Column('male_applicants', sa.Integer(), nullable=True),
+        sa.Column('admit_rate', sa.Float(), nullable=True),
+        sa.Column('female_share', sa.Float(), nullable=True),
+        sa.Column('male_share', sa.Float(), nullable=True),
+        sa.Column('applicants_delta', sa.Integer(), nullable=True),
+        sa.Column('admits_delta', sa.Integer(), nullable=True),
+        sa.Column('enrollees_delta', sa.Integer(), nullable=True),
+        sa.Column('admit_rate_delta', sa.Float(), nullable=True),
+        sa.Column('applicants_cagr', sa.Float(), nullable=True),
+        sa.Column('admits_cagr', sa.Float(), nullable=True),
+        sa.Column('enrollees_cagr', sa.Float(), nullable=True),
+        sa.Column('admit_rate_avg3', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('high_school_id', 'uc_campus_id', 'academic_year'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('admission_trends')
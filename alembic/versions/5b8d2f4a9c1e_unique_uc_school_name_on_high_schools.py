@@ -0,0 +1,49 @@
+"""Make high_schools.uc_school_name unique
+
+Revision ID: 5b8d2f4a9c1e
+Revises: c47c773b1190
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8d2f4a9c1e'
+down_revision: Union[str, None] = 'c47c773b1190'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Rows that share a uc_school_name with a lower id, and the lowest id of a name.
+# Correlated subqueries rather than UPDATE ... FROM / DELETE ... USING, so this also runs on SQLite
+DUPLICATE_IDS = """
+    SELECT h.id FROM high_schools h
+    WHERE h.uc_school_name IS NOT NULL
+      AND h.id > (SELECT MIN(k.id) FROM high_schools k WHERE k.uc_school_name = h.uc_school_name)
+"""
+KEEP_ID = """
+    SELECT MIN(k.id) FROM high_schools k
+    WHERE k.uc_school_name = (SELECT h.uc_school_name FROM high_schools h WHERE h.id = {table}.high_school_id)
+"""
+
+
+def upgrade() -> None:
+    # Repoint admission rows at the surviving school before removing duplicates
+    for table in ['uc_admission_gender', 'uc_admission_ethnicity', 'uc_admission_gpa']:
+        op.execute(f"""
+            UPDATE {table} SET high_school_id = ({KEEP_ID.format(table=table)})
+            WHERE high_school_id IN ({DUPLICATE_IDS})
+        """)
+    op.execute(f"DELETE FROM high_schools WHERE id IN ({DUPLICATE_IDS})")
+
+    op.drop_index('ix_high_schools_uc_school_name', table_name='high_schools')
+    op.create_index(op.f('ix_high_schools_uc_school_name'), 'high_schools', ['uc_school_name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_high_schools_uc_school_name'), table_name='high_schools')
+    op.create_index(op.f('ix_high_schools_uc_school_name'), 'high_schools', ['uc_school_name'], unique=False)
@@ -0,0 +1,52 @@
+"""Add geo_rollups table
+
+Revision ID: 6e1b3d9f7a24
+Revises: 4c8a2f6b9d13
+Create Date: 2026-10-18 21:52:40.117306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1b3d9f7a24'
+down_revision: Union[str, None] = '4c8a2f6b9d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `python -m sql_db.geo` and refreshed after every ingestion run
+    op.create_table(
+        'geo_rollups',
+        sa.Column('geo_level', sa.String(), nullable=False),
+        sa.Column('geo_value', sa.String(), nullable=False),
+        sa.Column('uc_campus_id', sa.Integer(), nullable=False),
+        sa.Column('academic_year', sa.SmallInteger(), nullable=False),
+        sa.Column('admission_type', sa.SmallInteger(), nullable=False),
+        sa.Column('schools', sa.Integer(), nullable=True),
+        sa.Column('total_applicants', sa.Integer(), nullable=True),
+        sa.Column('male_applicants', sa.Integer(), nullable=True),
+        sa.Column('female_applicants', sa.Integer(), nullable=True),
+        sa.Column('other_applicants', sa.Integer(), nullable=True),
+        sa.Column('unknown_gender', sa.Integer(), nullable=True),
+        sa.Column('all_ethnicities', sa.Integer(), nullable=True),
+        sa.Column('african_american', sa.Integer(), nullable=True),
+        sa.Column('american_indian', sa.Integer(), nullable=True),
+        sa.Column('hispanic_latinx', sa.Integer(), nullable=True),
+        sa.Column('pacific_islander', sa.Integer(), nullable=True),
+        sa.Column('asian', sa.Integer(), nullable=True),
+        sa.Column('white', sa.Integer(), nullable=True),
+        sa.Column('domestic_unknown', sa.Integer(), nullable=True),
+        sa.Column('international', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('geo_level', 'geo_value', 'uc_campus_id', 'academic_year', 'admission_type'),
+    )
+    op.create_index('ix_geo_rollups_campus_year_level', 'geo_rollups', ['uc_campus_id', 'academic_year', 'geo_level'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_geo_rollups_campus_year_level', table_name='geo_rollups')
+    op.drop_table('geo_rollups')
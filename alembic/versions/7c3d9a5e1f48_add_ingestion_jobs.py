@@ -0,0 +1,59 @@
+"""Add ingestion_jobs and ingestion_job_files tables
+
+Revision ID: 7c3d9a5e1f48
+Revises: 0b7e4c92d5a1
+Create Date: 2026-10-18 16:27:54.904132
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3d9a5e1f48'
+down_revision: Union[str, None] = '0b7e4c92d5a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+job_status = sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED', 'SKIPPED', name='jobstatus')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ingestion_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('status', job_status, nullable=False),
+        sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+        sa.Column('worker_pid', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_ingestion_jobs_id'), 'ingestion_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_ingestion_jobs_status'), 'ingestion_jobs', ['status'], unique=False)
+    op.create_table(
+        'ingestion_job_files',
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=True),
+        sa.Column('status', job_status, nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=True),
+        sa.Column('records', sa.Integer(), nullable=True),
+        sa.Column('seconds', sa.Float(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['ingestion_jobs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id']),
+        sa.PrimaryKeyConstraint('job_id', 'position'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ingestion_job_files')
+    op.drop_index(op.f('ix_ingestion_jobs_status'), table_name='ingestion_jobs')
+    op.drop_index(op.f('ix_ingestion_jobs_id'), table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
+    job_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,43 @@
+"""Add per-file ingestion checkpoints
+
+Revision ID: 8f1c3a7d2e64
+Revises: 5b8d2f4a9c1e
+Create Date: 2026-10-18 10:41:07.529316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f1c3a7d2e64'
+down_revision: Union[str, None] = '5b8d2f4a9c1e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('files', sa.Column('row_count', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('record_count', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('last_error', sa.String(), nullable=True))
+    # Batch mode, since SQLite cannot add a foreign key to an existing table (it copies the table instead)
+    for table in ['uc_admission_gender', 'uc_admission_ethnicity', 'uc_admission_gpa']:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('file_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'{table}_file_id_fkey', 'files', ['file_id'], ['id'])
+            batch_op.create_index(batch_op.f(f'ix_{table}_file_id'), ['file_id'], unique=False)
+
+
+def downgrade() -> None:
+    for table in ['uc_admission_gpa', 'uc_admission_ethnicity', 'uc_admission_gender']:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_file_id'))
+            batch_op.drop_constraint(f'{table}_file_id_fkey', type_='foreignkey')
+            batch_op.drop_column('file_id')
+    op.drop_column('files', 'last_error')
+    op.drop_column('files', 'record_count')
+    op.drop_column('files', 'row_count')
+    op.drop_column('files', 'content_hash')
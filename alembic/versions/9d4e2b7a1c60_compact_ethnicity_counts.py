@@ -0,0 +1,110 @@
+"""Store ethnicity counts as one wide row per school/campus/year/admission type
+
+Revision ID: 9d4e2b7a1c60
+Revises: 7c3d9a5e1f48
+Create Date: 2026-10-18 17:12:40.318075
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e2b7a1c60'
+down_revision: Union[str, None] = '7c3d9a5e1f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (ethnicity label in the long layout, count column in the compact one), in file order
+ETHNICITY_COLUMNS = [
+    ('All', 'all_ethnicities'),
+    ('African American', 'african_american'),
+    ('American Indian', 'american_indian'),
+    ('Hispanic/ Latinx', 'hispanic_latinx'),
+    ('Pacific Islander', 'pacific_islander'),
+    ('Asian', 'asian'),
+    ('White', 'white'),
+    ('Domestic Unknown', 'domestic_unknown'),
+    ("Int'l", 'international'),
+]
+KEYS = ['high_school_id', 'uc_campus_id', 'academic_year', 'admission_type']
+
+
+def quoted(label):
+    return "'" + label.replace("'", "''") + "'"
+
+
+def upgrade() -> None:
+    op.create_table(
+        'uc_admission_ethnicity_counts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('high_school_id', sa.Integer(), nullable=True),
+        sa.Column('uc_campus_id', sa.Integer(), nullable=True),
+        sa.Column('file_id', sa.Integer(), nullable=True),
+        sa.Column('admission_type', sa.String(), nullable=True),
+        sa.Column('academic_year', sa.Integer(), nullable=True),
+        *[sa.Column(column, sa.Integer(), nullable=True) for _, column in ETHNICITY_COLUMNS],
+        sa.ForeignKeyConstraint(['high_school_id'], ['high_schools.id']),
+        sa.ForeignKeyConstraint(['uc_campus_id'], ['uc_campuses.id']),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(*KEYS, name='uq_uc_admission_ethnicity_counts_natural_key'),
+    )
+    op.create_index(op.f('ix_uc_admission_ethnicity_counts_id'), 'uc_admission_ethnicity_counts', ['id'], unique=False)
+    op.create_index(op.f('ix_uc_admission_ethnicity_counts_file_id'), 'uc_admission_ethnicity_counts', ['file_id'], unique=False)
+
+    # One compact row per natural key, numbered in the order the long rows were loaded
+    keys = ', '.join(KEYS)
+    counts = ', '.join(f"MAX(CASE WHEN ethnicity = {quoted(label)} THEN count END)" for label, _ in ETHNICITY_COLUMNS)
+    op.execute(f"""
+        INSERT INTO uc_admission_ethnicity_counts ({keys}, file_id, {', '.join(column for _, column in ETHNICITY_COLUMNS)})
+        SELECT {keys}, MAX(file_id), {counts}
+        FROM uc_admission_ethnicity
+        GROUP BY {keys}
+        ORDER BY MIN(id)
+    """)
+    op.drop_table('uc_admission_ethnicity')
+    create_view()
+
+
+def create_view():
+    # Same definition as sql_db.models.ethnicity_view_sql at this revision
+    op.execute("CREATE VIEW uc_admission_ethnicity AS\n" + "\nUNION ALL\n".join(
+        f"SELECT id * {len(ETHNICITY_COLUMNS)} + {position} AS id, high_school_id, uc_campus_id, file_id, admission_type, "
+        f"{quoted(label)} AS ethnicity, {column} AS count, academic_year "
+        f"FROM uc_admission_ethnicity_counts WHERE {column} IS NOT NULL"
+        for position, (label, column) in enumerate(ETHNICITY_COLUMNS)
+    ))
+
+
+def downgrade() -> None:
+    columns = 'high_school_id, uc_campus_id, file_id, admission_type, ethnicity, count, academic_year'
+    op.execute(f"CREATE TABLE uc_admission_ethnicity_rows AS SELECT id, {columns} FROM uc_admission_ethnicity")
+    op.execute("DROP VIEW uc_admission_ethnicity")
+    op.drop_index(op.f('ix_uc_admission_ethnicity_counts_file_id'), table_name='uc_admission_ethnicity_counts')
+    op.drop_index(op.f('ix_uc_admission_ethnicity_counts_id'), table_name='uc_admission_ethnicity_counts')
+    op.drop_table('uc_admission_ethnicity_counts')
+
+    op.create_table(
+        'uc_admission_ethnicity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('high_school_id', sa.Integer(), nullable=True),
+        sa.Column('uc_campus_id', sa.Integer(), nullable=True),
+        sa.Column('admission_type', sa.String(), nullable=True),
+        sa.Column('ethnicity', sa.String(), nullable=True),
+        sa.Column('count', sa.Integer(), nullable=True),
+        sa.Column('academic_year', sa.Integer(), nullable=True),
+        sa.Column('file_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['high_school_id'], ['high_schools.id']),
+        sa.ForeignKeyConstraint(['uc_campus_id'], ['uc_campuses.id']),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id'], name='uc_admission_ethnicity_file_id_fkey'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('high_school_id', 'uc_campus_id', 'academic_year', 'admission_type', 'ethnicity',
+                            name='uq_uc_admission_ethnicity_natural_key'),
+    )
+    op.create_index(op.f('ix_uc_admission_ethnicity_id'), 'uc_admission_ethnicity', ['id'], unique=False)
+    op.create_index(op.f('ix_uc_admission_ethnicity_file_id'), 'uc_admission_ethnicity', ['file_id'], unique=False)
+    op.execute(f"INSERT INTO uc_admission_ethnicity ({columns}) SELECT {columns} FROM uc_admission_ethnicity_rows ORDER BY id")
+    op.drop_table('uc_admission_ethnicity_rows')
@@ -0,0 +1,35 @@
+"""Add pg_trgm GIN index on high_schools.school_name
+
+Revision ID: a3e9d6b1f207
+Revises: 8f1c3a7d2e64
+Create Date: 2026-10-18 12:03:51.774410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e9d6b1f207'
+down_revision: Union[str, None] = '8f1c3a7d2e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Other backends use the in-process index in sql_db/search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_high_schools_school_name_trgm', 'high_schools', ['school_name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'school_name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_high_schools_school_name_trgm', table_name='high_schools')
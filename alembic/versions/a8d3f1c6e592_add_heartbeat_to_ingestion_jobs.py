@@ -0,0 +1,28 @@
+"""Add heartbeat_at to ingestion_jobs
+
+Revision ID: a8d3f1c6e592
+Revises: 2f9c4e7b1a85
+Create Date: 2026-10-18 23:52:16.204871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d3f1c6e592'
+down_revision: Union[str, None] = '2f9c4e7b1a85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Refreshed by the worker running the job; only jobs whose heartbeat is too old are requeued
+    op.add_column('ingestion_jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('ingestion_jobs') as batch_op:
+        batch_op.drop_column('heartbeat_at')
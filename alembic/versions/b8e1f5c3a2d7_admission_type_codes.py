@@ -0,0 +1,88 @@
+"""Store admission_type as a smallint code and academic_year as smallint
+
+Revision ID: b8e1f5c3a2d7
+Revises: 9d4e2b7a1c60
+Create Date: 2026-10-18 18:04:51.772309
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e1f5c3a2d7'
+down_revision: Union[str, None] = '9d4e2b7a1c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Code = position, as in sql_db.transform.ADMISSION_TYPES
+ADMISSION_TYPES = ['App', 'Adm', 'Enr']
+TABLES = ['uc_admission_gender', 'uc_admission_gpa', 'uc_admission_ethnicity_counts']
+# Same as revision 9d4e2b7a1c60: the view reads admission_type and academic_year, so it is rebuilt around the change
+ETHNICITY_COLUMNS = [
+    ('All', 'all_ethnicities'),
+    ('African American', 'african_american'),
+    ('American Indian', 'american_indian'),
+    ('Hispanic/ Latinx', 'hispanic_latinx'),
+    ('Pacific Islander', 'pacific_islander'),
+    ('Asian', 'asian'),
+    ('White', 'white'),
+    ('Domestic Unknown', 'domestic_unknown'),
+    ("Int'l", 'international'),
+]
+
+
+def create_view():
+    op.execute("CREATE VIEW uc_admission_ethnicity AS\n" + "\nUNION ALL\n".join(
+        f"SELECT id * {len(ETHNICITY_COLUMNS)} + {position} AS id, high_school_id, uc_campus_id, file_id, admission_type, "
+        "'" + label.replace("'", "''") + f"' AS ethnicity, {column} AS count, academic_year "
+        f"FROM uc_admission_ethnicity_counts WHERE {column} IS NOT NULL"
+        for position, (label, column) in enumerate(ETHNICITY_COLUMNS)
+    ))
+
+
+def recode(table, pairs):
+    cases = ' '.join(f"WHEN '{old}' THEN '{new}'" for old, new in pairs)
+    op.execute(f"UPDATE {table} SET admission_type = CASE admission_type {cases} END WHERE admission_type IS NOT NULL")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    known = ', '.join(f"'{name}'" for name in ADMISSION_TYPES)
+    for table in TABLES:
+        # A value without a code would silently become NULL below
+        unknown = bind.execute(sa.text(f"SELECT DISTINCT admission_type FROM {table} WHERE admission_type NOT IN ({known})")).scalars().all()
+        if unknown:
+            raise RuntimeError(f"{table} has admission types without a code: {unknown}")
+
+    op.execute("DROP VIEW uc_admission_ethnicity")
+    for table in TABLES:
+        recode(table, [(name, code) for code, name in enumerate(ADMISSION_TYPES)])
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('admission_type', existing_type=sa.String(), type_=sa.SmallInteger(),
+                                  postgresql_using='admission_type::smallint')
+            batch_op.alter_column('academic_year', existing_type=sa.Integer(), type_=sa.SmallInteger())
+    create_view()
+
+    admission_types = op.create_table(
+        'admission_types',
+        sa.Column('code', sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('code'),
+        sa.UniqueConstraint('name'),
+    )
+    op.bulk_insert(admission_types, [{'code': code, 'name': name} for code, name in enumerate(ADMISSION_TYPES)])
+
+
+def downgrade() -> None:
+    op.drop_table('admission_types')
+    op.execute("DROP VIEW uc_admission_ethnicity")
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('academic_year', existing_type=sa.SmallInteger(), type_=sa.Integer())
+            batch_op.alter_column('admission_type', existing_type=sa.SmallInteger(), type_=sa.String(),
+                                  postgresql_using='admission_type::text')
+        recode(table, [(code, name) for code, name in enumerate(ADMISSION_TYPES)])
+    create_view()
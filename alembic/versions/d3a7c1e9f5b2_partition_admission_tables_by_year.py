@@ -0,0 +1,98 @@
+"""Partition the admission tables by academic_year (Postgres only)
+
+Revision ID: d3a7c1e9f5b2
+Revises: b8e1f5c3a2d7
+Create Date: 2026-10-18 19:21:06.540193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a7c1e9f5b2'
+down_revision: Union[str, None] = 'b8e1f5c3a2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NATURAL_KEY = ['high_school_id', 'uc_campus_id', 'academic_year', 'admission_type']
+TABLES = ['uc_admission_gender', 'uc_admission_gpa', 'uc_admission_ethnicity_counts']
+FOREIGN_KEYS = [('high_school_id', 'high_schools'), ('uc_campus_id', 'uc_campuses'), ('file_id', 'files')]
+# Same as revision 9d4e2b7a1c60: the view is bound to the table it was created on, so it is rebuilt on the new one
+ETHNICITY_COLUMNS = [
+    ('All', 'all_ethnicities'),
+    ('African American', 'african_american'),
+    ('American Indian', 'american_indian'),
+    ('Hispanic/ Latinx', 'hispanic_latinx'),
+    ('Pacific Islander', 'pacific_islander'),
+    ('Asian', 'asian'),
+    ('White', 'white'),
+    ('Domestic Unknown', 'domestic_unknown'),
+    ("Int'l", 'international'),
+]
+
+
+def create_view():
+    op.execute("CREATE VIEW uc_admission_ethnicity AS\n" + "\nUNION ALL\n".join(
+        f"SELECT id * {len(ETHNICITY_COLUMNS)} + {position} AS id, high_school_id, uc_campus_id, file_id, admission_type, "
+        "'" + label.replace("'", "''") + f"' AS ethnicity, {column} AS count, academic_year "
+        f"FROM uc_admission_ethnicity_counts WHERE {column} IS NOT NULL"
+        for position, (label, column) in enumerate(ETHNICITY_COLUMNS)
+    ))
+
+
+def rebuild(table, years=None):
+    # Copies the table into a new one, LIST-partitioned by academic_year when years is given (one partition per
+    # year plus a default one), a plain table otherwise, then recreates the keys, indexes and foreign keys on it
+    sequence = op.get_bind().execute(sa.text(f"SELECT pg_get_serial_sequence('{table}', 'id')")).scalar()
+    new = f"{table}_rebuilt"
+    if years is None:
+        op.execute(f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"ALTER TABLE {new} ALTER COLUMN academic_year DROP NOT NULL")
+    else:
+        op.execute(f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY LIST (academic_year)")
+        # The partition key is part of the primary key
+        op.execute(f"ALTER TABLE {new} ALTER COLUMN academic_year SET NOT NULL")
+        for year in years:
+            op.execute(f"CREATE TABLE {table}_y{year} PARTITION OF {new} FOR VALUES IN ({year})")
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {new} DEFAULT")
+    op.execute(f"INSERT INTO {new} SELECT * FROM {table} ORDER BY id")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {new}.id")
+    op.drop_table(table)
+    op.rename_table(new, table)
+
+    op.create_primary_key(f'{table}_pkey', table, ['id'] if years is None else ['id', 'academic_year'])
+    op.create_unique_constraint(f'uq_{table}_natural_key', table, NATURAL_KEY)
+    op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+    op.create_index(op.f(f'ix_{table}_file_id'), table, ['file_id'], unique=False)
+    for column, referred in FOREIGN_KEYS:
+        op.create_foreign_key(f'{table}_{column}_fkey', table, referred, [column], ['id'])
+
+
+def upgrade() -> None:
+    # Other backends keep plain tables; sql_db/partitions.py falls back to them
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    bind = op.get_bind()
+    years = set()
+    for table in TABLES:
+        if bind.execute(sa.text(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE academic_year IS NULL)")).scalar():
+            raise RuntimeError(f"{table} has rows without an academic_year, which a year partition cannot hold")
+        years.update(bind.execute(sa.text(f"SELECT DISTINCT academic_year FROM {table}")).scalars())
+    years.update(year for year in bind.execute(sa.text("SELECT DISTINCT year FROM files")).scalars() if year is not None)
+
+    op.execute("DROP VIEW uc_admission_ethnicity")
+    for table in TABLES:
+        rebuild(table, sorted(years))
+    create_view()
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP VIEW uc_admission_ethnicity")
+    for table in TABLES:
+        rebuild(table)
+    create_view()
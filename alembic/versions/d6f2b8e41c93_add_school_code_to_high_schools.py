@@ -0,0 +1,70 @@
+"""Add school_code to high_schools
+
+Revision ID: d6f2b8e41c93
+Revises: a3e9d6b1f207
+Create Date: 2026-10-18 13:10:27.418305
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f2b8e41c93'
+down_revision: Union[str, None] = 'a3e9d6b1f207'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ADMISSION_TABLES = ['uc_admission_gender', 'uc_admission_ethnicity', 'uc_admission_gpa']
+
+# 'A B MILLER HIGH SCHOOL050944' -> ('A B MILLER HIGH SCHOOL50944', 50944), as sql_db.school_codes splits them
+SCHOOL_CODE_PATTERN = re.compile(r'^(.*?)(\d+)$')
+
+
+def split_school_code(uc_school_name):
+    match = SCHOOL_CODE_PATTERN.match(uc_school_name)
+    if match is None:
+        return uc_school_name, None
+    name, code = match.groups()
+    return name + code.lstrip('0'), int(code)
+
+
+def upgrade() -> None:
+    op.add_column('high_schools', sa.Column('school_code', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_high_schools_school_code'), 'high_schools', ['school_code'], unique=False)
+
+    # Loaders now look schools up by the normalized name, so existing names are normalized here, on every backend.
+    # Names that only differ in leading zeros are merged the way clean_high_school_table does it: the row already
+    # carrying the normalized name (else the oldest one) is kept and the admission rows of the others repointed to it
+    bind = op.get_bind()
+    groups = {}
+    for school_id, uc_school_name in bind.execute(sa.text(
+            "SELECT id, uc_school_name FROM high_schools WHERE uc_school_name IS NOT NULL ORDER BY id")):
+        normalized, code = split_school_code(uc_school_name)
+        groups.setdefault(normalized, []).append((uc_school_name != normalized, school_id, uc_school_name, code))
+    merges, updates = [], []
+    for normalized, schools in groups.items():
+        is_renamed, keep_id, _, code = min(schools)
+        merges += [{'school_id': school_id, 'keep_id': keep_id} for _, school_id, _, _ in schools if school_id != keep_id]
+        if is_renamed or code is not None:
+            updates.append({'school_id': keep_id, 'normalized': normalized, 'code': code})
+
+    if merges:
+        for table in ADMISSION_TABLES:
+            bind.execute(sa.text(f"UPDATE {table} SET high_school_id = :keep_id WHERE high_school_id = :school_id"), merges)
+        # Before the renames, which take over the merged rows' names under the unique index
+        bind.execute(sa.text("DELETE FROM high_schools WHERE id = :school_id"),
+                     [{'school_id': merge['school_id']} for merge in merges])
+    if updates:
+        bind.execute(sa.text("UPDATE high_schools SET uc_school_name = :normalized, school_code = :code WHERE id = :school_id"),
+                     updates)
+
+
+def downgrade() -> None:
+    # Merged schools stay merged
+    op.drop_index(op.f('ix_high_schools_school_code'), table_name='high_schools')
+    op.drop_column('high_schools', 'school_code')
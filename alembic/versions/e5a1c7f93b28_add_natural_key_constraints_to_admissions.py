@@ -0,0 +1,47 @@
+"""Add natural-key unique constraints to the uc_admission_* tables
+
+Revision ID: e5a1c7f93b28
+Revises: d6f2b8e41c93
+Create Date: 2026-10-18 13:48:05.602917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c7f93b28'
+down_revision: Union[str, None] = 'd6f2b8e41c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Leading high_school_id: the constraint's index also serves the per-school profile queries
+NATURAL_KEYS = {
+    'uc_admission_gender': ['high_school_id', 'uc_campus_id', 'academic_year', 'admission_type'],
+    'uc_admission_ethnicity': ['high_school_id', 'uc_campus_id', 'academic_year', 'admission_type', 'ethnicity'],
+    'uc_admission_gpa': ['high_school_id', 'uc_campus_id', 'academic_year', 'admission_type'],
+}
+
+
+def upgrade() -> None:
+    for table, columns in NATURAL_KEYS.items():
+        # Files re-loaded before the constraint existed left duplicates; the latest load wins
+        keys = ', '.join(columns)
+        op.execute(f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, MAX(id) OVER (PARTITION BY {keys}) AS keep_id FROM {table}
+                ) d WHERE id <> keep_id
+            )
+        """)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_unique_constraint(f'uq_{table}_natural_key', columns)
+
+
+def downgrade() -> None:
+    for table in NATURAL_KEYS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'uq_{table}_natural_key', type_='unique')
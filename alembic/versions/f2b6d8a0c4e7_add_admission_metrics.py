@@ -0,0 +1,42 @@
+"""Add admission_metrics table
+
+Revision ID: f2b6d8a0c4e7
+Revises: e5a1c7f93b28
+Create Date: 2026-10-18 14:22:36.190442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8a0c4e7'
+down_revision: Union[str, None] = 'e5a1c7f93b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `python -m sql_db.metrics` and refreshed after every ingestion run
+    op.create_table(
+        'admission_metrics',
+        sa.Column('high_school_id', sa.Integer(), nullable=False),
+        sa.Column('uc_campus_id', sa.Integer(), nullable=False),
+        sa.Column('academic_year', sa.Integer(), nullable=False),
+        sa.Column('applicants', sa.Integer(), nullable=True),
+        sa.Column('admits', sa.Integer(), nullable=True),
+        sa.Column('enrollees', sa.Integer(), nullable=True),
+        sa.Column('admit_rate', sa.Float(), nullable=True),
+        sa.Column('yield_rate', sa.Float(), nullable=True),
+        sa.Column('app_gpa', sa.Float(), nullable=True),
+        sa.Column('adm_gpa', sa.Float(), nullable=True),
+        sa.Column('enr_gpa', sa.Float(), nullable=True),
+        sa.Column('gpa_lift', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('high_school_id', 'uc_campus_id', 'academic_year'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('admission_metrics')
@@ -1,11 +1,15 @@
 from sql_db.database import SessionLocal
-from sql_db import crud, models
+from sql_db import crud, models, checkpoint, file_cache, search, admission_query, metrics, cube, ranking, profiles, jobs, trends, geo
+import csv
+import gzip
+import io
+import json
 import os
 import sys
 from sql_db.database import SessionLocal
 import logging
-from sql_db.process_csv_file import add_ethnicity_csv_file_to_db, add_gender_csv_file_to_db
 from sql_db.crud import get_files_as_dataframe
+from sql_db.scheduler import run_pending_files, DEFAULT_WRITERS
 
 def handle_files():
     welcome_message = "Welcome! We are now processing files to add them to the database."
@@ -63,23 +67,19 @@ def process_single_file(file_location, uc_campus, category, year, high_school_ty
         db = SessionLocal()
         logging.info(f"Processing file: {file_location}, {uc_campus}, {category}, {year}, {high_school_type}")
 
-        # Process the single file
-        if category.upper() == 'ETHNICITY':
-            success = add_ethnicity_csv_file_to_db(db, file_location, uc_campus, year, high_school_type)
-        elif category.upper() == 'GENDER':
-            success = add_gender_csv_file_to_db(db, file_location, uc_campus, year)
-        else:   
+        # Process the single file; records and the is_added_to_db flag are committed together
+        file = db.query(models.File).filter_by(location=file_location).first()
+        if file is None:
+            success = False
+            logging.error(f"Unknown file: {file_location}")
+        elif category.upper() in ('ETHNICITY', 'GENDER', 'GPA'):
+            result = checkpoint.ingest_file(db, file)
+            success = result['status'] in ('success', 'skipped')
+        else:
             # Handle other categories if needed
             success = False
             logging.error(f"Unsupported category: {category}")
 
-        if success:
-            # Update the file's is_added_to_db status
-            file = db.query(models.File).filter_by(location=file_location).first()
-            if file:
-                file.is_added_to_db = True
-                db.commit()
-
         response = {
             'input_parameters': {
                 'file_location': file_location,
@@ -100,11 +100,299 @@ def process_single_file(file_location, uc_campus, category, year, high_school_ty
     finally:
         db.close()
 
+def process_pending_files(workers=None, writers=DEFAULT_WRITERS, include_added=True):
+    # Parse new, changed and failed files in a process pool and write through a few connections
+    try:
+        return run_pending_files(workers, writers, include_added)
+    except Exception as e:
+        error_message = f'Error processing pending files: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+
+def enqueue_ingestion(file_ids=None):
+    # Queues the files (default: every file not added yet) for the job workers and returns the job id at once
+    try:
+        db = SessionLocal()
+        return {'job_id': jobs.enqueue_files(db, file_ids), 'status': models.JobStatus.QUEUED.value}
+    except Exception as e:
+        error_message = f'Error queueing ingestion: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def get_ingestion_job(job_id):
+    # Status plus rows parsed, rows written and throughput per file
+    try:
+        db = SessionLocal()
+        return jobs.get_job(db, job_id) or {'error': f'Job {job_id} not found'}
+    except Exception as e:
+        error_message = f'Error retrieving job {job_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def cancel_ingestion_job(job_id):
+    try:
+        db = SessionLocal()
+        status = jobs.cancel_job(db, job_id)
+        if status is None:
+            return {'error': f'Job {job_id} not found'}
+        return {'job_id': job_id, 'status': status.value}
+    except Exception as e:
+        error_message = f'Error cancelling job {job_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def stream_ingestion_job(job_id, interval=1.0):
+    # Server-sent events with the job status until it finishes
+    try:
+        return {'mimetype': 'text/event-stream', 'stream': jobs.stream_job(job_id, interval)}
+    except Exception as e:
+        error_message = f'Error streaming job {job_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+
+def search_schools(name, city=None, state=None, limit=search.DEFAULT_LIMIT):
+    # Ranked school matches by name with optional city/state filters
+    try:
+        db = SessionLocal()
+        matches = search.search_high_schools(db, name, city, state, limit)
+        return {'schools': [{
+            'id': school.id,
+            'school_name': school.school_name,
+            'city': school.city,
+            'state': school.state,
+            'country': school.country,
+            'score': score
+        } for school, score in matches]}
+    except Exception as e:
+        error_message = f'Error searching schools: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def query_admissions(query_type, parameters=None, after=None, limit=admission_query.DEFAULT_PAGE_SIZE):
+    # One page of admission rows filtered on campus, year, admission_type, ethnicity, school_ids, county, state
+    try:
+        db = SessionLocal()
+        return admission_query.fetch_page(db, query_type, parameters, after, limit)
+    except Exception as e:
+        error_message = f'Error querying {query_type}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def export_admissions(query_type, parameters=None, fmt='ndjson'):
+    # The full filtered result as a stream of NDJSON or CSV text chunks
+    try:
+        return {'mimetype': admission_query.FORMATS.get(fmt), 'stream': admission_query.stream(query_type, parameters, fmt)}
+    except Exception as e:
+        error_message = f'Error exporting {query_type}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+
+def _school_name_key(school_name, city, entry):
+    # name, or (name, city) when a city is given
+    if not isinstance(school_name, str) or not isinstance(city, (str, type(None))):
+        raise ValueError(f"school_name and city must be strings: {entry}")
+    return (school_name, city) if city else school_name
+
+def _parse_school_list(payload, content_type='application/json'):
+    # High school ids, names and (name, city) pairs from a JSON list or a CSV with an id or school_name[, city] column
+    if 'csv' in content_type:
+        entries = [{key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+                   for row in csv.DictReader(io.StringIO(payload))]
+    else:
+        entries = json.loads(payload)
+        if not isinstance(entries, list):
+            raise ValueError("Expected a JSON list of schools")
+    # Every entry is checked here: the response is streamed, so a bad one found later would cut it short
+    keys = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            school_id = entry.get('high_school_id') or entry.get('id')
+            if school_id not in (None, ''):
+                keys.append(int(school_id))
+            elif entry.get('school_name'):
+                keys.append(_school_name_key(entry['school_name'], entry.get('city'), entry))
+            else:
+                raise ValueError(f"Entry has neither an id nor a school_name: {entry}")
+        elif isinstance(entry, list):
+            if len(entry) not in (1, 2) or not entry[0]:
+                raise ValueError(f"List entries must be [school_name] or [school_name, city]: {entry}")
+            keys.append(_school_name_key(entry[0], entry[1] if len(entry) == 2 else None, entry))
+        elif isinstance(entry, str) and not entry.isdigit():
+            keys.append(entry)
+        else:
+            keys.append(int(entry))
+    return keys
+
+def _stream_high_school_data(keys, academic_year):
+    # One NDJSON line per requested school, in request order
+    with SessionLocal() as db:
+        for key, profile in crud.iter_high_school_data_many(db, keys, academic_year):
+            yield json.dumps({'request': list(key) if isinstance(key, tuple) else key, 'data': profile}, default=str) + '\n'
+
+def get_high_school_data_bulk(payload, content_type='application/json', academic_year=None):
+    # Profiles for a list of schools in one request, streamed back as NDJSON
+    try:
+        return {'mimetype': 'application/x-ndjson', 'stream': _stream_high_school_data(_parse_school_list(payload, content_type), academic_year)}
+    except Exception as e:
+        error_message = f'Error retrieving high school data in bulk: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+
+def get_high_school_profile(high_school_id, accept_encoding=''):
+    # The stored profile JSON as bytes; sent compressed when the client accepts gzip
+    try:
+        db = SessionLocal()
+        stored = profiles.get_profile_body(db, high_school_id)
+        if stored is None:
+            return {'error': f'High school {high_school_id} not found'}
+        body, _ = stored
+        if profiles.PROFILE_ENCODING in accept_encoding:
+            return {'mimetype': 'application/json', 'headers': {'Content-Encoding': profiles.PROFILE_ENCODING}, 'body': body}
+        return {'mimetype': 'application/json', 'headers': {}, 'body': gzip.decompress(body)}
+    except Exception as e:
+        error_message = f'Error retrieving profile for {high_school_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def get_school_metrics(high_school_id, uc_campus_id=None, academic_year=None):
+    # Admit rate, yield and GPA lift per campus and year, read from the admission_metrics table
+    try:
+        db = SessionLocal()
+        return {'high_school_id': high_school_id, 'metrics': metrics.get_admission_metrics(db, high_school_id, uc_campus_id, academic_year)}
+    except Exception as e:
+        error_message = f'Error retrieving metrics for {high_school_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def get_school_trends(high_school_id, uc_campus_id=None):
+    # Year-over-year deltas, CAGR and rolling admit rate per campus and across campuses, read from admission_trends
+    try:
+        db = SessionLocal()
+        return {'high_school_id': high_school_id, 'trends': trends.get_trends(db, high_school_id, uc_campus_id)}
+    except Exception as e:
+        error_message = f'Error retrieving trends for {high_school_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def get_campus_trends(uc_campus_id=trends.ALL):
+    # Same series summed over every school of a campus, or of the whole system
+    try:
+        db = SessionLocal()
+        return {'uc_campus_id': uc_campus_id, 'trends': trends.get_trends(db, trends.ALL, uc_campus_id)}
+    except Exception as e:
+        error_message = f'Error retrieving trends for campus {uc_campus_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def get_region_series(level, value, measure='total_applicants', admission_type='App', uc_campus_id=None):
+    # e.g. Orange County applicants to one campus by year, read from the geo_rollups table only
+    try:
+        db = SessionLocal()
+        return {'geo_level': level, 'geo_value': value, 'measure': measure, 'admission_type': admission_type,
+                'uc_campus_id': uc_campus_id, 'years': geo.region_series(db, level, value, measure, admission_type, uc_campus_id)}
+    except Exception as e:
+        error_message = f'Error retrieving {measure} for {level} {value}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def top_regions(level, measure='total_applicants', admission_type='App', uc_campus_id=None, academic_year=None, n=10):
+    try:
+        db = SessionLocal()
+        ranked = geo.top_regions(db, level, measure, admission_type, uc_campus_id, academic_year, n)
+        return {'regions': [{'geo_value': value, measure: total} for value, total in ranked]}
+    except Exception as e:
+        error_message = f'Error ranking {level} regions by {measure}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def compare_school(high_school_id, measure='total_applicants', admission_type='App'):
+    # campus x year table of one measure for one school, served from the in-memory cube
+    try:
+        db = SessionLocal()
+        campuses, years, values = cube.get_cube(db).pivot(high_school_id, measure, admission_type)
+        campus_names = crud.get_campus_names(db)
+        return {
+            'high_school_id': high_school_id,
+            'measure': measure,
+            'admission_type': admission_type,
+            'years': [int(year) for year in years],
+            # Masked (missing or suppressed) cells become None
+            'campuses': {campus_names.get(int(campus_id), int(campus_id)): row
+                         for campus_id, row in zip(campuses, cube.to_lists(values))},
+        }
+    except Exception as e:
+        error_message = f'Error comparing {high_school_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def top_schools(measure='total_applicants', n=10, admission_type='App', uc_campus_id=None, academic_year=None):
+    try:
+        db = SessionLocal()
+        ranked = cube.get_cube(db).top_schools(measure, n, admission_type, uc_campus_id, academic_year)
+        return {'schools': [{'high_school_id': school_id, measure: value} for school_id, value in ranked]}
+    except Exception as e:
+        error_message = f'Error ranking schools by {measure}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def top_feeder_schools(uc_campus_id, academic_year, admission_type='Enr', metric='total_applicants', n=50):
+    # e.g. top 50 feeder schools for a campus and year by enrolled count
+    try:
+        db = SessionLocal()
+        ranked = ranking.get_rankings(db).top(uc_campus_id, academic_year, admission_type, metric, n)
+        return {'schools': [{'rank': i + 1, 'high_school_id': school_id, metric: value} for i, (school_id, value) in enumerate(ranked)]}
+    except Exception as e:
+        error_message = f'Error ranking schools: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
+def school_rank(high_school_id, uc_campus_id, academic_year, admission_type='Adm', metric='mean_gpa'):
+    # Rank and percentile of one school among the schools with a value for the same campus, year and type
+    try:
+        db = SessionLocal()
+        return {'high_school_id': high_school_id, 'metric': metric,
+                'ranking': ranking.get_rankings(db).rank(high_school_id, uc_campus_id, academic_year, admission_type, metric)}
+    except Exception as e:
+        error_message = f'Error ranking {high_school_id}: {str(e)}'
+        logging.error(error_message)
+        return {'error': error_message}
+    finally:
+        db.close()
+
 def get_files_dataframe():
-    print('hello world')
     try:
         db = SessionLocal()
         df = get_files_as_dataframe(db)
+        # Whether the parsed file is already in the local Parquet cache
+        df['is_cached'] = df['location'].map(file_cache.is_cached)
         # return df.to_dict(orient='records')  # Convert DataFrame to list of dictionaries for JSON serialization
         return df
     except Exception as e:
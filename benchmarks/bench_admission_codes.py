@@ -0,0 +1,96 @@
+"""admission_type stored as a string and academic_year as integer vs smallint codes for both.
+
+Usage:
+    python benchmarks/bench_admission_codes.py [--url ...] [--year 2023] [--lookups 200]
+
+Loads the bundled files for one year (if the database is empty) and copies
+uc_admission_gender into two scratch tables with its natural-key index: one
+with the old String/Integer columns, one with the CodedString/SmallInteger
+columns of the models. Prints the size of both (table + indexes) and p50
+latency of a filtered count, a group by admission_type and the per-school
+lookup, checking both give the same answer.
+"""
+import argparse
+import random
+
+from common import Timer, percentile, setup_database
+from bench_school_lookup import ensure_data
+from bench_ethnicity_layout import table_bytes, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sqlalchemy import Column, Index, Integer, MetaData, String, Table, func, select
+    from sql_db import models
+    ensure_data(SessionLocal, args.year)
+    G = models.UCAdmissionGender.__table__
+
+    def scratch(name, legacy):
+        columns = []
+        for column in G.columns:
+            column_type = column.type
+            if legacy and column.name == 'admission_type':
+                column_type = String()
+            elif legacy and column.name == 'academic_year':
+                column_type = Integer()
+            columns.append(Column(column.name, column_type, primary_key=column.primary_key))
+        table = Table(name, MetaData(), *columns)
+        Index(f'uq_{name}_natural_key', *[table.c[key] for key in models.UCAdmissionGender.natural_key], unique=True)
+        Index(f'ix_{name}_file_id', table.c.file_id)
+        return table
+
+    tables = {'string': scratch('bench_admission_strings', True), 'code': scratch('bench_admission_codes', False)}
+    with SessionLocal() as db:
+        rows = [dict(row._mapping) for row in db.execute(select(G).order_by(G.c.id))]
+    for table in tables.values():
+        table.drop(engine, checkfirst=True)
+        table.create(engine)
+        with engine.begin() as connection:
+            connection.execute(table.insert(), rows)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        sizes = {name: table_bytes(connection, table.name) for name, table in tables.items()}
+
+    print(f"{engine.dialect.name}: {len(rows):,} uc_admission_gender rows")
+    for name, size in sizes.items():
+        print(f"  {name:<8} {size / 2 ** 20:10.2f} MiB (table + indexes)")
+    print(f"  codes are {100 * (1 - sizes['code'] / sizes['string']):.0f}% smaller")
+
+    years = sorted({row['academic_year'] for row in rows})
+    school_ids = sorted({row['high_school_id'] for row in rows})
+    sample = random.Random(0).choices(school_ids, k=args.lookups)
+    with SessionLocal() as db:
+        def filtered_count(table):
+            return lambda i: db.execute(select(func.count()).where(
+                table.c.admission_type == 'Enr', table.c.academic_year == years[i % len(years)], table.c.total_applicants > 10)).scalar()
+
+        def grouped(table):
+            return lambda _: sorted(db.execute(select(table.c.admission_type, func.sum(table.c.total_applicants)).group_by(
+                table.c.admission_type)).all())
+
+        def lookup(table):
+            return lambda i: sorted(db.execute(select(table.c.uc_campus_id, table.c.academic_year, table.c.admission_type,
+                                                      table.c.total_applicants).where(table.c.high_school_id == sample[i])).all())
+
+        for name, query, repeat in [
+            ('filtered count', filtered_count, 50),
+            ('group by type', grouped, 20),
+            ('one school', lookup, args.lookups),
+        ]:
+            string_ms, string_result = timed(query(tables['string']), repeat)
+            code_ms, code_result = timed(query(tables['code']), repeat)
+            assert string_result == code_result, name
+            print(f"  {name:<16} string p50 {string_ms:9.3f} ms   code p50 {code_ms:9.3f} ms   {string_ms / code_ms:6.2f}x")
+
+    for table in tables.values():
+        table.drop(engine)
+
+
+if __name__ == '__main__':
+    main()
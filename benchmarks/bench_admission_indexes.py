@@ -0,0 +1,146 @@
+"""Per-school profile query on the uc_admission_* tables before and after the natural-key indexes.
+
+Usage:
+    python benchmarks/bench_admission_indexes.py [--url postgresql://...] [--schools 5000] [--lookups 20]
+
+Fills the three admission tables with synthetic rows (schools x 9 campuses x
+years x 3 admission types; one count column per ethnicity) without
+any index besides the primary key, prints the EXPLAIN plan and latency of the
+get_high_school_data query, then builds the natural-key unique indexes and
+measures again, followed by an upsert re-load of one synthetic file.
+
+The tables are dropped and recreated, so point --url at a scratch database.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from common import Timer, percentile, setup_database
+
+CAMPUSES = 9
+ADMISSION_TYPES = ['App', 'Adm', 'Enr']
+INSERT_CHUNK_ROWS = 50000
+
+
+def bare_table(table):
+    # Same columns, no foreign keys, indexes or constraints: the schema before the migration
+    from sqlalchemy import Column, MetaData, Table
+    return Table(table.name, MetaData(), *[Column(c.name, c.type, primary_key=c.primary_key) for c in table.columns])
+
+
+def synthetic_rows(model, schools, years, rng):
+    # One "file" per campus and year, so a school's rows are spread over the whole table
+    from sql_db.transform import ETHNICITY_COLUMNS
+    for campus_id in range(1, CAMPUSES + 1):
+        for year in years:
+            for high_school_id in range(1, schools + 1):
+                for admission_type in ADMISSION_TYPES:
+                    row = {'high_school_id': high_school_id, 'uc_campus_id': campus_id,
+                           'academic_year': year, 'admission_type': admission_type}
+                    if model.__tablename__ == 'uc_admission_gender':
+                        total = rng.randint(0, 400)
+                        yield dict(row, total_applicants=total, female_applicants=total // 2, male_applicants=total - total // 2,
+                                   other_applicants=0, unknown_gender=0)
+                    elif model.__tablename__ == 'uc_admission_gpa':
+                        yield dict(row, mean_gpa=round(rng.uniform(2.5, 4.2), 2))
+                    else:
+                        yield dict(row, **{column: rng.randint(0, 100) for _, column in ETHNICITY_COLUMNS})
+
+
+def fill(engine, table, rows):
+    count, chunk = 0, []
+    with engine.begin() as connection:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= INSERT_CHUNK_ROWS:
+                connection.execute(table.insert(), chunk)
+                count, chunk = count + len(chunk), []
+        if chunk:
+            connection.execute(table.insert(), chunk)
+            count += len(chunk)
+    return count
+
+
+def explain(engine, statement):
+    sql = str(statement.compile(engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN'
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"{prefix} {sql}").fetchall()
+    # SQLite returns (id, parent, notused, detail); Postgres one text column per line
+    return [row[-1] for row in rows]
+
+
+def measure(engine, SessionLocal, label, sample):
+    from sql_db import crud
+    print(f"\n{label}")
+    for line in explain(engine, crud._high_school_data_query([sample[0]])):
+        print(f"    {line}")
+    samples = []
+    with SessionLocal() as db:
+        for high_school_id in sample:
+            with Timer() as timer:
+                db.execute(crud._high_school_data_query([high_school_id])).fetchall()
+            samples.append(timer.seconds * 1000)
+    print(f"  profile query   p50 {percentile(samples, 50):10.3f} ms   p99 {percentile(samples, 99):10.3f} ms")
+    return percentile(samples, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help="scratch database (default: a temporary SQLite file)")
+    parser.add_argument('--schools', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=20)
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'uc_admission_index_bench.db')
+    engine, SessionLocal = setup_database(url)
+    from sqlalchemy import Index, text
+    from sql_db import bulk_load, models
+
+    admission_models = [models.UCAdmissionGender, models.UCAdmissionEthnicityCounts, models.UCAdmissionGPA]
+    years = list(range(2023 - args.years + 1, 2024))
+    rng = random.Random(0)
+    bare = {}
+    for model in admission_models:
+        model.__table__.drop(engine, checkfirst=True)
+        bare[model] = bare_table(model.__table__)
+        bare[model].create(engine)
+        with Timer() as timer:
+            count = fill(engine, bare[model], synthetic_rows(model, args.schools, years, rng))
+        print(f"{model.__tablename__:<30} {count:>12,} rows loaded in {timer.seconds:7.1f} s")
+    with engine.begin() as connection:
+        # The profile query reads ethnicities through the long-format view
+        connection.execute(text(models.ethnicity_view_sql()))
+        connection.execute(text("ANALYZE"))
+
+    sample = random.Random(1).choices(range(1, args.schools + 1), k=args.lookups)
+    before = measure(engine, SessionLocal, f"{engine.dialect.name}, primary keys only", sample)
+
+    with Timer() as timer:
+        for model in admission_models:
+            Index(f'uq_{model.__tablename__}_natural_key', *[bare[model].c[col] for col in model.natural_key], unique=True).create(engine)
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+    print(f"\nnatural-key indexes built in {timer.seconds:.1f} s")
+    after = measure(engine, SessionLocal, f"{engine.dialect.name}, natural-key indexes", sample)
+    print(f"  speedup {before / after:.0f}x")
+
+    # Re-loading one file (one campus and year of gender rows) now replaces rows in place
+    reload_rows = [row for row in synthetic_rows(models.UCAdmissionGender, args.schools, years[-1:], rng) if row['uc_campus_id'] == 1]
+    with SessionLocal() as db:
+        with Timer() as timer:
+            bulk_load.write_records(db, models.UCAdmissionGender, reload_rows, conflict_columns=models.UCAdmissionGender.natural_key)
+            db.commit()
+        total = db.query(models.UCAdmissionGender).count()
+    print(f"\nupsert re-load of {len(reload_rows):,} gender rows in {timer.seconds:.2f} s, table still {total:,} rows")
+
+    # Leave the scratch database with the real schema
+    for model in admission_models:
+        model.__table__.drop(engine)
+        model.__table__.create(engine)
+
+
+if __name__ == '__main__':
+    main()
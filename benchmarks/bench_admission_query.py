@@ -0,0 +1,67 @@
+"""Peak memory and time of exporting a full admission table: old query_database vs the streaming query API.
+
+Usage:
+    python benchmarks/bench_admission_query.py [--url ...] [--rows 500000]
+
+Tops uc_admission_gender up to --rows synthetic rows, then measures
+query(...).all() (the old query_database) against admission_query.stream as
+NDJSON and CSV. Peak memory is the tracemalloc peak of the Python heap.
+"""
+import argparse
+import tracemalloc
+
+from common import Timer, setup_database
+
+
+def ensure_rows(SessionLocal, rows):
+    from sql_db import bulk_load, models
+    with SessionLocal() as db:
+        existing = db.query(models.UCAdmissionGender).count()
+        if existing >= rows:
+            return
+        school = models.HighSchool(uc_school_name=f'QUERY BENCHMARK SCHOOL{existing:09d}', school_name='QUERY BENCHMARK SCHOOL')
+        db.add(school)
+        db.commit()
+        # The natural key only needs to be unique, so the synthetic rows count up academic_year
+        bulk_load.write_records(db, models.UCAdmissionGender, ({
+            'high_school_id': school.id, 'uc_campus_id': 1, 'admission_type': 'App', 'academic_year': i,
+            'total_applicants': i % 300, 'female_applicants': i % 150, 'male_applicants': i % 150,
+            'other_applicants': 0, 'unknown_gender': 0,
+        } for i in range(rows - existing)), conflict_columns=models.UCAdmissionGender.natural_key)
+        db.commit()
+
+
+def measure(name, run):
+    tracemalloc.start()
+    with Timer() as timer:
+        size = run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<24} {timer.seconds:8.2f} s   peak {peak / 2 ** 20:9.1f} MiB   {size:>14,} {'rows' if name.startswith('old') else 'bytes'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--rows', type=int, default=500000)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import admission_query, models
+    ensure_rows(SessionLocal, args.rows)
+
+    def old_all():
+        with SessionLocal() as db:
+            return len(db.query(models.UCAdmissionGender).all())
+
+    def streamed(fmt):
+        return lambda: sum(len(chunk) for chunk in admission_query.stream('gender', {}, fmt))
+
+    print(f"{engine.dialect.name}: uc_admission_gender, {args.rows:,}+ rows")
+    measure('old query_database', old_all)
+    measure('stream ndjson', streamed('ndjson'))
+    measure('stream csv', streamed('csv'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Throughput (rows/sec) of the uc_admission_* bulk loader backends.
+
+Usage:
+    python benchmarks/bench_bulk_load.py [--url postgresql://...] [--rows 200000]
+
+Without --url (or DATABASE_URL) a temporary SQLite database is used, where
+only the executemany backends apply. On Postgres the COPY backends and the
+old bulk_insert_mappings path are measured as well. The upsert backends are
+timed twice: on an empty table and re-loading the same rows.
+"""
+import argparse
+import random
+
+from common import Timer, setup_database
+
+
+# Distinct natural keys per school: 3 admission types x 9 campuses x 5 years
+KEYS_PER_SCHOOL = 3 * 9 * 5
+
+
+def synthetic_ethnicity_records(count, high_school_ids):
+    # Compact rows: one count column per ethnicity
+    from sql_db.transform import ETHNICITY_COLUMNS
+    admission_types = ['App', 'Adm', 'Enr']
+    rng = random.Random(0)
+    return [dict({
+        'high_school_id': high_school_ids[i // KEYS_PER_SCHOOL],
+        'uc_campus_id': 1 + i // 3 % 9,
+        'admission_type': admission_types[i % 3],
+        'academic_year': 2019 + i // 27 % 5,
+    }, **{column: rng.randint(0, 500) for _, column in ETHNICITY_COLUMNS}) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--buffer-rows', type=int, default=None)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import bulk_load, models
+
+    with SessionLocal() as db:
+        schools = [models.HighSchool(uc_school_name=f'BENCHMARK HIGH SCHOOL{i:06d}', school_name='BENCHMARK HIGH SCHOOL')
+                   for i in range(args.rows // KEYS_PER_SCHOOL + 1)]
+        db.add_all(schools)
+        db.commit()
+        high_school_ids = [school.id for school in schools]
+
+    records = synthetic_ethnicity_records(args.rows, high_school_ids)
+    buffer_rows = args.buffer_rows or bulk_load.DEFAULT_BUFFER_ROWS
+    natural_key = models.UCAdmissionEthnicityCounts.natural_key
+
+    candidates = [('executemany', bulk_load.ExecuteManyBackend, None)]
+    if engine.dialect.name == 'postgresql':
+        candidates.insert(0, ('copy', bulk_load.CopyBackend, None))
+        candidates.append(('bulk_insert_mappings', None, None))
+        candidates.append(('copy+upsert', bulk_load.CopyBackend, natural_key))
+    candidates.append(('executemany+upsert', bulk_load.ExecuteManyBackend, natural_key))
+
+    def load(db, backend, conflict_columns):
+        if backend is None:
+            db.bulk_insert_mappings(models.UCAdmissionEthnicityCounts, records)
+        else:
+            bulk_load.write_records(db, models.UCAdmissionEthnicityCounts, records, buffer_rows, backend, conflict_columns)
+        db.commit()
+
+    print(f"{engine.dialect.name}: {args.rows} uc_admission_ethnicity_counts rows, buffer {buffer_rows}")
+    for name, backend, conflict_columns in candidates:
+        with SessionLocal() as db:
+            with Timer() as timer:
+                load(db, backend, conflict_columns)
+            print(f"  {name:<28} {timer.seconds:8.2f} s {args.rows / timer.seconds:12,.0f} rows/s")
+            if conflict_columns:
+                # Re-loading the same rows: every one of them hits ON CONFLICT DO UPDATE
+                with Timer() as timer:
+                    load(db, backend, conflict_columns)
+                print(f"  {name + ' (reload)':<28} {timer.seconds:8.2f} s {args.rows / timer.seconds:12,.0f} rows/s")
+                assert db.query(models.UCAdmissionEthnicityCounts).filter(
+                    models.UCAdmissionEthnicityCounts.high_school_id.in_(high_school_ids)).count() == args.rows
+            db.query(models.UCAdmissionEthnicityCounts).filter(
+                models.UCAdmissionEthnicityCounts.high_school_id.in_(high_school_ids)).delete(synchronize_session=False)
+            db.commit()
+
+    with SessionLocal() as db:
+        db.query(models.HighSchool).filter(models.HighSchool.id.in_(high_school_ids)).delete(synchronize_session=False)
+        db.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""The in-memory NumPy analytics cube vs the equivalent SQL queries.
+
+Usage:
+    python benchmarks/bench_cube.py [--url ...] [--year 2023] [--lookups 200]
+
+Loads the bundled files for one year (if the database is empty), builds the
+cube once and compares p50 latency of a campus x year pivot for one school,
+a top-10 ranking and the sum over ethnicities, checking both give the same answer.
+"""
+import argparse
+import random
+
+from common import Timer, percentile, setup_database
+from bench_school_lookup import ensure_data
+
+
+def timed(run, repeat):
+    samples, result = [], None
+    for i in range(repeat):
+        with Timer() as timer:
+            result = run(i)
+        samples.append(timer.seconds * 1000)
+    return percentile(samples, 50), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sqlalchemy import func
+    from sql_db import cube, models
+    ensure_data(SessionLocal, args.year)
+    G, E = models.UCAdmissionGender, models.UCAdmissionEthnicity
+
+    with SessionLocal() as db:
+        with Timer() as timer:
+            admission_cube = cube.AdmissionCube.load(db)
+        print(f"{engine.dialect.name}: cube loaded in {timer.seconds:.2f} s, {admission_cube.nbytes / 2 ** 20:.1f} MiB")
+        sample = random.Random(0).choices([int(school_id) for school_id in admission_cube.gender.schools], k=args.lookups)
+
+        def sql_pivot(i):
+            rows = db.query(G.uc_campus_id, G.academic_year, G.total_applicants).filter(
+                G.high_school_id == sample[i], G.admission_type == 'App').all()
+            return {(campus_id, year): total for campus_id, year, total in rows}
+
+        def cube_pivot(i):
+            campuses, years, values = admission_cube.pivot(sample[i], 'total_applicants', 'App')
+            return {(int(c), int(y)): values[ci, yi] for ci, c in enumerate(campuses) for yi, y in enumerate(years)
+                    if not values.mask[ci, yi]}
+
+        def sql_top(_):
+            total = func.sum(G.total_applicants)
+            return db.query(G.high_school_id, total).filter(G.admission_type == 'App').group_by(G.high_school_id).order_by(
+                total.desc(), G.high_school_id).limit(10).all()
+
+        def cube_top(_):
+            return admission_cube.top_schools('total_applicants', 10, 'App')
+
+        def sql_ethnicity_sum(_):
+            return db.query(func.sum(E.count)).filter(E.ethnicity != 'All').scalar()
+
+        def cube_ethnicity_sum(_):
+            return int(admission_cube.ethnicity_sum().sum())
+
+        for name, sql_run, cube_run, repeat in [
+            ('campus x year pivot', sql_pivot, cube_pivot, args.lookups),
+            ('top 10 schools', sql_top, cube_top, 20),
+            ('sum over ethnicities', sql_ethnicity_sum, cube_ethnicity_sum, 20),
+        ]:
+            sql_ms, sql_result = timed(sql_run, repeat)
+            cube_ms, cube_result = timed(cube_run, repeat)
+            if name == 'top 10 schools':
+                sql_result = [(school_id, int(total)) for school_id, total in sql_result]
+            assert sql_result == cube_result, f"{name}: {sql_result} != {cube_result}"
+            print(f"  {name:<24} sql p50 {sql_ms:9.3f} ms   cube p50 {cube_ms:9.3f} ms   {sql_ms / cube_ms:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""File discovery: the old per-file add_files_to_db vs set-difference registration and the polling watcher.
+
+Usage:
+    python benchmarks/bench_discovery.py [--url ...] [--files 5000]
+
+Creates a temporary tree of empty, realistically named CSV files, registers
+it with the old loop (one campus SELECT and one existence SELECT per file)
+and with discovery.add_new_files, then times a rescan with nothing new and a
+watcher poll after one file is dropped in.
+"""
+import argparse
+import os
+import re
+import tempfile
+
+from common import Timer, setup_database
+
+CAMPUSES = ['Berkeley', 'LA', 'Davis', 'Irvine', 'UCSB', 'UCSC', 'Riverside', 'Merced', 'UCSD']
+KINDS = ['Gdr', 'GPA', 'Eth CA Public', 'Eth CA Private', 'Eth non-CA', 'Eth Foreign']
+
+
+def legacy_add_files_to_db(db, files_directory):
+    # The pre-discovery loop, minus its per-file logging
+    from sql_db import crud, models
+    for root, _, files in os.walk(files_directory):
+        for file in files:
+            location = os.path.abspath(os.path.join(root, file))
+            category = None
+            if 'Eth' in file:
+                category = models.Category.ETHNICITY
+            elif 'GPA' in file:
+                category = models.Category.GPA
+            elif 'Gdr' in file:
+                category = models.Category.GENDER
+            year = re.search(r'\d{4}(?=\.csv$)', file)
+            year = int(year.group()) if year else None
+            if 'CA Public' in file:
+                high_school_type = models.HighSchoolType.CA_PUBLIC
+            elif 'CA Private' in file:
+                high_school_type = models.HighSchoolType.CA_PRIVATE
+            elif 'Foreign' in file:
+                high_school_type = models.HighSchoolType.FOREIGN
+            elif 'non-CA' in file:
+                high_school_type = models.HighSchoolType.NON_CA
+            else:
+                high_school_type = models.HighSchoolType.ALL
+            uc_campus_name = next((name for token, name in [('Berkeley', 'Berkeley'), ('LA', 'Los Angeles'), ('Davis', 'Davis'),
+                                                            ('Irvine', 'Irvine'), ('UCSB', 'Santa Barbara'), ('UCSC', 'Santa Cruz'),
+                                                            ('Riverside', 'Riverside'), ('Merced', 'Merced'), ('UCSD', 'San Diego')]
+                                   if token in file), None)
+            uc_campus = crud.get_uc_campus_by_name(db, uc_campus_name) if uc_campus_name else None
+            if not db.query(models.File).filter_by(location=location).first():
+                db.add(models.File(location=location, high_school_type=high_school_type,
+                                   uc_campus_id=uc_campus.id if uc_campus else None, category=category, year=year))
+    db.commit()
+
+
+def make_tree(directory, count):
+    # One subdirectory per year, like an archive of yearly exports
+    for i in range(count):
+        year = 1990 + i // (len(CAMPUSES) * len(KINDS) * 4)
+        subdirectory = os.path.join(directory, str(year))
+        os.makedirs(subdirectory, exist_ok=True)
+        name = f"FR ENR {KINDS[i % len(KINDS)]} {CAMPUSES[i // len(KINDS) % len(CAMPUSES)]} copy{i} {year}.csv"
+        open(os.path.join(subdirectory, name), 'w').close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--files', type=int, default=5000)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import discovery, models
+
+    with tempfile.TemporaryDirectory() as directory, SessionLocal() as db:
+        make_tree(directory, args.files)
+
+        def clear():
+            db.query(models.File).filter(models.File.location.like(f"{directory}%")).delete(synchronize_session=False)
+            db.commit()
+
+        print(f"{engine.dialect.name}: {args.files} files")
+        clear()
+        with Timer() as timer:
+            legacy_add_files_to_db(db, directory)
+        print(f"  {'old add_files_to_db':<28} {timer.seconds:8.3f} s")
+        legacy_rows = sorted((f.location, f.category, f.high_school_type, f.uc_campus_id, f.year)
+                             for f in db.query(models.File).filter(models.File.location.like(f"{directory}%")))
+        clear()
+        with Timer() as timer:
+            discovery.add_new_files(db, directory)
+        print(f"  {'add_new_files':<28} {timer.seconds:8.3f} s")
+        new_rows = sorted((f.location, f.category, f.high_school_type, f.uc_campus_id, f.year)
+                          for f in db.query(models.File).filter(models.File.location.like(f"{directory}%")))
+        assert legacy_rows == new_rows
+
+        with Timer() as timer:
+            discovery.add_new_files(db, directory)
+        print(f"  {'add_new_files, nothing new':<28} {timer.seconds:8.3f} s")
+
+        watcher = discovery.DirectoryWatcher(directory)
+        watcher.changed_files()
+        dropped = os.path.join(directory, '2023', 'FR ENR Gdr Davis dropped 2023.csv')
+        os.makedirs(os.path.dirname(dropped), exist_ok=True)
+        open(dropped, 'w').close()
+        with Timer() as timer:
+            registered = discovery.register_files(db, watcher.changed_files())
+        print(f"  {'watcher poll, 1 new file':<28} {timer.seconds:8.3f} s")
+        assert registered == [os.path.abspath(dropped)]
+        with Timer() as timer:
+            watcher.changed_files()
+        print(f"  {'watcher poll, idle':<28} {timer.seconds:8.3f} s")
+        clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Ethnicity counts stored long (one row per ethnicity) vs compact (one count column per ethnicity).
+
+Usage:
+    python benchmarks/bench_ethnicity_layout.py [--url ...] [--year 2023] [--lookups 200]
+
+Loads the bundled files for one year (if the database is empty), copies the
+uc_admission_ethnicity view into a scratch table with the old long layout and
+its natural-key index, then compares the on-disk size of both layouts, a full
+scan summing every ethnicity and the per-school lookup, checking both give the
+same answer. The lookup is also timed through the compatibility view.
+"""
+import argparse
+import random
+
+from common import Timer, percentile, setup_database
+from bench_school_lookup import ensure_data
+
+LONG_TABLE = 'bench_ethnicity_long'
+
+
+def timed(run, repeat):
+    samples, result = [], None
+    for i in range(repeat):
+        with Timer() as timer:
+            result = run(i)
+        samples.append(timer.seconds * 1000)
+    return percentile(samples, 50), result
+
+
+def table_bytes(connection, table):
+    # Table plus its indexes
+    if connection.dialect.name == 'postgresql':
+        return connection.exec_driver_sql(f"SELECT pg_total_relation_size('{table}')").scalar()
+    # Needs SQLite built with SQLITE_ENABLE_DBSTAT_VTAB (the default for the Python wheels)
+    return connection.exec_driver_sql(
+        "SELECT SUM(pgsize) FROM dbstat JOIN sqlite_master ON dbstat.name = sqlite_master.name "
+        f"WHERE sqlite_master.tbl_name = '{table}'").scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sqlalchemy import Column, Index, MetaData, Table, func, select
+    from sql_db import models
+    from sql_db.transform import ETHNICITY_COLUMNS
+    ensure_data(SessionLocal, args.year)
+    C, V = models.UCAdmissionEthnicityCounts, models.UCAdmissionEthnicity
+
+    long_table = Table(
+        LONG_TABLE, MetaData(),
+        *[Column(column.name, column.type, primary_key=column.primary_key) for column in V.__table__.columns],
+    )
+    Index(f'uq_{LONG_TABLE}_natural_key', *[long_table.c[name] for name in V.natural_key], unique=True)
+    Index(f'ix_{LONG_TABLE}_file_id', long_table.c.file_id)
+    long_table.drop(engine, checkfirst=True)
+    long_table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(long_table.insert().from_select([c.name for c in V.__table__.columns],
+                                                           select(*V.__table__.columns).order_by(V.id)))
+        connection.exec_driver_sql("ANALYZE")
+        sizes = {name: (connection.execute(select(func.count()).select_from(table)).scalar(), table_bytes(connection, table.name))
+                 for name, table in [('long', long_table), ('compact', C.__table__)]}
+
+    print(f"{engine.dialect.name}: uc_admission_ethnicity, long vs compact layout")
+    for name, (rows, size) in sizes.items():
+        print(f"  {name:<10} {rows:>10,} rows {size / 2 ** 20:10.2f} MiB (table + indexes)")
+    print(f"  compact is {sizes['long'][1] / sizes['compact'][1]:.1f}x smaller")
+
+    L = long_table.c
+    with SessionLocal() as db:
+        school_ids = db.execute(select(C.high_school_id).distinct()).scalars().all()
+        sample = random.Random(0).choices(school_ids, k=args.lookups)
+
+        def long_scan(_):
+            return dict(db.execute(select(L.ethnicity, func.sum(L.count)).group_by(L.ethnicity)).all())
+
+        def compact_scan(_):
+            totals = db.execute(select(*[func.sum(getattr(C, column)) for _, column in ETHNICITY_COLUMNS])).one()
+            return {label: total for (label, _), total in zip(ETHNICITY_COLUMNS, totals) if total is not None}
+
+        def long_lookup(i):
+            return sorted(db.execute(select(L.uc_campus_id, L.academic_year, L.admission_type, L.ethnicity, L.count).where(
+                L.high_school_id == sample[i])).all())
+
+        def compact_lookup(i):
+            rows = db.execute(select(C.uc_campus_id, C.academic_year, C.admission_type,
+                                     *[getattr(C, column) for _, column in ETHNICITY_COLUMNS]).where(C.high_school_id == sample[i])).all()
+            return sorted((*row[:3], label, row[3 + position]) for row in rows
+                          for position, (label, _) in enumerate(ETHNICITY_COLUMNS) if row[3 + position] is not None)
+
+        def view_lookup(i):
+            return sorted(db.execute(select(V.uc_campus_id, V.academic_year, V.admission_type, V.ethnicity, V.count).where(
+                V.high_school_id == sample[i])).all())
+
+        for name, long_run, compact_run, repeat in [
+            ('sum by ethnicity', long_scan, compact_scan, 20),
+            ('one school', long_lookup, compact_lookup, args.lookups),
+            ('one school, view', long_lookup, view_lookup, args.lookups),
+        ]:
+            long_ms, long_result = timed(long_run, repeat)
+            compact_ms, compact_result = timed(compact_run, repeat)
+            assert long_result == compact_result, name
+            print(f"  {name:<18} long p50 {long_ms:9.3f} ms   compact p50 {compact_ms:9.3f} ms   {long_ms / compact_ms:6.1f}x")
+
+    long_table.drop(engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Cold versus warm reads of the Parquet file cache.
+
+Usage:
+    python benchmarks/bench_file_cache.py [--pattern Gdr] [--limit N]
+
+Cold: decode the UTF-16 CSV and write it to an empty cache directory.
+Warm: memory-map the same files back from the cache.
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+from common import FILES_DIRECTORY, Timer
+from sql_db import file_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', default=FILES_DIRECTORY)
+    parser.add_argument('--pattern', default='')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(os.path.join(args.directory, '*.csv')) if args.pattern in os.path.basename(p))[:args.limit]
+    cache_directory = tempfile.mkdtemp(prefix='uc_file_cache_')
+    try:
+        cold = warm = 0.0
+        for path in paths:
+            with Timer() as timer:
+                expected = file_cache.read_cached(path, cache_directory)
+            cold += timer.seconds
+            with Timer() as timer:
+                actual = file_cache.read_cached(path, cache_directory)
+            warm += timer.seconds
+            if not actual.equals(expected):
+                raise AssertionError(f"Cached frame differs from the CSV for {path}")
+
+        csv_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+        cache_mb = sum(os.path.getsize(p) for p in glob.glob(os.path.join(cache_directory, 'data', '*'))) / 1e6
+        print(f"{len(paths)} files, {csv_mb:.1f} MB of CSV -> {cache_mb:.1f} MB of Parquet")
+        print(f"  cold (decode + write cache) {cold:8.2f} s")
+        print(f"  warm (memory-mapped read)   {warm:8.2f} s   {cold / max(warm, 1e-9):.1f}x faster")
+    finally:
+        shutil.rmtree(cache_directory)
+
+
+if __name__ == '__main__':
+    main()
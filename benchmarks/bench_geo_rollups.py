@@ -0,0 +1,91 @@
+"""Regional questions answered with an ad-hoc GROUP BY over the admission tables vs read from geo_rollups.
+
+Usage:
+    python benchmarks/bench_geo_rollups.py [--url ...] [--year 2023] [--lookups 200]
+
+Loads the bundled files for one year (if the database is empty), times a full
+rebuild of geo_rollups and the refresh of one (campus, year) partition, then
+reports p50/p99 latency of two questions, each for a gender and an ethnicity
+measure, checking both paths give the same answer:
+a region's counts by year at one campus ("Orange County applicants to UCSD by
+year"), and the top 10 regions of a level at one campus and year.
+"""
+import argparse
+import random
+
+from common import Timer, setup_database
+from bench_school_lookup import ensure_data, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sqlalchemy import desc, func, select
+    from sql_db import geo, models
+    ensure_data(SessionLocal, args.year)
+    G, E, H, R = models.UCAdmissionGender, models.UCAdmissionEthnicityCounts, models.HighSchool, models.GeoRollup
+
+    with SessionLocal() as db:
+        with Timer() as timer:
+            written = geo.refresh_geo_rollups(db)
+        print(f"{engine.dialect.name}: rebuilt {written:,} geo rollup rows in {timer.seconds:.2f} s")
+        partitions = db.execute(select(R.uc_campus_id, R.academic_year).distinct().order_by(R.uc_campus_id, R.academic_year)).all()
+        with Timer() as timer:
+            written = geo.refresh_geo_rollups(db, partitions[:1])
+        print(f"  refresh of (campus, year) {tuple(partitions[0])}: {written:,} rows in {timer.seconds:.2f} s")
+
+        def ad_hoc_series(level, value, measure, uc_campus_id):
+            model = G if measure in geo.GENDER_FIELDS else E
+            total = func.sum(getattr(model, measure))
+            return {int(year): total for year, total in db.execute(
+                select(model.academic_year, total)
+                .join(H, H.id == model.high_school_id)
+                .where(getattr(H, level) == value, model.admission_type == 'App', model.uc_campus_id == uc_campus_id)
+                .group_by(model.academic_year).having(total.isnot(None)).order_by(model.academic_year))}
+
+        def ad_hoc_top(level, measure, uc_campus_id, academic_year):
+            model = G if measure in geo.GENDER_FIELDS else E
+            total = func.sum(getattr(model, measure))
+            return [(value, total) for value, total in db.execute(
+                select(getattr(H, level), total)
+                .join(H, H.id == model.high_school_id)
+                .where(getattr(H, level).isnot(None), model.admission_type == 'App', model.uc_campus_id == uc_campus_id,
+                       model.academic_year == academic_year)
+                .group_by(getattr(H, level)).having(total.isnot(None)).order_by(desc(total), getattr(H, level)).limit(10))]
+
+        rng = random.Random(0)
+        regions = db.execute(select(R.geo_level, R.geo_value, R.uc_campus_id).distinct()).all()
+        series_sample = rng.choices(regions, k=args.lookups)
+        top_sample = [(rng.choice(geo.GEO_LEVELS),) + tuple(rng.choice(partitions)) for _ in range(max(10, args.lookups // 4))]
+
+    for measure in ('total_applicants', 'hispanic_latinx'):
+        with SessionLocal() as db:
+            for name, sample, ad_hoc, rollup in [
+                (f"region by year, {measure}", series_sample,
+                 lambda level, value, campus: ad_hoc_series(level, value, measure, campus),
+                 lambda level, value, campus: geo.region_series(db, level, value, measure, 'App', campus)),
+                (f"top 10 regions, {measure}", top_sample,
+                 lambda level, campus, year: ad_hoc_top(level, measure, campus, year),
+                 lambda level, campus, year: geo.top_regions(db, level, measure, 'App', campus, year)),
+            ]:
+                ad_hoc_seconds, rollup_seconds = [], []
+                for key in sample:
+                    with Timer() as timer:
+                        expected = ad_hoc(*key)
+                    ad_hoc_seconds.append(timer.seconds)
+                    with Timer() as timer:
+                        result = rollup(*key)
+                    rollup_seconds.append(timer.seconds)
+                    assert expected == result, (name, key, expected, result)
+                print(f"  {name}")
+                report("ad-hoc GROUP BY", ad_hoc_seconds)
+                report("geo_rollups", rollup_seconds)
+
+
+if __name__ == '__main__':
+    main()
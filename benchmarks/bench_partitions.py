@@ -0,0 +1,145 @@
+"""uc_admission_gender as one table vs LIST-partitioned by academic_year (Postgres only).
+
+Usage:
+    python benchmarks/bench_partitions.py --url postgresql://... [--year 2023] [--years 10] [--lookups 200]
+
+Loads the bundled files for one year (if the database is empty) and copies
+that year's uc_admission_gender rows into --years synthetic years, once into a
+plain scratch table and once into one partitioned by academic_year, both with
+the natural-key and file_id indexes. Prints the plan of a year-filtered query
+on both (only one partition is scanned), p50 latency of year-filtered and
+all-years queries, checking both give the same answer, and the time to reload
+one year: DELETE + INSERT on the plain table vs filling a swap table and
+swapping the partition with sql_db.partitions.
+"""
+import argparse
+import random
+import types
+
+from common import Timer, setup_database
+from bench_school_lookup import ensure_data
+from bench_ethnicity_layout import timed
+
+PLAIN = 'bench_year_plain'
+PARTITIONED = 'bench_year_partitioned'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', required=True, help="Postgres URL; a scratch database is best")
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--reloads', type=int, default=3)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    if engine.dialect.name != 'postgresql':
+        parser.error("declarative partitioning needs Postgres")
+    from sqlalchemy import Column, MetaData, Table
+    from sql_db import models, partitions
+    from sql_db.transform import ADMISSION_TYPES
+    ensure_data(SessionLocal, args.year)
+    G = models.UCAdmissionGender
+    columns = [column.name for column in G.__table__.columns]
+    years = list(range(args.year - args.years + 1, args.year + 1))
+    natural_key = ', '.join(G.natural_key)
+
+    # Rows of --year repeated for every synthetic year, with fresh ids
+    select_rows = (
+        "SELECT " + ', '.join('(row_number() OVER ())::integer' if name == 'id' else 'year::smallint' if name == 'academic_year'
+                               else name for name in columns) +
+        f" FROM uc_admission_gender, generate_series({{first}}, {{last}}) year WHERE academic_year = {args.year}"
+    )
+    with engine.begin() as connection:
+        sql = connection.exec_driver_sql
+        for table in (PLAIN, PARTITIONED):
+            sql(f"DROP TABLE IF EXISTS {table}")
+        sql(f"CREATE TABLE {PLAIN} (LIKE uc_admission_gender)")
+        sql(f"CREATE TABLE {PARTITIONED} (LIKE uc_admission_gender) PARTITION BY LIST (academic_year)")
+        sql(f"ALTER TABLE {PARTITIONED} ALTER COLUMN academic_year SET NOT NULL")
+        for year in years:
+            sql(f"CREATE TABLE {partitions.partition_name(PARTITIONED, year)} PARTITION OF {PARTITIONED} FOR VALUES IN ({year})")
+        for table, key in ((PLAIN, 'id'), (PARTITIONED, 'id, academic_year')):
+            sql(f"INSERT INTO {table} {select_rows.format(first=years[0], last=years[-1])}")
+            sql(f"ALTER TABLE {table} ADD PRIMARY KEY ({key})")
+            sql(f"ALTER TABLE {table} ADD CONSTRAINT uq_{table}_natural_key UNIQUE ({natural_key})")
+            sql(f"CREATE INDEX ix_{table}_file_id ON {table} (file_id)")
+        sql(f"ANALYZE {PLAIN}")
+        sql(f"ANALYZE {PARTITIONED}")
+        rows = sql(f"SELECT count(*) FROM {PLAIN}").scalar()
+        school_ids = sql(f"SELECT DISTINCT high_school_id FROM {PLAIN}").scalars().all()
+
+    enrolled = ADMISSION_TYPES.index('Enr')
+    year_sum = f"SELECT sum(total_applicants) FROM {{table}} WHERE academic_year = {{year}} AND admission_type = {enrolled}"
+    print(f"postgresql: {rows:,} rows over {len(years)} years ({years[0]}-{years[-1]})")
+    with engine.connect() as connection:
+        for table in (PLAIN, PARTITIONED):
+            plan = connection.exec_driver_sql("EXPLAIN (COSTS OFF) " + year_sum.format(table=table, year=years[-1])).scalars()
+            print(f"\n  {table}:\n" + '\n'.join('    ' + line for line in plan))
+    print()
+
+    rng = random.Random(0)
+    sample = [(rng.choice(years), rng.choice(school_ids)) for _ in range(args.lookups)]
+    with SessionLocal() as db:
+        sql = db.connection().exec_driver_sql
+
+        def year_total(table):
+            return lambda i: sql(year_sum.format(table=table, year=years[i % len(years)])).scalar()
+
+        def year_school(table):
+            return lambda i: sorted(sql(
+                f"SELECT uc_campus_id, admission_type, total_applicants FROM {table} "
+                f"WHERE academic_year = {sample[i][0]} AND high_school_id = {sample[i][1]}").all())
+
+        def all_years_school(table):
+            return lambda i: sorted(sql(
+                f"SELECT uc_campus_id, academic_year, admission_type, total_applicants FROM {table} "
+                f"WHERE high_school_id = {sample[i][1]}").all())
+
+        for name, query, repeat in [
+            ('one year total', year_total, 50),
+            ('one year, school', year_school, args.lookups),
+            ('all years, school', all_years_school, args.lookups),
+        ]:
+            plain_ms, plain_result = timed(query(PLAIN), repeat)
+            partitioned_ms, partitioned_result = timed(query(PARTITIONED), repeat)
+            assert plain_result == partitioned_result, name
+            print(f"  {name:<18} plain p50 {plain_ms:9.3f} ms   partitioned p50 {partitioned_ms:9.3f} ms   "
+                  f"{plain_ms / partitioned_ms:6.2f}x")
+
+    # Stand-in for a model, which is all sql_db.partitions needs of one
+    scratch = types.SimpleNamespace(__tablename__=PARTITIONED, __table__=Table(
+        PARTITIONED, MetaData(), *[Column(column.name, column.type) for column in G.__table__.columns]))
+    reload_year = years[len(years) // 2]
+    fresh_rows = select_rows.format(first=reload_year, last=reload_year).replace(
+        '(row_number() OVER ())::integer', f'(row_number() OVER () + {rows})::integer')
+    plain_seconds, swap_seconds = [], []
+    for _ in range(args.reloads):
+        with SessionLocal() as db, Timer() as timer:
+            sql = db.connection().exec_driver_sql
+            sql(f"DELETE FROM {PLAIN} WHERE academic_year = {reload_year}")
+            sql(f"INSERT INTO {PLAIN} {fresh_rows}")
+            db.commit()
+        plain_seconds.append(timer.seconds)
+        with SessionLocal() as db, Timer() as timer:
+            swap = partitions.create_swap_table(db, scratch, reload_year)
+            db.connection().exec_driver_sql(f"INSERT INTO {swap.name} {fresh_rows}")
+            partitions.swap_partition(db, scratch, reload_year, swap)
+            db.commit()
+        swap_seconds.append(timer.seconds)
+    with engine.connect() as connection:
+        counts = [connection.exec_driver_sql(f"SELECT count(*) FROM {table} WHERE academic_year = {reload_year}").scalar()
+                  for table in (PLAIN, PARTITIONED)]
+    assert counts[0] == counts[1], counts
+    plain_ms, swap_ms = 1000 * min(plain_seconds), 1000 * min(swap_seconds)
+    print(f"  reload {reload_year} ({counts[0]:,} rows) delete+insert {plain_ms:9.1f} ms   swap {swap_ms:9.1f} ms   "
+          f"{plain_ms / swap_ms:6.2f}x")
+
+    with engine.begin() as connection:
+        for table in (PLAIN, PARTITIONED):
+            connection.exec_driver_sql(f"DROP TABLE {table}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""School profiles: assembling get_high_school_data_by_id from the admission tables vs reading the stored blob.
+
+Usage:
+    python benchmarks/bench_profiles.py [--url ...] [--lookups 500]
+
+Loads the bundled files for one year (if the database is empty), builds the
+high_school_profiles read model, then reports p50/p99 latency of on-the-fly
+assembly (cache cleared, serialized with json.dumps) and of the primary-key
+fetch of the gzip blob, and checks the blob decodes to the same profile.
+"""
+import argparse
+import json
+import random
+
+from common import Timer, percentile, setup_database
+from bench_school_lookup import ensure_data, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=500)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import crud, models, profiles
+    ensure_data(SessionLocal, args.year)
+
+    with SessionLocal() as db:
+        with Timer() as timer:
+            written = profiles.rebuild_profiles(db)
+        rows = db.query(models.HighSchoolProfile.body, models.HighSchoolProfile.raw_size).all()
+        raw_bytes, stored_bytes = sum(raw_size for _, raw_size in rows), sum(len(body) for body, _ in rows)
+        print(f"{engine.dialect.name}: built {written} profiles in {timer.seconds:.2f} s, "
+              f"{raw_bytes / 2 ** 20:.1f} MiB JSON stored as {stored_bytes / 2 ** 20:.1f} MiB gzip")
+
+        school_ids = [row[0] for row in db.query(models.UCAdmissionGender.high_school_id).distinct()]
+        sample = random.Random(0).choices(school_ids, k=args.lookups)
+        assembled, stored = [], []
+        for school_id in sample:
+            crud.invalidate_high_school_data()
+            with Timer() as timer:
+                expected = json.dumps(crud.get_high_school_data_by_id(db, school_id)).encode()
+            assembled.append(timer.seconds)
+
+            with Timer() as timer:
+                body, _ = profiles.get_profile_body(db, school_id)
+            stored.append(timer.seconds)
+            if profiles.decode_profile(body) != json.loads(expected):
+                raise AssertionError(f"Stored profile differs for high school {school_id}")
+
+    print(f"  {args.lookups} lookups over {len(school_ids)} schools")
+    report('assemble + json.dumps', assembled)
+    report('stored gzip blob', stored)
+    print(f"  p50 speedup {percentile(assembled, 50) / percentile(stored, 50):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Top-N and rank-of-school queries: SQL sorts vs the precomputed ranking store.
+
+Usage:
+    python benchmarks/bench_ranking.py [--url ...] [--year 2023] [--queries 200]
+
+Loads the bundled files for one year (if the database is empty), builds the
+ranking store once, then compares p50 latency of "top 50 schools by enrolled
+count" and "rank of a school by admitted mean GPA" for random campuses and
+schools, checking both paths agree.
+"""
+import argparse
+import random
+
+from common import Timer, percentile, setup_database
+from bench_school_lookup import ensure_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sqlalchemy import func
+    from sql_db import models, ranking
+    ensure_data(SessionLocal, args.year)
+    G, P = models.UCAdmissionGender, models.UCAdmissionGPA
+
+    with SessionLocal() as db:
+        with Timer() as timer:
+            store = ranking.RankingStore.load(db)
+        print(f"{engine.dialect.name}: {len(store.partitions)} orderings built in {timer.seconds:.2f} s")
+
+        gpa_rows = db.query(P.high_school_id, P.uc_campus_id).filter(
+            P.academic_year == args.year, P.admission_type == 'Adm', P.mean_gpa.isnot(None)).all()
+        campuses = sorted({campus_id for _, campus_id in gpa_rows})
+        rng = random.Random(0)
+        top_sample = [rng.choice(campuses) for _ in range(args.queries)]
+        rank_sample = rng.choices(gpa_rows, k=args.queries)
+
+        def sql_top(campus_id):
+            return [(school_id, total) for school_id, total in db.query(G.high_school_id, G.total_applicants).filter(
+                G.uc_campus_id == campus_id, G.academic_year == args.year, G.admission_type == 'Enr',
+                G.total_applicants.isnot(None)).order_by(G.total_applicants.desc(), G.high_school_id).limit(50)]
+
+        def sql_rank(school_id, campus_id):
+            scope = (P.uc_campus_id == campus_id, P.academic_year == args.year, P.admission_type == 'Adm', P.mean_gpa.isnot(None))
+            value = db.query(P.mean_gpa).filter(P.high_school_id == school_id, *scope).scalar()
+            above = db.query(func.count()).filter(P.mean_gpa > value, *scope).scalar()
+            return above + 1
+
+        results = {}
+        for name, run, sample in [
+            ('sql top 50', lambda campus_id: sql_top(campus_id), top_sample),
+            ('store top 50', lambda campus_id: store.top(campus_id, args.year, 'Enr', 'total_applicants', 50), top_sample),
+            ('sql rank of school', lambda row: sql_rank(*row), rank_sample),
+            ('store rank of school', lambda row: store.rank(row[0], row[1], args.year, 'Adm', 'mean_gpa')['rank'], rank_sample),
+        ]:
+            samples, outputs = [], []
+            for item in sample:
+                with Timer() as timer:
+                    outputs.append(run(item))
+                samples.append(timer.seconds * 1000)
+            results[name] = outputs
+            print(f"  {name:<24} p50 {percentile(samples, 50):9.3f} ms   p99 {percentile(samples, 99):9.3f} ms")
+        assert results['sql top 50'] == results['store top 50']
+        assert results['sql rank of school'] == results['store rank of school']
+
+
+if __name__ == '__main__':
+    main()
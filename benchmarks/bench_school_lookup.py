@@ -0,0 +1,99 @@
+"""Latency of get_high_school_data: old per-table/per-campus queries vs the UNION query and its cache.
+
+Usage:
+    python benchmarks/bench_school_lookup.py [--url ...] [--lookups 500]
+
+Loads the bundled files for one year (if the database is empty), then looks up
+random schools and prints p50/p99 latency for each path.
+"""
+import argparse
+import glob
+import os
+import random
+
+from common import FILES_DIRECTORY, Timer, percentile, setup_database
+
+
+def legacy_high_school_data(db, high_school):
+    # The pre-UNION implementation: three table queries plus one UCCampus query and a rescan per campus
+    from sql_db import models
+    ethnicity_data = db.query(models.UCAdmissionEthnicity).filter(models.UCAdmissionEthnicity.high_school_id == high_school.id).all()
+    gender_data = db.query(models.UCAdmissionGender).filter(models.UCAdmissionGender.high_school_id == high_school.id).all()
+    gpa_data = db.query(models.UCAdmissionGPA).filter(models.UCAdmissionGPA.high_school_id == high_school.id).all()
+    nested_result = {"high_school": {"id": high_school.id, "uc_school_name": high_school.uc_school_name, "school_name": high_school.school_name,
+                                     "city": high_school.city, "county": high_school.county, "state": high_school.state,
+                                     "country": high_school.country, "is_public": high_school.is_public}}
+    for campus_id in set(e.uc_campus_id for e in ethnicity_data + gender_data + gpa_data):
+        campus_name = db.query(models.UCCampus).filter_by(id=campus_id).first().campus_name
+        nested_result[campus_name] = {"App": {}, "Adm": {}, "Enr": {}}
+        for e in ethnicity_data:
+            if e.uc_campus_id == campus_id:
+                nested_result[campus_name][e.admission_type][e.ethnicity] = e.count
+        for e in gender_data:
+            if e.uc_campus_id == campus_id:
+                nested_result[campus_name][e.admission_type].update({
+                    "total_applicants": e.total_applicants, "male_applicants": e.male_applicants,
+                    "female_applicants": e.female_applicants, "other_applicants": e.other_applicants,
+                    "unknown_gender": e.unknown_gender})
+        for e in gpa_data:
+            if e.uc_campus_id == campus_id:
+                nested_result[campus_name][e.admission_type]["Mean GPA"] = e.mean_gpa
+    return nested_result
+
+
+def ensure_data(SessionLocal, year):
+    from sql_db import checkpoint, crud, models
+    with SessionLocal() as db:
+        if db.query(models.UCAdmissionGender).count():
+            return
+        crud.add_files_to_db(db, FILES_DIRECTORY)
+        for file in db.query(models.File).filter(models.File.year == year).all():
+            checkpoint.ingest_file(db, file)
+
+
+def report(name, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"  {name:<28} p50 {percentile(ms, 50):8.3f} ms   p99 {percentile(ms, 99):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--lookups', type=int, default=500)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import crud, models
+    ensure_data(SessionLocal, args.year)
+
+    with SessionLocal() as db:
+        school_ids = [row[0] for row in db.query(models.UCAdmissionGender.high_school_id).distinct().all()]
+        sample = random.Random(0).choices(school_ids, k=args.lookups)
+        schools = {school.id: school for school in db.query(models.HighSchool).filter(models.HighSchool.id.in_(set(sample)))}
+
+        legacy, uncached, cached = [], [], []
+        for school_id in sample:
+            with Timer() as timer:
+                expected = legacy_high_school_data(db, schools[school_id])
+            legacy.append(timer.seconds)
+
+            crud.invalidate_high_school_data()
+            with Timer() as timer:
+                actual = crud.get_high_school_data_by_id(db, school_id)
+            uncached.append(timer.seconds)
+            if actual != expected:
+                raise AssertionError(f"Profiles differ for high school {school_id}")
+
+            with Timer() as timer:
+                crud.get_high_school_data_by_id(db, school_id)
+            cached.append(timer.seconds)
+
+    print(f"{engine.dialect.name}: {args.lookups} lookups over {len(school_ids)} schools")
+    report('per-table + per-campus', legacy)
+    report('single UNION query', uncached)
+    report('cache hit', cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Profiles for many schools: a get_high_school_data_by_id loop vs get_high_school_data_many.
+
+Usage:
+    python benchmarks/bench_school_lookup_many.py [--url ...] [--schools 1000]
+
+Loads the bundled files for one year (if the database is empty), then fetches
+the profiles of a set of schools with one query per school and with the batch
+call (one UNION ALL per chunk of ids), with a cold cache, and checks both agree.
+"""
+import argparse
+import random
+
+from common import Timer, setup_database
+from bench_school_lookup import ensure_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--schools', type=int, default=1000)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import crud, models
+    ensure_data(SessionLocal, args.year)
+
+    with SessionLocal() as db:
+        school_ids = sorted(row[0] for row in db.query(models.UCAdmissionGender.high_school_id).distinct())
+        sample = random.Random(0).sample(school_ids, min(args.schools, len(school_ids)))
+
+        crud.invalidate_high_school_data()
+        with Timer() as timer:
+            expected = {school_id: crud.get_high_school_data_by_id(db, school_id) for school_id in sample}
+        loop_seconds = timer.seconds
+
+        crud.invalidate_high_school_data()
+        with Timer() as timer:
+            actual = crud.get_high_school_data_many(db, sample)
+        batch_seconds = timer.seconds
+        assert actual == expected, "Batch profiles differ from the per-school ones"
+
+        names = [(profile['high_school']['school_name'], profile['high_school']['city']) for profile in expected.values()
+                 if profile['high_school']['school_name']]
+        crud.invalidate_high_school_data()
+        with Timer() as timer:
+            by_name = crud.get_high_school_data_many(db, names=names)
+        names_seconds = timer.seconds
+        resolved = sum(profile is not None for profile in by_name.values())
+
+    print(f"{engine.dialect.name}: {len(sample)} schools")
+    print(f"  {'per-school loop':<28} {loop_seconds:8.3f} s")
+    print(f"  {'get_high_school_data_many':<28} {batch_seconds:8.3f} s   {loop_seconds / batch_seconds:6.1f}x")
+    print(f"  {'by (name, city)':<28} {names_seconds:8.3f} s   {resolved}/{len(names)} resolved")
+
+
+if __name__ == '__main__':
+    main()
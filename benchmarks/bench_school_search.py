@@ -0,0 +1,75 @@
+"""School-name search latency on a synthetic 100k-school table.
+
+Usage:
+    python benchmarks/bench_school_search.py [--url ...] [--schools 100000] [--queries 200]
+
+Compares the old ILIKE '%name%' scan (what get_high_school_by_name_and_city used to run) with
+search_high_schools: pg_trgm on Postgres, the in-process trigram index elsewhere.
+Without --url a separate temporary SQLite database is created.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from common import Timer, percentile, setup_database
+
+WORDS = ['ACADEMY', 'CHARTER', 'VALLEY', 'MOUNTAIN', 'LINCOLN', 'WASHINGTON', 'OAK', 'PINE', 'RIVER', 'LAKE',
+         'NORTH', 'SOUTH', 'EAST', 'WEST', 'CENTRAL', 'SAINT', 'MARY', 'JOHN', 'FRANKLIN', 'JEFFERSON',
+         'MADISON', 'SUNSET', 'HILLS', 'BAY', 'HARBOR', 'MESA', 'VISTA', 'CANYON', 'DESERT', 'COAST']
+CITIES = ['Irvine', 'Fresno', 'Oakland', 'San Jose', 'Austin', 'Portland', 'Denver', 'Boston', 'Seattle', 'Phoenix']
+STATES = ['CA', 'TX', 'OR', 'CO', 'MA', 'WA', 'AZ', 'NY']
+
+
+def synthetic_schools(count, rng):
+    for i in range(count):
+        name = ' '.join(rng.sample(WORDS, rng.randint(1, 3))) + rng.choice([' HIGH SCHOOL', ' HIGH', ' SECONDARY SCHOOL', ' PREPARATORY'])
+        yield {
+            'uc_school_name': f'{name}{i:06d}',
+            'school_name': name,
+            'city': rng.choice(CITIES),
+            'state': rng.choice(STATES),
+            'country': 'United States',
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--schools', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'uc_school_search_bench.db')
+    engine, SessionLocal = setup_database(url)
+    from sql_db import models, search
+
+    rng = random.Random(0)
+    with SessionLocal() as db:
+        existing = db.query(models.HighSchool).count()
+        if existing < args.schools:
+            rows = list(synthetic_schools(args.schools - existing, rng))
+            for start in range(0, len(rows), 10000):
+                db.execute(models.HighSchool.__table__.insert(), rows[start:start + 10000])
+            db.commit()
+
+        queries = [(' '.join(rng.sample(WORDS, 2)), rng.choice(CITIES)) for _ in range(args.queries)]
+        with Timer() as timer:
+            search.search_high_schools(db, 'warm up')
+        print(f"{engine.dialect.name}: {db.query(models.HighSchool).count()} schools, first search (builds any in-process index) {timer.seconds:.2f} s")
+
+        scans, searches = [], []
+        for name, city in queries:
+            with Timer() as timer:
+                db.query(models.HighSchool).filter(models.HighSchool.school_name.ilike(f"%{name}%")).all()
+            scans.append(timer.seconds * 1000)
+            with Timer() as timer:
+                search.search_high_schools(db, name, city=city, limit=10)
+            searches.append(timer.seconds * 1000)
+
+    for label, samples in [("ILIKE scan", scans), ("search_high_schools", searches)]:
+        print(f"  {label:<22} p50 {percentile(samples, 50):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Peak memory of ingesting one large file: whole-file parse vs the chunked streaming pipeline.
+
+Usage:
+    python benchmarks/bench_streaming_ingest.py [--url ...] [--scale 10] [--chunksize 20000]
+
+Builds a synthetic ethnicity file `--scale` times the size of the largest
+bundled one (each copy with its own school names), then ingests it in a fresh
+process per mode and reports wall time and peak RSS. The two modes must write
+the same number of rows. Without --url each run gets its own SQLite database.
+"""
+import argparse
+import glob
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from common import FILES_DIRECTORY, ROOT, Timer, setup_database
+
+PATTERN = 'FR ENR Eth*'
+
+
+def make_file(directory, scale):
+    from sql_db.csv_reader import read_admission_csv
+    source = max(glob.glob(os.path.join(FILES_DIRECTORY, PATTERN)), key=os.path.getsize)
+    df = read_admission_csv(source)
+    copies = [df.assign(Calculation1=f"COPY{k} " + df['Calculation1'].astype(str)) for k in range(scale)]
+    target = os.path.join(directory, os.path.basename(source).replace('.csv', f' x{scale}.csv'))
+    # Same layout as the exports: UTF-16 with a BOM, tab separated
+    pd.concat(copies, ignore_index=True).to_csv(target, sep='\t', index=False, encoding='utf-16')
+    return target
+
+
+def run(mode, path, url, chunksize):
+    # Child process: ingest the file once and print rows, records, seconds and peak RSS
+    engine, SessionLocal = setup_database(url)
+    from sql_db import checkpoint, discovery, models
+    from sql_db.process_csv_file import parse_admission_file
+    from sql_db.resolver import HighSchoolResolver
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with SessionLocal() as db:
+        discovery.register_files(db, [path])
+        file = db.query(models.File).filter_by(location=os.path.abspath(path)).one()
+        info = checkpoint.file_info(file)
+        with Timer() as timer:
+            if mode == 'whole':
+                parsed = parse_admission_file(path, info['category'], info['uc_campus_id'], info['year'], info['high_school_type'])
+                rows, written, _ = checkpoint.commit_file(db, info, [parsed], checkpoint.file_hash(path), HighSchoolResolver(db))
+            else:
+                chunks = checkpoint.iter_admission_chunks(path, info['category'], info['uc_campus_id'], info['year'],
+                                                          info['high_school_type'], chunksize)
+                rows, written, _ = checkpoint.commit_file(db, info, chunks, checkpoint.file_hash(path), HighSchoolResolver(db))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(rows, written, timer.seconds, baseline / 1024, peak / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--chunksize', type=int, default=20000)
+    parser.add_argument('--run', choices=['whole', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        return run(args.run, args.file, args.url, args.chunksize)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_file(directory, args.scale)
+        print(f"{os.path.basename(path)}: {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        results = {}
+        for mode in ('whole', 'streaming'):
+            url = args.url or 'sqlite:///' + os.path.join(directory, f'{mode}.db')
+            env = dict(os.environ, UC_FILE_CACHE_DIR=os.path.join(directory, f'cache-{mode}'))
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', mode, '--file', path, '--url', url, '--chunksize', str(args.chunksize)],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            rows, written, seconds, baseline, peak = output.split()
+            results[mode] = (int(rows), int(written))
+            print(f"  {mode:<10} {int(rows):>9} CSV rows -> {int(written):>9} records  {float(seconds):7.2f} s   "
+                  f"peak RSS {float(peak):7.1f} MiB ({float(peak) - float(baseline):+.1f} MiB over imports)")
+        assert results['whole'] == results['streaming'], results
+
+
+if __name__ == '__main__':
+    main()
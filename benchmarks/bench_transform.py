@@ -0,0 +1,205 @@
+"""Compare the columnar transform in sql_db/transform.py with the old per-row path.
+
+Usage:
+    python benchmarks/bench_transform.py [--limit N] [--pattern 'Gdr']
+
+Every file is read once; both paths then build the high school and admission
+records from the same DataFrame and the outputs are checked for equality.
+"""
+import argparse
+import glob
+import os
+import re
+import time
+
+import pandas as pd
+
+from common import FILES_DIRECTORY
+from sql_db import transform
+
+
+class _FakeSchoolTable:
+    # Stands in for get_high_school_by_uc_school_name/create_high_school
+    def __init__(self):
+        self.ids = {}
+        self.rows = []
+
+    def get_or_create(self, uc_school_name, school):
+        if uc_school_name not in self.ids:
+            self.ids[uc_school_name] = len(self.ids) + 1
+            self.rows.append(school)
+        return self.ids[uc_school_name]
+
+
+def _legacy_location(value, ignore_case):
+    if pd.isna(value) or (value.upper() if ignore_case else value) == 'N/A':
+        return None, None, 'Unknown'
+    if value in transform.US_STATE_CODES:
+        return None, value, 'United States'
+    return value, 'CA', 'United States'
+
+
+def _legacy_school_name(uc_school_name):
+    # The per-row leading-zero strip of the old GPA loader, now applied by every loader
+    if uc_school_name and any(char.isdigit() for char in uc_school_name):
+        match = re.search(r'(\d+)$', uc_school_name)
+        if match:
+            uc_school_name = re.sub(r'\d+$', match.group(1).lstrip('0'), uc_school_name)
+    return uc_school_name
+
+
+def legacy_gpa(df, uc_campus_id, year):
+    table, records = _FakeSchoolTable(), []
+    for _, row in df.iterrows():
+        uc_school_name = _legacy_school_name(row['Calculation1'])
+        county, state, country = _legacy_location(row['County/State/Country'], True)
+        high_school_id = table.get_or_create(uc_school_name, (uc_school_name, county, state, country))
+        for gpa_type, admission_type in transform.GPA_TYPE_MAPPING.items():
+            gpa_value = row.get(gpa_type)
+            if pd.notna(gpa_value):
+                records.append({
+                    'high_school_id': high_school_id,
+                    'uc_campus_id': uc_campus_id,
+                    'academic_year': year,
+                    'admission_type': admission_type,
+                    'mean_gpa': float(gpa_value),
+                })
+    return table, records
+
+
+def legacy_gender(df, uc_campus_id, year):
+    table, records = _FakeSchoolTable(), []
+    for _, row in df.iterrows():
+        uc_school_name = _legacy_school_name(row['Calculation1'])
+        county, state, country = _legacy_location(row['County/State/ Territory'], False)
+        high_school_id = table.get_or_create(uc_school_name, (uc_school_name, county, state, country))
+        total_applicants = int(row['All']) if pd.notna(row['All']) else 0
+        male_applicants = int(row['Male']) if pd.notna(row['Male']) else 0
+        female_applicants = int(row['Female']) if pd.notna(row['Female']) else 0
+        other_applicants = int(row['Other']) if 'Other' in row and pd.notna(row['Other']) else 0
+        unknown_gender = int(row['Unknown']) if 'Unknown' in row and pd.notna(row['Unknown']) else 0
+        if 'Unknown' not in row:
+            unknown_gender = total_applicants - male_applicants - female_applicants - other_applicants
+        records.append({
+            'high_school_id': high_school_id,
+            'uc_campus_id': uc_campus_id,
+            'admission_type': row['Count'],
+            'academic_year': year,
+            'total_applicants': total_applicants,
+            'male_applicants': male_applicants,
+            'female_applicants': female_applicants,
+            'other_applicants': other_applicants,
+            'unknown_gender': unknown_gender
+        })
+    return table, records
+
+
+def legacy_ethnicity(df, uc_campus_id, year, high_school_type):
+    table, records = _FakeSchoolTable(), []
+    for _, row in df.iterrows():
+        uc_school_name = _legacy_school_name(row['Calculation1'])
+        location = row['County/State/ Territory']
+        if high_school_type.upper() in ['CA_PUBLIC', 'CA_PRIVATE']:
+            county, state, country = location, 'CA', 'United States'
+        elif high_school_type.upper() == 'NON_CA':
+            county, state, country = None, location, 'United States'
+        else:
+            county, state, country = None, None, location
+        high_school_id = table.get_or_create(uc_school_name, (uc_school_name, county, state, country))
+        for ethnicity in transform.ETHNICITIES:
+            count = row.get(ethnicity, 0)
+            if pd.notna(count):
+                records.append({
+                    'high_school_id': high_school_id,
+                    'uc_campus_id': uc_campus_id,
+                    'admission_type': row['Count'],
+                    'academic_year': year,
+                    'ethnicity': ethnicity,
+                    'count': int(count)
+                })
+    return table, records
+
+
+def columnar(frames):
+    schools, records = frames
+    # Ids are assigned in first-seen order, matching _FakeSchoolTable
+    high_school_ids = {name: i + 1 for i, name in enumerate(schools['uc_school_name'])}
+    records = transform.frame_to_records(transform.attach_high_school_ids(records, high_school_ids))
+    return schools, records
+
+
+def long_ethnicity(records):
+    # Compact records (a count column per ethnicity) back in the old one-row-per-ethnicity shape
+    rows = []
+    for record in records:
+        for label, column in transform.ETHNICITY_COLUMNS:
+            if record[column] is not None:
+                rows.append({
+                    'high_school_id': record['high_school_id'],
+                    'uc_campus_id': record['uc_campus_id'],
+                    'admission_type': record['admission_type'],
+                    'academic_year': record['academic_year'],
+                    'ethnicity': label,
+                    'count': record[column],
+                })
+    return rows
+
+
+def _file_kind(name):
+    if 'GPA' in name:
+        return 'gpa'
+    if 'Gdr' in name:
+        return 'gender'
+    for marker, school_type in [('CA Public', 'CA_public'), ('CA Private', 'CA_private'), ('Foreign', 'Foreign'), ('non-CA', 'non_CA')]:
+        if marker in name:
+            return school_type
+    return None
+
+
+def run(paths):
+    total_legacy = total_columnar = 0.0
+    print(f"{'file':<45} {'rows':>7} {'records':>8} {'per-row s':>10} {'columnar s':>11} {'speedup':>8}")
+    for path in paths:
+        name = os.path.basename(path)
+        kind = _file_kind(name)
+        df = pd.read_csv(path, encoding='utf-16', sep='\t')
+
+        start = time.perf_counter()
+        if kind == 'gpa':
+            table, expected = legacy_gpa(df, 1, 2023)
+        elif kind == 'gender':
+            table, expected = legacy_gender(df, 1, 2023)
+        else:
+            table, expected = legacy_ethnicity(df, 1, 2023, kind)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if kind == 'gpa':
+            schools, actual = columnar(transform.gpa_frames(df, 1, 2023))
+        elif kind == 'gender':
+            schools, actual = columnar(transform.gender_frames(df, 1, 2023))
+        else:
+            schools, actual = columnar(transform.ethnicity_frames(df, 1, 2023, kind))
+            actual = long_ethnicity(actual)
+        columnar_seconds = time.perf_counter() - start
+
+        school_rows = [tuple(None if pd.isna(v) else v for v in row) for row in table.rows]
+        if actual != expected or school_rows != list(schools[['uc_school_name', 'county', 'state', 'country']].itertuples(index=False, name=None)):
+            raise AssertionError(f"Columnar output differs from the per-row path for {name}")
+
+        total_legacy += legacy_seconds
+        total_columnar += columnar_seconds
+        print(f"{name[:45]:<45} {len(df):>7} {len(actual):>8} {legacy_seconds:>10.3f} {columnar_seconds:>11.3f} {legacy_seconds / columnar_seconds:>7.1f}x")
+
+    print(f"{'total':<45} {'':>7} {'':>8} {total_legacy:>10.3f} {total_columnar:>11.3f} {total_legacy / max(total_columnar, 1e-9):>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', default=FILES_DIRECTORY)
+    parser.add_argument('--pattern', default='', help="only files whose name contains this text")
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(os.path.join(args.directory, '*.csv')) if args.pattern in os.path.basename(p))
+    run(paths[:args.limit])
@@ -0,0 +1,87 @@
+"""Trend series computed from uc_admission_gender on request vs read from admission_trends.
+
+Usage:
+    python benchmarks/bench_trends.py [--url ...] [--lookups 200]
+
+Loads every bundled gender file (if fewer than two years are loaded), times a
+full rebuild of admission_trends and the refresh of one campus, then reports
+p50/p99 latency of computing one school's series (every campus and across
+campuses) and one campus' series from the raw rows with the same code, against
+the primary-key read of the stored rows, checking both give the same values.
+"""
+import argparse
+import math
+import random
+
+from common import FILES_DIRECTORY, Timer, setup_database
+from bench_school_lookup import report
+
+
+def ensure_series(SessionLocal):
+    from sql_db import checkpoint, crud, models
+    with SessionLocal() as db:
+        if db.query(models.UCAdmissionGender.academic_year).distinct().count() >= 2:
+            return
+        crud.add_files_to_db(db, FILES_DIRECTORY)
+        for file in db.query(models.File).filter(models.File.category == models.Category.GENDER).all():
+            checkpoint.ingest_file(db, file)
+
+
+def same(computed, stored):
+    def close(a, b):
+        return (a is None and b is None) or (a is not None and b is not None and math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12))
+    return len(computed) == len(stored) and all(
+        close(row[key], other[key]) for row, other in zip(computed, stored) for key in row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    engine, SessionLocal = setup_database(args.url)
+    from sql_db import models, trends
+    ensure_series(SessionLocal)
+
+    def on_the_fly(db, campuses=None, high_school_ids=None, keep=None):
+        counts = trends._rollup(trends._gender_counts(db, campuses, high_school_ids),
+                                [['high_school_id'], ['uc_campus_id'], ['high_school_id', 'uc_campus_id']])
+        rows = trends.trend_series(counts[keep(counts)])
+        return rows.sort_values(['uc_campus_id', 'academic_year']).to_dict('records')
+
+    with SessionLocal() as db:
+        with Timer() as timer:
+            written = trends.refresh_trends(db)
+        print(f"{engine.dialect.name}: rebuilt {written:,} admission trend rows in {timer.seconds:.2f} s")
+        campus_ids = sorted(campus for campus, in db.query(models.AdmissionTrend.uc_campus_id).distinct() if campus != trends.ALL)
+        with Timer() as timer:
+            written = trends.refresh_trends(db, campus_ids[:1])
+        print(f"  refresh of campus {campus_ids[0]}: {written:,} rows in {timer.seconds:.2f} s")
+
+        school_ids = [school for school, in db.query(models.AdmissionTrend.high_school_id).filter(
+            models.AdmissionTrend.uc_campus_id == trends.ALL).distinct() if school != trends.ALL]
+        rng = random.Random(0)
+        for name, sample, compute, read in [
+            ('one school', rng.choices(school_ids, k=args.lookups),
+             lambda school: on_the_fly(db, high_school_ids=[school], keep=lambda c: c.high_school_id != trends.ALL),
+             lambda school: trends.get_trends(db, school)),
+            ('one campus', rng.choices(campus_ids, k=max(5, args.lookups // 20)),
+             lambda campus: on_the_fly(db, campuses=[campus], keep=lambda c: (c.high_school_id == trends.ALL) & (c.uc_campus_id == campus)),
+             lambda campus: trends.get_trends(db, trends.ALL, campus)),
+        ]:
+            computed_seconds, stored_seconds = [], []
+            for key in sample:
+                with Timer() as timer:
+                    computed = compute(key)
+                computed_seconds.append(timer.seconds)
+                with Timer() as timer:
+                    stored = read(key)
+                stored_seconds.append(timer.seconds)
+                assert same(computed, stored), (name, key)
+            report(f"{name}, from raw rows", computed_seconds)
+            report(f"{name}, admission_trends", stored_seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILES_DIRECTORY = os.path.join(ROOT, 'app', 'handle-files', 'files')
+
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+
+def default_url():
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'uc_admission_bench.db')
+
+
+def setup_database(url=None):
+    # sql_db.database builds its engine from DATABASE_URL at import time,
+    # so the variable has to be set before anything from sql_db is imported
+    os.environ['DATABASE_URL'] = url or os.environ.get('DATABASE_URL') or default_url()
+    from sql_db import models, crud
+    from sql_db.database import engine, SessionLocal
+
+    models.Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        crud.seed_uc_campuses(db)
+    return engine, SessionLocal
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+from .transform import ADMISSION_TYPES, ETHNICITY_COLUMNS
+
+QUERY_MODELS = {
+    'admissions': models.UCAdmissionGender,
+    'gender': models.UCAdmissionGender,
+    'ethnicity': models.UCAdmissionEthnicity,
+    'gpa': models.UCAdmissionGPA,
+}
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Rows fetched from the server-side cursor at a time while streaming
+STREAM_BATCH_SIZE = 5000
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _values(value):
+    # Accepts a scalar, a list or a comma separated string (as it comes from a query string)
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def _ints(value, name):
+    try:
+        return [int(v) for v in _values(value)]
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be integers, got {value!r}")
+
+
+def _campus_ids(db: Session, value):
+    # Campus ids or campus names
+    ids_by_name = {name.lower(): campus_id for campus_id, name in crud.get_campus_names(db).items()}
+    campus_ids = []
+    for campus in _values(value):
+        if isinstance(campus, int) or str(campus).isdigit():
+            campus_ids.append(int(campus))
+        elif str(campus).lower() in ids_by_name:
+            campus_ids.append(ids_by_name[str(campus).lower()])
+        else:
+            raise ValueError(f"Unknown campus: {campus}")
+    return campus_ids
+
+
+def _admission_types(value):
+    admission_types = _values(value)
+    for admission_type in admission_types:
+        if admission_type not in ADMISSION_TYPES:
+            raise ValueError(f"Unknown admission_type: {admission_type}")
+    return admission_types
+
+
+def _filter(db: Session, model, query, parameters, filters=()):
+    # Every filter becomes a WHERE clause so the database only returns matching rows
+    filters = [
+        (model.uc_campus_id, _campus_ids(db, parameters.get('campus'))),
+        (model.academic_year, _ints(parameters.get('year'), 'year')),
+        (model.admission_type, _admission_types(parameters.get('admission_type'))),
+        (model.high_school_id, _ints(parameters.get('school_ids'), 'school_ids')),
+        *filters,
+    ]
+    location = [
+        (models.HighSchool.county, _values(parameters.get('county'))),
+        (models.HighSchool.state, _values(parameters.get('state'))),
+    ]
+    if any(values for _, values in location):
+        query = query.join(models.HighSchool, models.HighSchool.id == model.high_school_id)
+        filters.extend(location)
+
+    for column, values in filters:
+        if len(values) == 1:
+            query = query.where(column == values[0])
+        elif values:
+            query = query.where(column.in_(values))
+    return query
+
+
+def build_query(db: Session, query_type, parameters=None):
+    if query_type not in QUERY_MODELS:
+        raise ValueError(f"Invalid query type: {query_type}")
+    model = QUERY_MODELS[query_type]
+    parameters = parameters or {}
+
+    ethnicities = _values(parameters.get('ethnicity'))
+    if ethnicities and model is not models.UCAdmissionEthnicity:
+        raise ValueError("ethnicity can only be filtered on the ethnicity query")
+    filters = [(model.ethnicity, ethnicities)] if ethnicities else []
+    return model, _filter(db, model, select(*model.__table__.columns), parameters, filters)
+
+
+def _fetch_ethnicity_rows(db: Session, parameters, after, limit):
+    # The view's ids are computed (compact id * len(ETHNICITY_COLUMNS) + position), so a keyset on them would scan
+    # and sort the whole UNION ALL on every page. Page on the compact table's id instead and expand each of its
+    # rows to one per ethnicity here, with the view's ids and order
+    counts = models.UCAdmissionEthnicityCounts
+    ethnicities = _values(parameters.get('ethnicity'))
+    wanted = [
+        (position, label, getattr(counts, column))
+        for position, (label, column) in enumerate(ETHNICITY_COLUMNS)
+        if not ethnicities or label in ethnicities
+    ]
+    if not wanted:
+        return []
+    query = select(
+        counts.id, counts.high_school_id, counts.uc_campus_id, counts.file_id, counts.admission_type,
+        counts.academic_year, *[column for _, _, column in wanted],
+    )
+    query = _filter(db, counts, query, parameters).where(or_(*[column.isnot(None) for _, _, column in wanted]))
+    if after is not None:
+        # The compact row holding `after` may still have ethnicities to come
+        query = query.where(counts.id >= int(after) // len(ETHNICITY_COLUMNS))
+
+    rows = []
+    # Every compact row gives at least one row except perhaps the first, so limit + 1 of them fill the page
+    for row in db.execute(query.order_by(counts.id).limit(limit + 1)):
+        for position, label, column in wanted:
+            row_id = row.id * len(ETHNICITY_COLUMNS) + position
+            count = row._mapping[column]
+            if count is None or (after is not None and row_id <= int(after)):
+                continue
+            rows.append({
+                'id': row_id,
+                'high_school_id': row.high_school_id,
+                'uc_campus_id': row.uc_campus_id,
+                'file_id': row.file_id,
+                'admission_type': row.admission_type,
+                'ethnicity': label,
+                'count': count,
+                'academic_year': row.academic_year,
+            })
+    return rows[:limit]
+
+
+def fetch_page(db: Session, query_type, parameters=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    # Keyset pagination on id: each page is an index range scan, however deep the page
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    model, query = build_query(db, query_type, parameters)
+    if model is models.UCAdmissionEthnicity:
+        rows = _fetch_ethnicity_rows(db, parameters or {}, after, limit)
+    else:
+        if after is not None:
+            query = query.where(model.id > int(after))
+        rows = [dict(row._mapping) for row in db.execute(query.order_by(model.id).limit(limit))]
+    return {
+        'query_type': query_type,
+        'rows': rows,
+        'next_after': rows[-1]['id'] if len(rows) == limit else None,
+    }
+
+
+def iter_rows(db: Session, query_type, parameters=None, batch_size=STREAM_BATCH_SIZE):
+    # Yields lists of row mappings from a server-side cursor, so memory is bounded by batch_size
+    model, query = build_query(db, query_type, parameters)
+    result = db.execute(query.order_by(model.id).execution_options(stream_results=True))
+    try:
+        for partition in result.partitions(batch_size):
+            yield [row._mapping for row in partition]
+    finally:
+        result.close()
+
+
+def _ndjson(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(row)) + '\n' for row in batch)
+
+
+def _csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([list(row.values()) for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream(query_type, parameters=None, fmt='ndjson', batch_size=STREAM_BATCH_SIZE):
+    # Text chunks of the whole result; the generator owns its session for as long as it is consumed
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    with SessionLocal() as db:
+        # Validate before the first chunk so bad parameters fail the request instead of the stream
+        model, _ = build_query(db, query_type, parameters)
+    return _stream(query_type, parameters, fmt, batch_size, [column.name for column in model.__table__.columns])
+
+
+def _stream(query_type, parameters, fmt, batch_size, columns):
+    with SessionLocal() as db:
+        batches = iter_rows(db, query_type, parameters, batch_size)
+        yield from (_ndjson(batches) if fmt == 'ndjson' else _csv(batches, columns))
@@ -0,0 +1,169 @@
+import io
+import logging
+import math
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# Rows held in memory before they are sent to the database
+DEFAULT_BUFFER_ROWS = 20000
+
+
+def _copy_value(value):
+    # Postgres COPY text format: \N is NULL, and backslash/tab/newline must be escaped
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+
+class CopyBackend:
+    # Streams rows through COPY ... FROM STDIN on the session's psycopg2 connection
+    name = 'copy'
+
+    def __init__(self, db: Session, table, columns, conflict_columns=None):
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.conflict_columns = conflict_columns
+        # COPY bypasses SQLAlchemy's parameter processing, e.g. CodedString's string -> code encoding
+        dialect = db.get_bind().dialect
+        self.processors = [table.c[col].type.bind_processor(dialect) for col in columns]
+        if conflict_columns:
+            # COPY cannot resolve conflicts, so rows land in a temp table and are merged with ON CONFLICT
+            self.name = 'copy+upsert'
+            self.staging = f"{table.name}_staging"
+            self.sql = f"COPY {self.staging} ({', '.join(columns)}) FROM STDIN"
+        else:
+            self.sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN"
+
+    def _copy(self, rows):
+        buffer = io.StringIO()
+        processors = self.processors if any(self.processors) else None
+        for row in rows:
+            if processors:
+                row = [value if process is None else process(value) for process, value in zip(processors, row)]
+            buffer.write('\t'.join([_copy_value(value) for value in row]))
+            buffer.write('\n')
+        buffer.seek(0)
+        # The DBAPI connection is the one bound to the session, so COPY joins its transaction
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(self.sql, buffer)
+        finally:
+            cursor.close()
+
+    def _merge(self):
+        columns = ', '.join(self.columns)
+        keys = ', '.join(self.conflict_columns)
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in self.columns if col not in self.conflict_columns)
+        # DISTINCT ON keeps the last copy of a key repeated within the batch, as the executemany path does
+        self.db.execute(text(
+            f"INSERT INTO {self.table.name} ({columns}) "
+            f"SELECT DISTINCT ON ({keys}) {columns} FROM {self.staging} ORDER BY {keys}, ctid DESC "
+            f"ON CONFLICT ({keys}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+        ))
+        self.db.execute(text(f"TRUNCATE {self.staging}"))
+
+    def send(self, rows):
+        if not self.conflict_columns:
+            self._copy(rows)
+            return
+        staging_columns = ', '.join(col.name for col in self.table.columns if not col.primary_key)
+        self.db.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {self.staging} ON COMMIT DELETE ROWS AS "
+            f"SELECT {staging_columns} FROM {self.table.name} WITH NO DATA"
+        ))
+        self._copy(rows)
+        self._merge()
+
+
+class ExecuteManyBackend:
+    # Portable fallback (SQLite in tests); psycopg2 turns this into execute_values batches
+    name = 'executemany'
+
+    def __init__(self, db: Session, table, columns, conflict_columns=None):
+        self.db = db
+        self.columns = columns
+        self.statement = table.insert()
+        if conflict_columns:
+            self.name = 'executemany+upsert'
+            insert = _dialect_insert(db)(table)
+            updates = {col: insert.excluded[col] for col in columns if col not in conflict_columns}
+            if updates:
+                self.statement = insert.on_conflict_do_update(index_elements=list(conflict_columns), set_=updates)
+            else:
+                self.statement = insert.on_conflict_do_nothing(index_elements=list(conflict_columns))
+
+    def send(self, rows):
+        self.db.execute(self.statement, [dict(zip(self.columns, row)) for row in rows])
+
+
+def _dialect_insert(db: Session):
+    return postgresql.insert if db.get_bind().dialect.name == 'postgresql' else sqlite.insert
+
+
+def backend_for(db: Session):
+    return CopyBackend if db.get_bind().dialect.name == 'postgresql' else ExecuteManyBackend
+
+
+class RecordWriter:
+    """Buffered writer for one table; rows are flushed every buffer_rows rows.
+
+    With conflict_columns, rows whose key already exists replace the stored row
+    (INSERT ... ON CONFLICT DO UPDATE) instead of being added next to it.
+    Nothing is committed here: all flushes run inside the caller's transaction.
+    """
+
+    def __init__(self, db: Session, model, columns, buffer_rows=DEFAULT_BUFFER_ROWS, backend=None, conflict_columns=None,
+                 table=None):
+        # table overrides model.__table__, e.g. to write straight into one partition
+        self.columns = list(columns)
+        self.buffer_rows = buffer_rows
+        self.backend = (backend or backend_for(db))(db, model.__table__ if table is None else table, self.columns, conflict_columns)
+        self.rows = []
+        self.written = 0
+
+    def write(self, records):
+        # records is an iterable of dicts keyed by column name
+        for record in records:
+            self.rows.append(tuple(record[col] for col in self.columns))
+            if len(self.rows) >= self.buffer_rows:
+                self.flush()
+
+    def write_frame(self, frame):
+        # Column-wise conversion avoids building a dict per row
+        values = [frame[col].tolist() for col in self.columns]
+        for start in range(0, len(frame), self.buffer_rows):
+            self.rows.extend(zip(*(column[start:start + self.buffer_rows] for column in values)))
+            if len(self.rows) >= self.buffer_rows:
+                self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.backend.send(self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+def write_records(db: Session, model, records, buffer_rows=DEFAULT_BUFFER_ROWS, backend=None, conflict_columns=None):
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
+    with RecordWriter(db, model, first.keys(), buffer_rows, backend, conflict_columns) as writer:
+        writer.write([first])
+        writer.write(records)
+    logging.getLogger('werkzeug').info(f"Wrote {writer.written} rows to {model.__tablename__} via {writer.backend.name}")
+    return writer.written
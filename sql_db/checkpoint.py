@@ -0,0 +1,169 @@
+import itertools
+import logging
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from . import crud, cube, generation, geo, metrics, models, partitions, profiles, ranking, search, trends
+from .file_cache import file_hash
+from .process_csv_file import CATEGORY_MODELS, DEFAULT_CHUNK_ROWS, iter_admission_chunks, write_admission_chunks
+from .resolver import HighSchoolResolver
+
+
+class IngestionCancelled(Exception):
+    # Raised from on_chunk to stop a file: its transaction is rolled back and its previous checkpoint kept as it was
+    pass
+
+
+def is_unchanged(is_added_to_db, stored_hash, content_hash):
+    # Files added before checkpoints existed have no hash; they are trusted as they are
+    return bool(is_added_to_db) and stored_hash in (None, content_hash)
+
+
+def file_info(file: models.File):
+    # Plain dict so the file can be handed to a worker process
+    return {
+        'id': file.id,
+        'location': file.location,
+        'category': file.category.value if file.category else None,
+        'uc_campus_id': file.uc_campus_id,
+        'year': file.year,
+        'high_school_type': file.high_school_type.value if file.high_school_type else None,
+        'is_added_to_db': file.is_added_to_db,
+        'content_hash': file.content_hash,
+    }
+
+
+def commit_file(db: Session, info, chunks, content_hash, resolver, on_chunk=None):
+    # Replaces the file's previous rows, writes the new ones and sets the checkpoint in one transaction.
+    # chunks yields (schools, records, CSV rows): [parse_admission_file(...)] or iter_admission_chunks(...).
+    # Returns (CSV rows, rows written, ids of the schools the old or new version of the file covers)
+    model = CATEGORY_MODELS[info['category'].upper()]
+    try:
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is not None:
+            # Schools first: a shared resolver may commit them on its own connection.
+            # Such resolvers (the scheduler's) are only given whole files, as a single chunk
+            resolver.resolve(first[0])
+        # Before the session reads the table: creating a missing year partition needs the parent table to itself
+        table = partitions.route(db, model, info['year'])
+        # Stored profiles of every school the old or new version of the file covers go stale together with its rows
+        old_ids = {row[0] for row in db.execute(select(model.high_school_id).where(model.file_id == info['id']).distinct())}
+        deleted = db.query(model).filter(model.file_id == info['id']).delete(synchronize_session=False)
+        if deleted:
+            logging.getLogger('werkzeug').info(f"Replacing {deleted} rows from a previous version of {info['location']}")
+        chunks = itertools.chain([first] if first is not None else [], chunks)
+        row_count, written, high_school_ids = write_admission_chunks(
+            db, ((schools, records.assign(file_id=info['id']), rows) for schools, records, rows in chunks),
+            info['category'], resolver, on_chunk, table)
+        high_school_ids |= old_ids
+        profiles.discard_profiles(db, list(high_school_ids))
+        db.query(models.File).filter_by(id=info['id']).update({
+            'is_added_to_db': True,
+            'content_hash': content_hash,
+            'row_count': row_count,
+            'record_count': written,
+            'last_error': None,
+        })
+        # Last, so other writers wait on the generation row only while this one commits
+        generation.bump(db)
+        db.commit()
+        crud.invalidate_high_school_data(high_school_ids)
+        cube.invalidate_cube()
+        search.schools_inserted()
+    except IngestionCancelled:
+        db.rollback()
+        resolver.invalidate()
+        raise
+    except Exception as e:
+        db.rollback()
+        resolver.invalidate()
+        mark_failed(db, info['id'], e)
+        raise
+    return row_count, written, high_school_ids
+
+
+def mark_failed(db: Session, file_id, error):
+    db.query(models.File).filter_by(id=file_id).update({'is_added_to_db': False, 'last_error': str(error)})
+    db.commit()
+
+
+def ingest_file(db: Session, file: models.File, resolver: HighSchoolResolver = None, on_chunk=None,
+                chunksize: int = DEFAULT_CHUNK_ROWS):
+    # Returns {'status': 'skipped' | 'success', ...}; raises if the file could not be loaded.
+    # The file is streamed chunksize CSV rows at a time; on_chunk(rows, written) runs after each chunk
+    # and raising from it rolls the whole file back
+    info = file_info(file)
+    content_hash = file_hash(info['location'])
+    if is_unchanged(info['is_added_to_db'], info['content_hash'], content_hash):
+        if info['content_hash'] is None:
+            file.content_hash = content_hash
+            db.commit()
+        return {'status': 'skipped', 'file_id': info['id']}
+
+    chunks = iter_admission_chunks(info['location'], info['category'], info['uc_campus_id'], info['year'],
+                                   info['high_school_type'], chunksize, content_hash)
+    rows, written, high_school_ids = commit_file(db, info, chunks, content_hash, resolver or HighSchoolResolver(db), on_chunk)
+    metrics.refresh_metrics(db, metrics.touched_partitions([info]))
+    trends.refresh_trends(db, trends.touched_campuses([info]))
+    geo.refresh_geo_rollups(db, geo.touched_partitions([info]))
+    ranking.refresh_rankings(db, [(info['uc_campus_id'], info['year'])])
+    profiles.refresh_profiles(db, high_school_ids)
+    return {'status': 'success', 'file_id': info['id'], 'rows': rows, 'records': written}
+
+
+def reload_year(db: Session, category, year, resolver: HighSchoolResolver = None, chunksize: int = DEFAULT_CHUNK_ROWS):
+    # Replaces everything stored for one category and academic year with the contents of that year's registered files,
+    # changed or not. On a partitioned table the files are loaded into a new table that is swapped in for the
+    # year's partition; elsewhere the year's rows are deleted first. Either way it is one transaction
+    model = CATEGORY_MODELS[category.upper()]
+    files = db.query(models.File).filter(models.File.category == models.Category[category.upper()],
+                                         models.File.year == year).order_by(models.File.id).all()
+    infos = [file_info(file) for file in files]
+    resolver = resolver or HighSchoolResolver(db)
+    swap = partitions.create_swap_table(db, model, year) if partitions.is_partitioned(db, model) else None
+    try:
+        old_rows = db.execute(select(model.high_school_id, model.uc_campus_id).where(model.academic_year == year).distinct()).all()
+        old_ids = {high_school_id for high_school_id, _ in old_rows}
+        if swap is None:
+            db.execute(delete(model).where(model.academic_year == year))
+        high_school_ids, results = set(), []
+        for info in infos:
+            content_hash = file_hash(info['location'])
+            chunks = iter_admission_chunks(info['location'], info['category'], info['uc_campus_id'], info['year'],
+                                           info['high_school_type'], chunksize, content_hash)
+            row_count, written, ids = write_admission_chunks(
+                db, ((schools, records.assign(file_id=info['id']), rows) for schools, records, rows in chunks),
+                info['category'], resolver, table=swap)
+            high_school_ids.update(ids)
+            db.query(models.File).filter_by(id=info['id']).update({
+                'is_added_to_db': True,
+                'content_hash': content_hash,
+                'row_count': row_count,
+                'record_count': written,
+                'last_error': None,
+            })
+            results.append({'file_id': info['id'], 'rows': row_count, 'records': written})
+        if swap is not None:
+            partitions.swap_partition(db, model, year, swap)
+        profiles.discard_profiles(db, list(old_ids | high_school_ids))
+        generation.bump(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        resolver.invalidate()
+        raise
+    logging.getLogger('werkzeug').info(
+        f"Reloaded {model.__tablename__} for {year} from {len(infos)} files" + (" by partition swap" if swap is not None else ""))
+    crud.invalidate_high_school_data(old_ids | high_school_ids)
+    cube.invalidate_cube()
+    search.schools_inserted()
+    # Campuses that only had rows in the old version of the year count too
+    touched = infos + [{'category': category, 'uc_campus_id': uc_campus_id, 'year': year} for _, uc_campus_id in old_rows]
+    metrics.refresh_metrics(db, metrics.touched_partitions(touched))
+    trends.refresh_trends(db, trends.touched_campuses(touched))
+    geo.refresh_geo_rollups(db, geo.touched_partitions(touched))
+    ranking.refresh_rankings(db, {(info['uc_campus_id'], year) for info in touched if info['uc_campus_id'] is not None})
+    profiles.refresh_profiles(db, old_ids | high_school_ids)
+    return {'category': category.upper(), 'year': year, 'swapped': swap is not None, 'files': results}
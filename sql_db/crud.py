@@ -1,13 +1,15 @@
 from sqlalchemy.orm import Session
-from . import models
+from . import models, bulk_load, admission_query, discovery, generation, search
 import pandas as pd
-import os
 from flask import current_app
 import logging
 from sqlalchemy import select
 from sqlalchemy.exc import PendingRollbackError
-from sqlalchemy import and_
-import re
+from sqlalchemy import and_, cast, func, literal, null, union_all, Integer, String, Float
+from .cache import LRUTTLCache
+from .transform import ETHNICITY_COLUMNS
+
+ETHNICITY_COLUMN_NAMES = dict(ETHNICITY_COLUMNS)
 
 
 def create_or_update_high_school(db: Session, high_school_data):
@@ -36,9 +38,21 @@ def create_uc_admission_gender(db: Session, admission_data):
     db.refresh(admission)
     return admission
 
+def _set_ethnicity_count(db: Session, ethnicity_data):
+    # One long-format (ethnicity, count) record becomes one column of the school's compact row
+    data = dict(ethnicity_data)
+    column = ETHNICITY_COLUMN_NAMES[data.pop('ethnicity')]
+    count = data.pop('count')
+    key = {name: data[name] for name in models.UCAdmissionEthnicityCounts.natural_key}
+    row = db.query(models.UCAdmissionEthnicityCounts).filter_by(**key).first()
+    if row is None:
+        row = models.UCAdmissionEthnicityCounts(**data)
+        db.add(row)
+    setattr(row, column, count)
+    return row
+
 def create_uc_admission_ethnicity(db: Session, ethnicity_data):
-    ethnicity = models.UCAdmissionEthnicity(**ethnicity_data)
-    db.add(ethnicity)
+    ethnicity = _set_ethnicity_count(db, ethnicity_data)
     db.commit()
     db.refresh(ethnicity)
     return ethnicity
@@ -51,14 +65,11 @@ def create_uc_admission_gpa(db: Session, gpa_data):
     return gpa
 
 def query_database(db: Session, query_type, parameters):
-    if query_type == 'admissions':
-        return db.query(models.UCAdmissionGender).all()
-    elif query_type == 'ethnicity':
-        return db.query(models.UCAdmissionEthnicity).all()
-    elif query_type == 'gpa':
-        return db.query(models.UCAdmissionGPA).all()
-    else:
-        return "Invalid query type"
+    # One keyset page of filtered admission rows; parameters may carry 'after' and 'limit'
+    parameters = dict(parameters or {})
+    after = parameters.pop('after', None)
+    limit = parameters.pop('limit', admission_query.DEFAULT_PAGE_SIZE)
+    return admission_query.fetch_page(db, query_type, parameters, after, limit)
 
 def seed_uc_campuses(db: Session):
     campuses = [
@@ -83,112 +94,14 @@ def seed_uc_campuses(db: Session):
     db.commit()
 
 def add_files_to_db(db: Session, files_directory: str):
-    logging.getLogger('werkzeug').info("Adding files to database")  # This will be visible in Docker logs
-    logging.getLogger('werkzeug').info(f"Files directory: {files_directory}")  # This will be visible in Docker logs
-
-    for root, _, files in os.walk(files_directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            location = os.path.abspath(file_path)
-            
-            # Extract information from filename
-            category = None
-            if 'Eth' in file:
-                category = models.Category.ETHNICITY
-            elif 'GPA' in file:
-                category = models.Category.GPA
-            elif 'Gdr' in file:
-                category = models.Category.GENDER
-
-            # Extract the last 4 digits from the filename
-            year = re.search(r'\d{4}(?=\.csv$)', file)
-            if year:
-                year = int(year.group())
-                print(f"Extracted year: {year}")
-            else:
-                print("Year not found in the filename")
-
-
-
-            high_school_type = None
-            if 'CA Public' in file:
-                high_school_type = models.HighSchoolType.CA_PUBLIC
-            elif 'CA Private' in file:
-                high_school_type = models.HighSchoolType.CA_PRIVATE
-            elif 'Foreign' in file:
-                high_school_type = models.HighSchoolType.FOREIGN
-            elif 'non-CA' in file:
-                high_school_type = models.HighSchoolType.NON_CA
-            else:
-                high_school_type = models.HighSchoolType.ALL
-
-            uc_campus_name = None
-            if 'Berkeley' in file:
-                uc_campus_name = 'Berkeley'
-            elif 'LA' in file:
-                uc_campus_name = 'Los Angeles'
-            elif 'Davis' in file:
-                uc_campus_name = 'Davis'
-            elif 'Irvine' in file:
-                uc_campus_name = 'Irvine'
-            elif 'UCSB' in file:
-                uc_campus_name = 'Santa Barbara'
-            elif 'UCSC' in file:
-                uc_campus_name = 'Santa Cruz'
-            elif 'Riverside' in file:
-                uc_campus_name = 'Riverside'
-            elif 'Merced' in file:
-                uc_campus_name = 'Merced'
-            elif 'UCSD' in file:
-                uc_campus_name = 'San Diego'
-            elif 'San Francisco' in file:
-                uc_campus_name = 'San Francisco'
-
-            uc_campus = get_uc_campus_by_name(db, uc_campus_name) if uc_campus_name else None
-            
-            # Print extracted information
-            logging.getLogger('werkzeug').info(f"File: {file}")
-            logging.getLogger('werkzeug').info(f"  Location: {location}")
-            logging.getLogger('werkzeug').info(f"  Category: {category}")
-            logging.getLogger('werkzeug').info(f"  Year: {year}")
-            logging.getLogger('werkzeug').info(f"  High School Type: {high_school_type}")
-            logging.getLogger('werkzeug').info(f"  UC Campus: {uc_campus_name}")
-            logging.getLogger('werkzeug').info("---")
-
-            # Check if file already exists in the database
-            existing_file = db.query(models.File).filter_by(location=location).first()
-            if not existing_file:
-                new_file = models.File(
-                    location=location,
-                    high_school_type=high_school_type,
-                    uc_campus_id=uc_campus.id if uc_campus else None,
-                    category=category,
-                    year=year
-                )
-                db.add(new_file)
-    
-    db.commit()
+    # Registers files not yet in the files table with one query for known locations and one insert
+    return discovery.add_new_files(db, files_directory)
 
 def get_high_school_by_name_and_city(db: Session, school_name: str, city: str):
-    # First, try to find schools by name (case insensitive)
-    schools = db.query(models.HighSchool).filter(
-        models.HighSchool.school_name.ilike(f"%{school_name}%")
-    ).all()
-    
-    # If city is empty or None, return all matching schools
-    if not city:
-        return schools
-    
-    # If only one school is found, return it
-    if len(schools) == 1:
-        return schools[0]
-    
-    # If multiple schools are found, use city to find a match (case insensitive)
-    elif len(schools) > 1:
-        return next((school for school in schools if school.city.lower() == city.lower()), None)
-    
-    # If no schools are found, return None
-    return None
+    # Best match of search.search_high_schools (substring matches first, then trigram similarity), in the given
+    # city when there is one. Always a single HighSchool or None
+    matches = search.search_high_schools(db, school_name, city=city or None, limit=1)
+    return matches[0][0] if matches else None
 
 def create_high_school(db: Session, school_data: dict):
     db_school = models.HighSchool(**school_data)
@@ -197,8 +110,7 @@ def create_high_school(db: Session, school_data: dict):
     return db_school
 
 def create_uc_admission_ethnicity(db: Session, ethnicity_data: dict):
-    db_ethnicity = models.UCAdmissionEthnicity(**ethnicity_data)
-    db.add(db_ethnicity)
+    db_ethnicity = _set_ethnicity_count(db, ethnicity_data)
     db.flush()
     return db_ethnicity
 
@@ -206,135 +118,212 @@ def get_high_school_by_uc_school_name(db: Session, uc_school_name: str):
     return db.query(models.HighSchool).filter(models.HighSchool.uc_school_name == uc_school_name).first()
 
 def bulk_create_uc_admission_ethnicity(db: Session, ethnicity_data_list: list):
-    db.bulk_insert_mappings(models.UCAdmissionEthnicity, ethnicity_data_list)
+    bulk_load.write_records(db, models.UCAdmissionEthnicityCounts, ethnicity_data_list,
+                            conflict_columns=models.UCAdmissionEthnicityCounts.natural_key)
+    # Nothing here refreshes this process' copies, so they reload like after an ingestion elsewhere
+    generation.bump(db, refreshed=False)
     db.commit()
 
 def bulk_create_uc_admission_gender(db: Session, gender_data_list: list):
-    db.bulk_insert_mappings(models.UCAdmissionGender, gender_data_list)
+    bulk_load.write_records(db, models.UCAdmissionGender, gender_data_list,
+                            conflict_columns=models.UCAdmissionGender.natural_key)
+    generation.bump(db, refreshed=False)
     db.commit()
 
 def bulk_create_uc_admission_gpa(db: Session, gpa_data_list: list):
-    db.bulk_insert_mappings(models.UCAdmissionGPA, gpa_data_list)
+    bulk_load.write_records(db, models.UCAdmissionGPA, gpa_data_list,
+                            conflict_columns=models.UCAdmissionGPA.natural_key)
+    generation.bump(db, refreshed=False)
     db.commit()
 
 
 def get_files_as_dataframe(db: Session):
     return pd.read_sql(select(models.File), db.bind)
 
-def get_high_school_data(db: Session, school_name: str, city: str):
-    # First, get the high school
-    high_school = get_high_school_by_name_and_city(db, school_name, city)
-    
-    if not high_school:
-        return None  # High school not found
-    
-    # Query data from all three tables
-    ethnicity_data = db.query(models.UCAdmissionEthnicity).filter(
-        models.UCAdmissionEthnicity.high_school_id == high_school.id
-    ).all()
-    
-    gender_data = db.query(models.UCAdmissionGender).filter(
-        models.UCAdmissionGender.high_school_id == high_school.id
-    ).all()
-    
-    gpa_data = db.query(models.UCAdmissionGPA).filter(
-        models.UCAdmissionGPA.high_school_id == high_school.id
-    ).all()
-    
+# Profiles keyed by (high_school_id, academic_year); ingestion invalidates the schools it touches
+high_school_data_cache = LRUTTLCache(maxsize=4096, ttl=600)
 
+# uc_campuses is tiny and static, so id -> name is loaded once per process
+_campus_names = {}
 
-    # Prepare the result dictionary
-    result = {
-        "high_school": {
-            "id": high_school.id,
-            "uc_school_name": high_school.uc_school_name,
-            "school_name": high_school.school_name,
-            "city": high_school.city,
-            "county": high_school.county,
-            "state": high_school.state,
-            "country": high_school.country,
-            "is_public": high_school.is_public
-        },
-        "ethnicity_data": [],
-        "gender_data": [],
-        "gpa_data": []
-    }
-    
-    # Add ethnicity data
-    for entry in ethnicity_data:
-        result["ethnicity_data"].append({
-            "uc_campus_id": entry.uc_campus_id,
-            "academic_year": entry.academic_year,
-            "admission_type": entry.admission_type,
-            "ethnicity": entry.ethnicity,
-            "count": entry.count
-        })
-    
-    # Add gender data
-    for entry in gender_data:
-        result["gender_data"].append({
-            "uc_campus_id": entry.uc_campus_id,
-            "academic_year": entry.academic_year,
-            "admission_type": entry.admission_type,
-            "total_applicants": entry.total_applicants,
-            "female_applicants": entry.female_applicants,
-            "male_applicants": entry.male_applicants,
-            "other_applicants": entry.other_applicants,
-            "unknown_gender": entry.unknown_gender
-        })
-    
-    # Add GPA data
-    for entry in gpa_data:
-        result["gpa_data"].append({
-            "uc_campus_id": entry.uc_campus_id,
-            "academic_year": entry.academic_year,
-            "admission_type": entry.admission_type,
-            "mean_gpa": entry.mean_gpa
-        })
+ETHNICITY_ROWS, GENDER_ROWS, GPA_ROWS = 0, 1, 2
+
+GENDER_FIELDS = ['total_applicants', 'male_applicants', 'female_applicants', 'other_applicants', 'unknown_gender']
+
+
+def get_campus_names(db: Session, refresh: bool = False):
+    if refresh or not _campus_names:
+        _campus_names.clear()
+        _campus_names.update(dict(db.query(models.UCCampus.id, models.UCCampus.campus_name).all()))
+    return _campus_names
 
 
+def _check_high_school_data(db: Session):
+    # Ingestion in another process cannot invalidate this cache directly; it bumps the data generation instead
+    if generation.changed(db, 'high_school_data'):
+        high_school_data_cache.invalidate()
 
 
-    # Generate nested dictionary
-    nested_result = {
-        "high_school": result["high_school"]
+def invalidate_high_school_data(high_school_ids=None):
+    if high_school_ids is None:
+        high_school_data_cache.invalidate()
+    else:
+        high_school_ids = set(high_school_ids)
+        high_school_data_cache.invalidate(lambda key: key[0] in high_school_ids)
+    generation.record('high_school_data')
+
+
+def _high_school_data_query(high_school_ids, academic_year=None):
+    # One UNION ALL over the three admission tables, padded to a common set of columns
+    E, G, P = models.UCAdmissionEthnicity, models.UCAdmissionGender, models.UCAdmissionGPA
+    null_int, null_str, null_float = cast(null(), Integer), cast(null(), String), cast(null(), Float)
+
+    def admission_select(model, kind, *columns):
+        stmt = select(
+            literal(kind).label('kind'), model.id, model.high_school_id, model.uc_campus_id,
+            model.academic_year, model.admission_type, *columns,
+        ).where(model.high_school_id.in_(high_school_ids))
+        if academic_year is not None:
+            stmt = stmt.where(model.academic_year == academic_year)
+        return stmt
+
+    union = union_all(
+        admission_select(E, ETHNICITY_ROWS, E.ethnicity, E.count, *[null_int.label(f) for f in GENDER_FIELDS], null_float.label('mean_gpa')),
+        admission_select(G, GENDER_ROWS, null_str.label('ethnicity'), null_int.label('count'), *[getattr(G, f) for f in GENDER_FIELDS], null_float.label('mean_gpa')),
+        admission_select(P, GPA_ROWS, null_str.label('ethnicity'), null_int.label('count'), *[null_int.label(f) for f in GENDER_FIELDS], P.mean_gpa),
+    ).subquery()
+    # Same precedence as before: ethnicity rows, then gender, then GPA, each in insertion order
+    return select(union).order_by(union.c.kind, union.c.id)
+
+
+def _high_school_summary(high_school):
+    return {
+        "id": high_school.id,
+        "uc_school_name": high_school.uc_school_name,
+        "school_name": high_school.school_name,
+        "city": high_school.city,
+        "county": high_school.county,
+        "state": high_school.state,
+        "country": high_school.country,
+        "is_public": high_school.is_public
     }
 
-    # Get unique UC campus IDs
-    uc_campus_ids = set([entry["uc_campus_id"] for entry in result["ethnicity_data"] + result["gender_data"] + result["gpa_data"]])
-
-    # Create nested structure for each UC campus
-    for campus_id in uc_campus_ids:
-        campus_name = db.query(models.UCCampus).filter_by(id=campus_id).first().campus_name
-        nested_result[campus_name] = {
-            "App": {},
-            "Adm": {},
-            "Enr": {}
-        }
-
-        # Add ethnicity data
-        for entry in result["ethnicity_data"]:
-            if entry["uc_campus_id"] == campus_id:
-                nested_result[campus_name][entry["admission_type"]][entry["ethnicity"]] = entry["count"]
-
-        # Add gender data
-        for entry in result["gender_data"]:
-            if entry["uc_campus_id"] == campus_id:
-                nested_result[campus_name][entry["admission_type"]].update({
-                    "total_applicants": entry["total_applicants"] if entry["total_applicants"] is not None else None,
-                    "male_applicants": entry["male_applicants"] if entry["male_applicants"] is not None else None,
-                    "female_applicants": entry["female_applicants"] if entry["female_applicants"] is not None else None,
-                    "other_applicants": entry["other_applicants"] if entry["other_applicants"] is not None else None,
-                    "unknown_gender": entry["unknown_gender"] if entry["unknown_gender"] is not None else None
-                })
-
-        # Add GPA data
-        for entry in result["gpa_data"]:
-            if entry["uc_campus_id"] == campus_id:
-                nested_result[campus_name][entry["admission_type"]]["Mean GPA"] = entry["mean_gpa"]
 
+def _nest_high_school_data_many(db: Session, summaries, rows):
+    # Single pass over rows of many schools: nested[high_school_id][campus_name][admission_type][...]
+    campus_names = get_campus_names(db)
+    nested = {high_school_id: {"high_school": summary} for high_school_id, summary in summaries.items()}
+    # Positional unpacking: attribute access on each Row dominates for thousands of schools
+    for kind, _, high_school_id, uc_campus_id, _, admission_type, ethnicity, count, *values in rows:
+        if uc_campus_id not in campus_names:
+            campus_names = get_campus_names(db, refresh=True)
+        campus = nested[high_school_id].setdefault(campus_names[uc_campus_id], {"App": {}, "Adm": {}, "Enr": {}})
+        entry = campus[admission_type]
+        if kind == ETHNICITY_ROWS:
+            entry[ethnicity] = count
+        elif kind == GENDER_ROWS:
+            entry.update(zip(GENDER_FIELDS, values))
+        else:
+            entry["Mean GPA"] = values[-1]
+    return nested
+
+
+def _nest_high_school_data(db: Session, high_school_summary, rows):
+    return _nest_high_school_data_many(db, {high_school_summary["id"]: high_school_summary}, rows)[high_school_summary["id"]]
+
+
+def get_high_school_data_by_id(db: Session, high_school_id: int, academic_year: int = None):
+    key = (high_school_id, academic_year)
+    _check_high_school_data(db)
+    nested_result = high_school_data_cache.get(key)
+    if nested_result is not None:
+        return nested_result
+
+    high_school = db.query(models.HighSchool).filter(models.HighSchool.id == high_school_id).first()
+    if not high_school:
+        return None  # High school not found
+
+    rows = db.execute(_high_school_data_query([high_school_id], academic_year)).all()
+    nested_result = _nest_high_school_data(db, _high_school_summary(high_school), rows)
+    high_school_data_cache.set(key, nested_result)
     return nested_result
 
 
+def get_high_school_data(db: Session, school_name: str, city: str, academic_year: int = None):
+    # First, get the high school
+    high_school = get_high_school_by_name_and_city(db, school_name, city)
 
+    if not high_school:
+        return None  # High school not found
 
+    return get_high_school_data_by_id(db, high_school.id, academic_year)
+
+
+# Schools per IN (...) query when fetching profiles in bulk
+HIGH_SCHOOL_DATA_CHUNK_SIZE = 500
+
+
+def resolve_high_school_names(db: Session, names):
+    # {name or (name, city): high_school_id} by case-insensitive school_name match; lowest id wins on ties
+    keys = [tuple(name) if isinstance(name, (list, tuple)) else name for name in names]
+    if not keys:
+        return {}
+    lowered = {(key[0] if isinstance(key, tuple) else key).lower() for key in keys}
+    candidates = {}
+    for school_id, school_name, city in db.query(models.HighSchool.id, models.HighSchool.school_name, models.HighSchool.city).filter(
+            func.lower(models.HighSchool.school_name).in_(lowered)).order_by(models.HighSchool.id):
+        candidates.setdefault(school_name.lower(), []).append((school_id, (city or '').lower()))
+    resolved = {}
+    for key in keys:
+        name, city = key if isinstance(key, tuple) else (key, None)
+        matches = [school_id for school_id, school_city in candidates.get(name.lower(), []) if not city or school_city == city.lower()]
+        resolved[key] = matches[0] if matches else None
+    return resolved
+
+
+def build_high_school_data(db: Session, high_school_ids, academic_year: int = None):
+    # {high_school_id: nested profile} straight from the admission tables, one UNION ALL per chunk; bypasses the cache
+    high_school_ids = list(high_school_ids)
+    result = {}
+    for start in range(0, len(high_school_ids), HIGH_SCHOOL_DATA_CHUNK_SIZE):
+        chunk = high_school_ids[start:start + HIGH_SCHOOL_DATA_CHUNK_SIZE]
+        summaries = {school.id: _high_school_summary(school)
+                     for school in db.query(models.HighSchool).filter(models.HighSchool.id.in_(chunk))}
+        if summaries:
+            rows = db.execute(_high_school_data_query(list(summaries), academic_year)).all()
+            result.update(_nest_high_school_data_many(db, summaries, rows))
+    return result
+
+
+def _high_school_data_for_ids(db: Session, high_school_ids, academic_year: int = None):
+    # {high_school_id: nested profile}: cache hits first, then one build for the missing schools
+    result, missing = {}, []
+    _check_high_school_data(db)
+    for high_school_id in dict.fromkeys(high_school_ids):
+        cached = high_school_data_cache.get((high_school_id, academic_year))
+        if cached is not None:
+            result[high_school_id] = cached
+        else:
+            missing.append(high_school_id)
+
+    for high_school_id, nested_result in build_high_school_data(db, missing, academic_year).items():
+        high_school_data_cache.set((high_school_id, academic_year), nested_result)
+        result[high_school_id] = nested_result
+    return result
+
+
+def iter_high_school_data_many(db: Session, keys, academic_year: int = None, chunk_size: int = HIGH_SCHOOL_DATA_CHUNK_SIZE):
+    # keys mixes high school ids with names or (name, city) pairs.
+    # Yields (key, profile or None) in request order, one chunk of schools at a time
+    keys = [tuple(key) if isinstance(key, list) else key for key in keys]
+    resolved = resolve_high_school_names(db, [key for key in keys if isinstance(key, (str, tuple))])
+    for start in range(0, len(keys), chunk_size):
+        chunk = [(key, resolved[key] if isinstance(key, (str, tuple)) else key) for key in keys[start:start + chunk_size]]
+        profiles = _high_school_data_for_ids(db, [school_id for _, school_id in chunk if school_id is not None], academic_year)
+        for key, school_id in chunk:
+            yield key, profiles.get(school_id)
+
+
+def get_high_school_data_many(db: Session, high_school_ids=None, names=None, academic_year: int = None):
+    # Batch get_high_school_data_by_id / get_high_school_data: {requested key: same nested structure or None}
+    return dict(iter_high_school_data_many(db, list(high_school_ids or []) + list(names or []), academic_year))
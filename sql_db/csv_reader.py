@@ -0,0 +1,80 @@
+import codecs
+import io
+import logging
+
+import chardet
+import pandas as pd
+
+# Longest BOMs first so UTF-32 is not mistaken for UTF-16
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Bytes of the source file decoded at a time
+DECODE_BLOCK_SIZE = 1 << 20
+
+
+def detect_encoding(path, sample_size=10000):
+    # The admission exports are UTF-16LE with a BOM; only files without one fall back to chardet
+    with open(path, 'rb') as raw_file:
+        head = raw_file.read(4)
+        for bom, encoding in BOMS:
+            if head.startswith(bom):
+                return encoding
+        raw_file.seek(0)
+        result = chardet.detect(raw_file.read(sample_size))
+    logging.getLogger('werkzeug').info(f"No BOM in {path}, chardet guessed {result['encoding']}")
+    return result['encoding'] or 'utf-8'
+
+
+class Utf8Stream(io.RawIOBase):
+    """Binary stream that re-encodes a file to UTF-8 one block at a time.
+
+    pandas' C parser works on UTF-8 bytes, so feeding it this stream avoids
+    holding the whole decoded file in memory.
+    """
+
+    def __init__(self, raw, encoding, block_size=DECODE_BLOCK_SIZE):
+        self.raw = raw
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.block_size = block_size
+        # pending[offset:] is decoded but not read yet; slicing the read part off would copy the rest on every read
+        self.pending = b''
+        self.offset = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) - self.offset < len(buffer) and not self.eof:
+            block = self.raw.read(self.block_size)
+            self.eof = not block
+            # Only the unread tail (less than one read) is copied, once per decoded block
+            self.pending = self.pending[self.offset:] + self.decoder.decode(block, final=self.eof).encode('utf-8')
+            self.offset = 0
+        size = min(len(buffer), len(self.pending) - self.offset)
+        buffer[:size] = memoryview(self.pending)[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+
+def _read_chunks(path, encoding, chunksize, **kwargs):
+    with open(path, 'rb') as raw_file:
+        stream = io.BufferedReader(Utf8Stream(raw_file, encoding), DECODE_BLOCK_SIZE)
+        for chunk in pd.read_csv(stream, sep='\t', encoding='utf-8', chunksize=chunksize, **kwargs):
+            yield chunk
+
+
+def read_admission_csv(path, chunksize=None, encoding=None, **kwargs):
+    # Returns a DataFrame, or an iterator of DataFrames of at most chunksize rows
+    encoding = encoding or detect_encoding(path)
+    if chunksize is not None:
+        return _read_chunks(path, encoding, chunksize, **kwargs)
+    with open(path, 'rb') as raw_file:
+        stream = io.BufferedReader(Utf8Stream(raw_file, encoding), DECODE_BLOCK_SIZE)
+        return pd.read_csv(stream, sep='\t', encoding='utf-8', **kwargs)
@@ -0,0 +1,191 @@
+import threading
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import generation, models
+from .crud import GENDER_FIELDS
+from .transform import ADMISSION_TYPES, ETHNICITIES, ETHNICITY_COLUMNS
+
+
+def fetch_rows(db: Session, statement):
+    # Plain DBAPI tuples: building a Row object per fact would dominate the load time.
+    # Parameters are inlined, so statements must only carry trusted literals (ids, years)
+    sql = str(statement.compile(db.get_bind(), compile_kwargs={'literal_binds': True}))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(sql)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class Block:
+    """One admission table as a dense array over school x campus x year x admission_type x measure.
+
+    Axes are dictionary encoded: position i on the school axis is high_school_id schools[i].
+    mask marks the cells that have a row in the table; the others are missing or suppressed.
+    """
+
+    def __init__(self, schools, campuses, years, admission_types, measures, values, mask):
+        self.schools, self.campuses, self.years = schools, campuses, years
+        self.admission_types, self.measures = admission_types, measures
+        self.values, self.mask = values, mask
+        self._school_positions = {int(school_id): i for i, school_id in enumerate(schools)}
+
+    @classmethod
+    def from_rows(cls, rows, measures, dtype, measure_axis=None):
+        # rows: (high_school_id, uc_campus_id, academic_year, admission_type code, *values) tuples.
+        # With measure_axis, the 5th column names the measure (long format, e.g. ethnicity) and the 6th is the value
+        columns = list(zip(*rows)) if rows else [()] * (5 + len(measures))
+        schools, school_codes = np.unique(np.asarray(columns[0], dtype=np.int64), return_inverse=True)
+        campuses, campus_codes = np.unique(np.asarray(columns[1], dtype=np.int64), return_inverse=True)
+        years, year_codes = np.unique(np.asarray(columns[2], dtype=np.int64), return_inverse=True)
+        # admission_type arrives as its stored code, which is already the position in ADMISSION_TYPES
+        type_codes = np.asarray([-1 if t is None else t for t in columns[3]], dtype=np.int64)
+        known = type_codes >= 0
+
+        shape = (len(schools), len(campuses), len(years), len(ADMISSION_TYPES))
+        values = np.zeros(shape + (len(measures),), dtype=dtype)
+        if np.issubdtype(dtype, np.floating):
+            values[:] = np.nan
+        mask = np.zeros(shape + (len(measures),), dtype=bool)
+        cell = (school_codes[known], campus_codes[known], year_codes[known], type_codes[known])
+        if measure_axis is None:
+            for m in range(len(measures)):
+                column = np.asarray(columns[4 + m], dtype=np.float64)[known]
+                present = ~np.isnan(column)
+                index = tuple(axis[present] for axis in cell) + (m,)
+                values[index] = column[present]
+                mask[index] = True
+        else:
+            measure_positions = {measure: i for i, measure in enumerate(measures)}
+            measure_codes = np.asarray([measure_positions.get(m, -1) for m in columns[4]], dtype=np.int64)[known]
+            column = np.asarray(columns[5], dtype=np.float64)[known]
+            present = (measure_codes >= 0) & ~np.isnan(column)
+            index = tuple(axis[present] for axis in cell) + (measure_codes[present],)
+            values[index] = column[present]
+            mask[index] = True
+        return cls(schools, campuses, years, list(ADMISSION_TYPES), list(measures), values, mask)
+
+    def school_position(self, high_school_id):
+        return self._school_positions.get(int(high_school_id))
+
+    def measure(self, name, *index):
+        # Masked (school, campus, year, admission_type) array of one measure, optionally indexed first
+        m = self.measures.index(name)
+        values, mask = self.values[..., m], self.mask[..., m]
+        if index:
+            values, mask = values[index], mask[index]
+        return np.ma.MaskedArray(values, mask=~mask)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.mask.nbytes
+
+
+class AdmissionCube:
+    """In-memory copy of the three admission tables for cross-campus and multi-year analysis."""
+
+    def __init__(self, gender: Block, ethnicity: Block, gpa: Block):
+        self.gender, self.ethnicity, self.gpa = gender, ethnicity, gpa
+
+    @classmethod
+    def load(cls, db: Session):
+        G, E, P = models.UCAdmissionGender, models.UCAdmissionEthnicityCounts, models.UCAdmissionGPA
+
+        def rows(model, *columns):
+            return fetch_rows(db, select(model.high_school_id, model.uc_campus_id, model.academic_year, model.admission_type, *columns))
+
+        gender_rows = rows(G, *[getattr(G, field) for field in GENDER_FIELDS])
+        ethnicity_rows = rows(E, *[getattr(E, column) for _, column in ETHNICITY_COLUMNS])
+        gpa_rows = rows(P, P.mean_gpa)
+        return cls(
+            Block.from_rows(gender_rows, GENDER_FIELDS, np.int32),
+            Block.from_rows(ethnicity_rows, ETHNICITIES, np.int32),
+            Block.from_rows(gpa_rows, ['mean_gpa'], np.float32),
+        )
+
+    @property
+    def nbytes(self):
+        return self.gender.nbytes + self.ethnicity.nbytes + self.gpa.nbytes
+
+    def block_for(self, measure):
+        for block in (self.gender, self.ethnicity, self.gpa):
+            if measure in block.measures:
+                return block
+        raise ValueError(f"Unknown measure: {measure}")
+
+    def ethnicity_sum(self, include_all=False):
+        # Sum over ethnicities per (school, campus, year, admission_type); 'All' is itself a total
+        columns = [i for i, name in enumerate(self.ethnicity.measures) if include_all or name != 'All']
+        values = np.where(self.ethnicity.mask[..., columns], self.ethnicity.values[..., columns], 0)
+        return np.ma.MaskedArray(values.sum(axis=-1, dtype=np.int64), mask=~self.ethnicity.mask[..., columns].any(axis=-1))
+
+    def pivot(self, high_school_id, measure, admission_type='App'):
+        # campus x year masked array of one measure for one school, with the axis labels
+        block = self.block_for(measure)
+        position = block.school_position(high_school_id)
+        if position is None:
+            return block.campuses, block.years, np.ma.masked_all((len(block.campuses), len(block.years)))
+        return block.campuses, block.years, block.measure(measure, position, slice(None), slice(None), ADMISSION_TYPES.index(admission_type))
+
+    def top_schools(self, measure, n=10, admission_type='App', uc_campus_id=None, academic_year=None):
+        # [(high_school_id, value)] ranked by the measure: counts are summed and GPAs averaged
+        # over whichever of campus and year are not fixed
+        block = self.block_for(measure)
+        data = block.measure(measure, Ellipsis, ADMISSION_TYPES.index(admission_type))
+        for axis, value, labels in ((2, academic_year, block.years), (1, uc_campus_id, block.campuses)):
+            if value is None:
+                continue
+            positions = np.flatnonzero(labels == value)
+            if not len(positions):
+                return []
+            data = data.take(positions, axis=axis)
+        data = data.reshape(len(block.schools), -1)
+        scores = data.mean(axis=1) if np.issubdtype(block.values.dtype, np.floating) else data.sum(axis=1, dtype=np.int64)
+        scores = np.ma.MaskedArray(scores, mask=np.ma.getmaskarray(data).all(axis=1))
+
+        candidates = np.flatnonzero(~np.ma.getmaskarray(scores))
+        filled = scores.filled(0)[candidates].astype(np.float64)
+        if len(candidates) > n:
+            # Everything tied with the n-th value stays in, so ties are broken by id below
+            keep = filled >= np.partition(filled, len(filled) - n)[len(filled) - n]
+            candidates, filled = candidates[keep], filled[keep]
+        order = np.lexsort((block.schools[candidates], -filled))[:n]
+        if np.issubdtype(block.values.dtype, np.floating):
+            # float32 storage: round away the representation noise (GPAs have two decimals)
+            return [(int(block.schools[candidates[i]]), round(float(filled[i]), 4)) for i in order]
+        return [(int(block.schools[candidates[i]]), int(filled[i])) for i in order]
+
+
+def to_lists(values):
+    # Masked array -> nested lists with None for masked cells; float32 values rounded to 4 decimals
+    data = np.ma.getdata(values)
+    if np.issubdtype(data.dtype, np.floating):
+        data = np.round(data.astype(np.float64), 4)
+    return np.where(np.ma.getmaskarray(values), None, data.astype(object)).tolist()
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_cube(db: Session):
+    # Loaded on first use and again after ingestion, in this process or another one, changed the data
+    global _cube
+    stale = generation.changed(db, 'cube')
+    with _cube_lock:
+        if stale:
+            _cube = None
+        if _cube is None:
+            _cube = AdmissionCube.load(db)
+        return _cube
+
+
+def invalidate_cube():
+    global _cube
+    with _cube_lock:
+        _cube = None
+    generation.record('cube')
@@ -15,7 +15,9 @@ if database_url is None:
 print(f"Database URL: {database_url}")  # For debugging
 
 try:
-    engine = create_engine(database_url, pool_pre_ping=True)
+    # SQLite connections may be handed between the ingestion writer threads
+    connect_args = {'check_same_thread': False} if database_url.startswith('sqlite') else {}
+    engine = create_engine(database_url, pool_pre_ping=True, connect_args=connect_args)
     print("Engine created successfully")
 except Exception as e:
     print(f"Error creating engine: {str(e)}")
@@ -0,0 +1,175 @@
+import argparse
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Same precedence as the old chain of `in` checks: the first entry found in the name wins
+CATEGORY_TOKENS = [('Eth', models.Category.ETHNICITY), ('GPA', models.Category.GPA), ('Gdr', models.Category.GENDER)]
+HIGH_SCHOOL_TYPE_TOKENS = [
+    ('CA Public', models.HighSchoolType.CA_PUBLIC),
+    ('CA Private', models.HighSchoolType.CA_PRIVATE),
+    ('Foreign', models.HighSchoolType.FOREIGN),
+    ('non-CA', models.HighSchoolType.NON_CA),
+]
+CAMPUS_TOKENS = [
+    ('Berkeley', 'Berkeley'), ('LA', 'Los Angeles'), ('Davis', 'Davis'), ('Irvine', 'Irvine'),
+    ('UCSB', 'Santa Barbara'), ('UCSC', 'Santa Cruz'), ('Riverside', 'Riverside'), ('Merced', 'Merced'),
+    ('UCSD', 'San Diego'), ('San Francisco', 'San Francisco'),
+]
+
+
+def _alternation(tokens):
+    # Longest first so e.g. 'CA Private' is not cut short by a shorter token
+    return '|'.join(re.escape(token) for token, _ in sorted(tokens, key=lambda item: -len(item[0])))
+
+
+FILE_NAME_PATTERN = re.compile(
+    f"(?P<category>{_alternation(CATEGORY_TOKENS)})"
+    f"|(?P<high_school_type>{_alternation(HIGH_SCHOOL_TYPE_TOKENS)})"
+    f"|(?P<campus>{_alternation(CAMPUS_TOKENS)})"
+    r"|(?P<year>\d{4})(?=\.csv$)"
+)
+
+
+def _first(found, tokens):
+    for token, value in tokens:
+        if token in found:
+            return value
+    return None
+
+
+def parse_file_name(name):
+    # {'category', 'high_school_type', 'uc_campus_name', 'year'} from one scan of the file name
+    found = {'category': set(), 'high_school_type': set(), 'campus': set(), 'year': set()}
+    for match in FILE_NAME_PATTERN.finditer(name):
+        found[match.lastgroup].add(match.group())
+    return {
+        'category': _first(found['category'], CATEGORY_TOKENS),
+        'high_school_type': _first(found['high_school_type'], HIGH_SCHOOL_TYPE_TOKENS) or models.HighSchoolType.ALL,
+        'uc_campus_name': _first(found['campus'], CAMPUS_TOKENS),
+        'year': int(min(found['year'])) if found['year'] else None,
+    }
+
+
+def list_files(files_directory):
+    for root, _, files in os.walk(files_directory):
+        for file in files:
+            if file.lower().endswith('.csv'):
+                yield os.path.abspath(os.path.join(root, file))
+
+
+def register_files(db: Session, locations):
+    # Inserts the locations that are not in the files table yet; returns the new ones
+    locations = set(locations)
+    if not locations:
+        return []
+    known = set(db.execute(select(models.File.location)).scalars())
+    new_locations = sorted(locations - known)
+    if not new_locations:
+        return []
+    campus_ids = {name: campus_id for campus_id, name in db.query(models.UCCampus.id, models.UCCampus.campus_name)}
+    rows = []
+    for location in new_locations:
+        info = parse_file_name(os.path.basename(location))
+        if info['year'] is None:
+            logging.getLogger('werkzeug').warning(f"Year not found in the filename: {location}")
+        rows.append({
+            'location': location,
+            'category': info['category'],
+            'high_school_type': info['high_school_type'],
+            'uc_campus_id': campus_ids.get(info['uc_campus_name']),
+            'year': info['year'],
+            'is_added_to_db': False,
+        })
+    db.execute(models.File.__table__.insert(), rows)
+    db.commit()
+    return new_locations
+
+
+def add_new_files(db: Session, files_directory):
+    new_locations = register_files(db, list_files(files_directory))
+    logging.getLogger('werkzeug').info(f"Registered {len(new_locations)} new files from {files_directory}")
+    return new_locations
+
+
+class DirectoryWatcher:
+    """Polling watcher: only directories whose mtime changed since the last poll are listed again.
+
+    Creating, renaming or deleting a file updates its directory's mtime, so a
+    poll costs one stat per directory instead of a walk over every file.
+    """
+
+    def __init__(self, files_directory):
+        self.files_directory = files_directory
+        self.directory_mtimes = {}
+
+    def changed_files(self):
+        locations = []
+        for root, _, files in self._walk_changed(self.files_directory):
+            locations.extend(os.path.abspath(os.path.join(root, file)) for file in files if file.lower().endswith('.csv'))
+        return locations
+
+    def _walk_changed(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory)) if self.directory_mtimes.get(directory) != mtime else None
+        except OSError:
+            self.directory_mtimes.pop(directory, None)
+            return
+        if entries is None:
+            # Unchanged: its file list is the same, but subdirectories may have changed on their own
+            subdirectories = [path for path in self.directory_mtimes if os.path.dirname(path) == directory]
+            files = []
+        else:
+            self.directory_mtimes[directory] = mtime
+            subdirectories = [entry.path for entry in entries if entry.is_dir()]
+            files = [entry.name for entry in entries if entry.is_file()]
+        yield directory, subdirectories, files
+        for subdirectory in subdirectories:
+            yield from self._walk_changed(subdirectory)
+
+
+def watch(db: Session, files_directory, interval=2.0, on_new=None, max_polls=None):
+    # Registers files dropped into files_directory, checking every `interval` seconds
+    watcher = DirectoryWatcher(files_directory)
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        new_locations = register_files(db, watcher.changed_files())
+        if new_locations:
+            logging.getLogger('werkzeug').info(f"Registered {len(new_locations)} new files: {new_locations}")
+            if on_new is not None:
+                on_new(new_locations)
+        polls += 1
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+    from .file_cache import FILES_DIRECTORY
+
+    parser = argparse.ArgumentParser(description="Register new admission files in the files table")
+    parser.add_argument('--directory', default=FILES_DIRECTORY)
+    parser.add_argument('--watch', action='store_true', help="keep polling for new files")
+    parser.add_argument('--interval', type=float, default=2.0, help="seconds between polls in watch mode")
+    parser.add_argument('--ingest', action='store_true',
+                        help="ingest pending files after new ones are registered (one such process at a time)")
+    args = parser.parse_args()
+
+    def ingest(new_locations):
+        from .scheduler import run_pending_files
+        run_pending_files(include_added=False)
+
+    with SessionLocal() as db:
+        if args.watch:
+            watch(db, args.directory, args.interval, ingest if args.ingest else None)
+        else:
+            new_locations = add_new_files(db, args.directory)
+            print(f"Registered {len(new_locations)} new files")
+            if args.ingest and new_locations:
+                ingest(new_locations)
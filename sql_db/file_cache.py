@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .csv_reader import read_admission_csv
+
+FILES_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'handle-files', 'files')
+CACHE_DIRECTORY = os.getenv('UC_FILE_CACHE_DIR', os.path.join(os.path.dirname(FILES_DIRECTORY), 'cache'))
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Layout: <cache>/data/<content hash>.parquet holds the parsed file and
+# <cache>/index/<sha1 of path>.json records {path, size, mtime_ns, content_hash}.
+# One small index file per source file lets parallel workers update it without a shared lock.
+def _data_path(content_hash, cache_directory):
+    return os.path.join(cache_directory, 'data', f'{content_hash}.parquet')
+
+
+def _index_path(path, cache_directory):
+    return os.path.join(cache_directory, 'index', hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest() + '.json')
+
+
+def _tmp_path(target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return f'{target}.{os.getpid()}.tmp'
+
+
+def _write_atomic(target, write):
+    tmp = _tmp_path(target)
+    write(tmp)
+    os.replace(tmp, target)
+
+
+def _remove(path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def _write_json(target, entry):
+    with open(target, 'w') as f:
+        json.dump(entry, f)
+
+
+def _read_index(path, cache_directory):
+    try:
+        with open(_index_path(path, cache_directory)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def cached_hash(path, cache_directory=CACHE_DIRECTORY):
+    # Content hash of the file if its size and mtime still match the index, else None
+    stat = os.stat(path)
+    entry = _read_index(path, cache_directory)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['content_hash']
+    return None
+
+
+def is_cached(path, cache_directory=CACHE_DIRECTORY):
+    try:
+        content_hash = cached_hash(path, cache_directory)
+    except OSError:
+        return False
+    return content_hash is not None and os.path.exists(_data_path(content_hash, cache_directory))
+
+
+def _indexed_hash(path, cache_directory, content_hash=None):
+    # Content hash of the file, updating its index entry when the size or mtime changed. content_hash is the
+    # caller's own file_hash(path), if it already has one, so the file is not read twice
+    stat = os.stat(path)
+    indexed_hash = cached_hash(path, cache_directory)
+    if indexed_hash is not None and content_hash in (None, indexed_hash):
+        return indexed_hash
+    if content_hash is None:
+        # Size or mtime changed (or never seen): the content may still be cached under its hash
+        content_hash = file_hash(path)
+    entry = {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content_hash': content_hash,
+    }
+    _write_atomic(_index_path(path, cache_directory), lambda tmp: _write_json(tmp, entry))
+    return content_hash
+
+
+def read_cached(path, cache_directory=CACHE_DIRECTORY, content_hash=None):
+    # Parsed DataFrame of an admission CSV, memory-mapped from the Parquet cache when it is warm
+    data_path = _data_path(_indexed_hash(path, cache_directory, content_hash), cache_directory)
+    if os.path.exists(data_path):
+        return pq.read_table(data_path, memory_map=True).to_pandas()
+
+    df = read_admission_csv(path)
+    _write_atomic(data_path, lambda tmp: pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp))
+    logging.getLogger('werkzeug').info(f"Cached {path} as {data_path}")
+    return df
+
+
+def _conform(table, schema):
+    # A chunk as a table of the file's schema, which is that of its first chunk. pandas types a column the chunk
+    # has no value in as float64, so such columns become nulls of the right type; other differences are cast,
+    # which raises if the values do not fit (e.g. an int64 column meeting a missing value later on)
+    columns = []
+    for field in schema:
+        column = table.column(field.name)
+        if column.type != field.type:
+            column = pa.nulls(len(table), field.type) if column.null_count == len(table) else column.cast(field.type)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _stream_and_cache(path, chunksize, data_path):
+    # Streamed CSV chunks, also written to a Parquet file as they pass. It only takes its place at data_path
+    # once the last chunk is in, so a partly read file is never cached
+    tmp, writer = _tmp_path(data_path), None
+    try:
+        for df in read_admission_csv(path, chunksize=chunksize):
+            if tmp is not None:
+                try:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp, table.schema)
+                    writer.write_table(table if table.schema.equals(writer.schema) else _conform(table, writer.schema))
+                except pa.ArrowException as e:
+                    # Still streamed; warm() can cache it from the whole file
+                    logging.getLogger('werkzeug').info(f"Not caching {path}: {e}")
+                    if writer is not None:
+                        writer.close()
+                    _remove(tmp)
+                    tmp, writer = None, None
+            yield df
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp, data_path)
+            logging.getLogger('werkzeug').info(f"Cached {path} as {data_path}")
+    finally:
+        # Stopped early (error, cancelled ingestion): drop the partial file
+        if writer is not None:
+            writer.close()
+            _remove(tmp)
+
+
+def iter_cached(path, chunksize, cache_directory=CACHE_DIRECTORY, content_hash=None):
+    # DataFrames of at most chunksize rows: Parquet row batches when the cache is warm,
+    # otherwise streamed CSV chunks, which fill the cache on the way
+    data_path = _data_path(_indexed_hash(path, cache_directory, content_hash), cache_directory)
+    if os.path.exists(data_path):
+        parquet_file = pq.ParquetFile(data_path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from _stream_and_cache(path, chunksize, data_path)
+
+
+def warm(directory=FILES_DIRECTORY, cache_directory=CACHE_DIRECTORY):
+    paths = sorted(glob.glob(os.path.join(directory, '*.csv')))
+    for path in paths:
+        read_cached(path, cache_directory)
+    return len(paths)
+
+
+def prune(cache_directory=CACHE_DIRECTORY):
+    # Drop index entries whose source file is gone or changed, then data no index points to
+    removed, referenced = 0, set()
+    for index_file in glob.glob(os.path.join(cache_directory, 'index', '*.json')):
+        with open(index_file) as f:
+            entry = json.load(f)
+        try:
+            current = cached_hash(entry['path'], cache_directory)
+        except OSError:
+            current = None
+        if current is None:
+            os.remove(index_file)
+            removed += 1
+        else:
+            referenced.add(current)
+    for data_file in glob.glob(os.path.join(cache_directory, 'data', '*.parquet')):
+        if os.path.basename(data_file)[:-len('.parquet')] not in referenced:
+            os.remove(data_file)
+            removed += 1
+    return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the Parquet cache of parsed admission files")
+    parser.add_argument('command', choices=['warm', 'prune'])
+    parser.add_argument('--directory', default=FILES_DIRECTORY, help="CSV directory to warm")
+    parser.add_argument('--cache-directory', default=CACHE_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == 'warm':
+        print(f"Warmed {warm(args.directory, args.cache_directory)} files in {args.cache_directory}")
+    else:
+        print(f"Removed {prune(args.cache_directory)} stale cache files from {args.cache_directory}")
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Ingestion runs in worker processes (sql_db.jobs) and writer threads of other processes (sql_db.scheduler),
+# so the invalidate_* calls after a write only reach the writer's own memory. Every write of admission data
+# bumps data_generation in its transaction; the in-memory copies of the serving process (profile cache, cube,
+# rankings, search index) compare it with the generation they were built at and reload once it moved.
+# A process refreshes its own copies right after its writes, so those record() the generations it committed
+# and only a bump from another process makes them reload.
+
+# Seconds a process reuses the generation it last read, so cache hits do not each cost a query
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_current, _checked_at = None, 0.0
+_seen = {}
+# Generations committed by this process whose writes it refreshes its copies for
+_own = set()
+
+
+def bump(db: Session, refreshed=True):
+    # In the caller's transaction, so the new generation is visible together with the data and not before.
+    # refreshed=False when the caller does not refresh this process' copies: they then reload as after another process
+    global _current
+    generation = models.DataGeneration
+    if not db.execute(update(generation).values(generation=generation.generation + 1)).rowcount:
+        db.add(generation(id=1, generation=1))
+        db.flush()
+    if refreshed:
+        db.info['pending_generation'] = db.query(generation.generation).filter_by(id=1).scalar()
+    with _lock:
+        _current = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    value = session.info.pop('pending_generation', None)
+    if value is not None:
+        with _lock:
+            _own.add(value)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _rolled_back(session):
+    session.info.pop('pending_generation', None)
+
+
+def current(db: Session):
+    global _current, _checked_at
+    with _lock:
+        if _current is not None and time.monotonic() - _checked_at < CHECK_INTERVAL:
+            return _current
+    value = db.query(models.DataGeneration.generation).filter_by(id=1).scalar() or 0
+    with _lock:
+        _current, _checked_at = value, time.monotonic()
+    return value
+
+
+def changed(db: Session, name):
+    # True once the data moved on since the copy called `name` last asked; the first call only records the generation.
+    # Callers ask before (re)loading, so a write committed during the load is caught by the next call
+    value = current(db)
+    with _lock:
+        previous = _seen.get(name)
+        _seen[name] = value
+    return previous is not None and previous != value
+
+
+def record(name):
+    # Called once this process refreshed or invalidated the copy called `name` after its own writes: moves the copy
+    # past the generations this process committed, stopping at the first one from another process
+    with _lock:
+        seen = _seen.get(name)
+        if seen is not None:
+            while seen + 1 in _own:
+                seen += 1
+            _seen[name] = seen
@@ -0,0 +1,124 @@
+import argparse
+import logging
+
+from sqlalchemy import Integer, cast, desc, func, literal, null, select, true, tuple_, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+from .crud import GENDER_FIELDS
+from .transform import ETHNICITY_COLUMNS
+
+GEO_LEVELS = ['county', 'state', 'country']
+ETHNICITY_FIELDS = [column for _, column in ETHNICITY_COLUMNS]
+GEO_MEASURES = GENDER_FIELDS + ETHNICITY_FIELDS
+
+
+def _partition_filter(model, partitions):
+    # partitions is a list of (uc_campus_id, academic_year), or None for every row
+    if partitions is None:
+        return true()
+    return tuple_(model.uc_campus_id, model.academic_year).in_(partitions)
+
+
+def rollup_query(partitions=None):
+    # Gender and ethnicity rows of the partitions in one union, joined to each school's county, state and country
+    # and summed in a single group by (geo_level, geo_value, campus, year, admission_type)
+    G, E, H = models.UCAdmissionGender, models.UCAdmissionEthnicityCounts, models.HighSchool
+
+    def fields(model, present):
+        return [getattr(model, field) if field in present else cast(null(), Integer).label(field) for field in GEO_MEASURES]
+
+    rows = union_all(
+        # Gender rows are unique per school, campus, year and type, so counting the marker counts the schools
+        select(G.high_school_id, G.uc_campus_id, G.academic_year, G.admission_type, literal(1).label('school'),
+               *fields(G, GENDER_FIELDS)).where(_partition_filter(G, partitions)),
+        select(E.high_school_id, E.uc_campus_id, E.academic_year, E.admission_type, cast(null(), Integer).label('school'),
+               *fields(E, ETHNICITY_FIELDS)).where(_partition_filter(E, partitions)),
+    ).subquery()
+    regions = union_all(*[
+        select(H.id.label('high_school_id'), literal(level).label('geo_level'), getattr(H, level).label('geo_value')).where(
+            getattr(H, level).isnot(None))
+        for level in GEO_LEVELS
+    ]).subquery()
+    keys = [regions.c.geo_level, regions.c.geo_value, rows.c.uc_campus_id, rows.c.academic_year, rows.c.admission_type]
+    return (
+        select(*keys, func.count(rows.c.school).label('schools'), *[func.sum(rows.c[field]).label(field) for field in GEO_MEASURES])
+        .select_from(rows.join(regions, regions.c.high_school_id == rows.c.high_school_id))
+        .where(*[key.isnot(None) for key in keys[2:]])
+        .group_by(*keys)
+    )
+
+
+def refresh_geo_rollups(db: Session, partitions=None):
+    # Rebuilds geo_rollups for the given (uc_campus_id, academic_year) partitions, or all of them
+    if partitions is not None:
+        partitions = sorted(set(partitions))
+        if not partitions:
+            return 0
+    R = models.GeoRollup
+    query = rollup_query(partitions)
+    try:
+        db.query(R).filter(_partition_filter(R, partitions)).delete(synchronize_session=False)
+        result = db.execute(R.__table__.insert().from_select([c.name for c in query.selected_columns], query))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logging.getLogger('werkzeug').info(
+        f"Refreshed {result.rowcount} geo rollup rows for {'all' if partitions is None else len(partitions)} partitions")
+    return result.rowcount
+
+
+def touched_partitions(file_infos):
+    # (campus, year) partitions a set of ingested files can change; GPA files carry no counts
+    return {(info['uc_campus_id'], info['year']) for info in file_infos
+            if (info['category'] or '').upper() in ('GENDER', 'ETHNICITY') and info['uc_campus_id'] is not None}
+
+
+def _check(level, measure):
+    if level not in GEO_LEVELS:
+        raise ValueError(f"Unknown geo level: {level}")
+    if measure not in GEO_MEASURES:
+        raise ValueError(f"Unknown measure: {measure}")
+
+
+def region_series(db: Session, level, value, measure='total_applicants', admission_type='App', uc_campus_id=None):
+    # {academic_year: sum} of one county/state/country, at one campus or summed over every campus,
+    # e.g. region_series(db, 'county', 'Orange', uc_campus_id=<San Diego>) for Orange County applicants to UCSD
+    _check(level, measure)
+    R = models.GeoRollup
+    total = func.sum(getattr(R, measure))
+    query = select(R.academic_year, total).where(R.geo_level == level, R.geo_value == value, R.admission_type == admission_type)
+    if uc_campus_id is not None:
+        query = query.where(R.uc_campus_id == uc_campus_id)
+    # Years where the measure is missing or suppressed for every school are left out
+    query = query.group_by(R.academic_year).having(total.isnot(None)).order_by(R.academic_year)
+    return {int(year): total for year, total in db.execute(query)}
+
+
+def top_regions(db: Session, level, measure='total_applicants', admission_type='App', uc_campus_id=None, academic_year=None,
+                n=10):
+    # Largest counties/states/countries by one measure, summed over campuses and/or years that are not given
+    _check(level, measure)
+    R = models.GeoRollup
+    total = func.sum(getattr(R, measure))
+    query = select(R.geo_value, total).where(R.geo_level == level, R.admission_type == admission_type)
+    if uc_campus_id is not None:
+        query = query.where(R.uc_campus_id == uc_campus_id)
+    if academic_year is not None:
+        query = query.where(R.academic_year == academic_year)
+    query = query.group_by(R.geo_value).having(total.isnot(None)).order_by(desc(total), R.geo_value).limit(n)
+    return [(value, total) for value, total in db.execute(query)]
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the geo_rollups table")
+    parser.add_argument('--campus', type=int, help="uc_campus_id of the partition to refresh")
+    parser.add_argument('--year', type=int, help="academic_year of the partition to refresh")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        partitions = [(args.campus, args.year)] if args.campus is not None and args.year is not None else None
+        print(f"Wrote {refresh_geo_rollups(db, partitions)} geo rollup rows")
@@ -0,0 +1,273 @@
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import checkpoint, models
+from .database import SessionLocal, engine
+from .resolver import HighSchoolResolver
+from .scheduler import list_files_to_ingest
+
+DEFAULT_WORKERS = 2
+# Seconds without a heartbeat after which a running job's worker is taken for dead. Workers beat after every
+# chunk, except on SQLite where the file's open transaction leaves room for one only between files
+LEASE_SECONDS = 600
+FINISHED = (models.JobStatus.SUCCEEDED, models.JobStatus.FAILED, models.JobStatus.CANCELLED)
+
+
+class JobCancelled(checkpoint.IngestionCancelled):
+    pass
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def enqueue_files(db: Session, file_ids=None):
+    # One job over the given files (default: every file not added yet); returns its id at once
+    if file_ids is None:
+        file_ids = [info['id'] for info in list_files_to_ingest(db, include_added=False)]
+    job = models.IngestionJob(status=models.JobStatus.QUEUED, cancel_requested=False, created_at=_now())
+    job.files = [models.IngestionJobFile(position=position, file_id=file_id, status=models.JobStatus.QUEUED)
+                 for position, file_id in enumerate(file_ids)]
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def claim_job(db: Session):
+    # Oldest queued job, marked running by this process; None when the queue is empty.
+    # SKIP LOCKED lets Postgres workers pass each other; the status check in the UPDATE guards the rest
+    while True:
+        job_id = db.query(models.IngestionJob.id).filter(models.IngestionJob.status == models.JobStatus.QUEUED).order_by(
+            models.IngestionJob.id).with_for_update(skip_locked=True).limit(1).scalar()
+        if job_id is None:
+            db.commit()
+            return None
+        claimed = db.query(models.IngestionJob).filter(
+            models.IngestionJob.id == job_id, models.IngestionJob.status == models.JobStatus.QUEUED,
+        ).update({'status': models.JobStatus.RUNNING, 'started_at': _now(), 'heartbeat_at': _now(),
+                  'worker_pid': multiprocessing.current_process().pid}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return job_id
+
+
+def _cancel_requested(db: Session, job_id):
+    return bool(db.query(models.IngestionJob.cancel_requested).filter(models.IngestionJob.id == job_id).scalar())
+
+
+def run_job(db: Session, job_id):
+    # Ingests the job's queued files in order, recording progress after each chunk; a cancel rolls back the file in progress
+    job = db.query(models.IngestionJob).filter_by(id=job_id).one()
+    resolver = HighSchoolResolver(db)
+    # Mid-file progress goes through its own session, outside the file's transaction.
+    # SQLite would block on that second writer, so there it is recorded once the file is done
+    progress_db = SessionLocal() if engine.dialect.name != 'sqlite' else None
+    cancelled = False
+    try:
+        for job_file in [job_file for job_file in job.files if job_file.status == models.JobStatus.QUEUED]:
+            if _cancel_requested(db, job_id):
+                cancelled = True
+                break
+            job_file.status = models.JobStatus.RUNNING
+            job.heartbeat_at = _now()
+            db.commit()
+            start = time.perf_counter()
+
+            def on_chunk(rows, written, position=job_file.position):
+                if progress_db is not None:
+                    progress_db.query(models.IngestionJobFile).filter_by(job_id=job_id, position=position).update(
+                        {'rows': rows, 'records': written, 'seconds': time.perf_counter() - start})
+                    progress_db.query(models.IngestionJob).filter_by(id=job_id).update({'heartbeat_at': _now()})
+                    progress_db.commit()
+                if _cancel_requested(db, job_id):
+                    raise JobCancelled(f"Ingestion job {job_id} was cancelled")
+
+            try:
+                result = checkpoint.ingest_file(db, job_file.file, resolver, on_chunk)
+                job_file.status = models.JobStatus.SKIPPED if result['status'] == 'skipped' else models.JobStatus.SUCCEEDED
+                job_file.rows, job_file.records = result.get('rows'), result.get('records')
+            except JobCancelled:
+                job_file.status, job_file.rows, job_file.records = models.JobStatus.CANCELLED, None, None
+                cancelled = True
+            except Exception as e:
+                logging.getLogger('werkzeug').error(f"Job {job_id}: error ingesting file {job_file.file_id}: {e}")
+                job_file.status, job_file.error = models.JobStatus.FAILED, str(e)
+            job_file.seconds = time.perf_counter() - start
+            job.heartbeat_at = _now()
+            db.commit()
+            if cancelled:
+                break
+    finally:
+        if progress_db is not None:
+            progress_db.close()
+
+    for job_file in job.files:
+        if job_file.status == models.JobStatus.QUEUED and cancelled:
+            job_file.status = models.JobStatus.CANCELLED
+    failed = [job_file.file_id for job_file in job.files if job_file.status == models.JobStatus.FAILED]
+    if cancelled:
+        job.status = models.JobStatus.CANCELLED
+    elif failed:
+        job.status, job.error = models.JobStatus.FAILED, f"{len(failed)} files failed: {failed}"
+    else:
+        job.status = models.JobStatus.SUCCEEDED
+    job.finished_at = _now()
+    db.commit()
+    return job.status
+
+
+def cancel_job(db: Session, job_id):
+    # Queued jobs are cancelled at once; running ones stop after their current chunk. Returns the status
+    job = db.query(models.IngestionJob).filter_by(id=job_id).first()
+    if job is None:
+        return None
+    if job.status == models.JobStatus.QUEUED:
+        updated = db.query(models.IngestionJob).filter(
+            models.IngestionJob.id == job_id, models.IngestionJob.status == models.JobStatus.QUEUED,
+        ).update({'status': models.JobStatus.CANCELLED, 'cancel_requested': True, 'finished_at': _now()}, synchronize_session=False)
+        if updated:
+            db.query(models.IngestionJobFile).filter_by(job_id=job_id).update({'status': models.JobStatus.CANCELLED}, synchronize_session=False)
+    elif job.status == models.JobStatus.RUNNING:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job.status
+
+
+def requeue_interrupted(db: Session, lease_seconds=LEASE_SECONDS):
+    # Jobs left running by workers that died, i.e. without a heartbeat for lease_seconds; their unfinished files run
+    # again. Jobs of live workers, in this run or another one, keep beating and are left alone
+    cutoff = _now() - datetime.timedelta(seconds=lease_seconds)
+    last_beat = func.coalesce(models.IngestionJob.heartbeat_at, models.IngestionJob.started_at)
+    stale = (models.IngestionJob.status == models.JobStatus.RUNNING) & (last_beat.is_(None) | (last_beat < cutoff))
+    requeued = []
+    for job_id, in db.query(models.IngestionJob.id).filter(stale).order_by(models.IngestionJob.id).all():
+        # Checked again in the UPDATE, so a worker that beat in the meantime keeps its job
+        if db.query(models.IngestionJob).filter(models.IngestionJob.id == job_id, stale).update(
+                {'status': models.JobStatus.QUEUED, 'worker_pid': None}, synchronize_session=False):
+            db.query(models.IngestionJobFile).filter_by(job_id=job_id, status=models.JobStatus.RUNNING).update(
+                {'status': models.JobStatus.QUEUED}, synchronize_session=False)
+            requeued.append(job_id)
+    db.commit()
+    return requeued
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def get_job(db: Session, job_id):
+    # Status and per-file progress with throughput in CSV rows per second
+    job = db.query(models.IngestionJob).filter_by(id=job_id).first()
+    if job is None:
+        return None
+    files = [{
+        'file_id': job_file.file_id,
+        'location': job_file.file.location if job_file.file else None,
+        'status': job_file.status.value,
+        'rows': job_file.rows,
+        'records': job_file.records,
+        'seconds': job_file.seconds,
+        'rows_per_second': round(job_file.rows / job_file.seconds, 1) if job_file.rows and job_file.seconds else None,
+        'error': job_file.error,
+    } for job_file in job.files]
+    rows = sum(f['rows'] or 0 for f in files if f['seconds'] is not None)
+    seconds = sum(f['seconds'] or 0 for f in files)
+    return {
+        'job_id': job.id,
+        'status': job.status.value,
+        'cancel_requested': job.cancel_requested,
+        'created_at': _isoformat(job.created_at),
+        'started_at': _isoformat(job.started_at),
+        'finished_at': _isoformat(job.finished_at),
+        'error': job.error,
+        'files_done': sum(f['status'] not in ('queued', 'running') for f in files),
+        'files_total': len(files),
+        'rows': rows,
+        'records': sum(f['records'] or 0 for f in files),
+        'rows_per_second': round(rows / seconds, 1) if rows and seconds else None,
+        'files': files,
+    }
+
+
+def stream_job(job_id, interval=1.0):
+    # Server-sent events with the job status whenever it changes, until the job finishes
+    with SessionLocal() as db:
+        if get_job(db, job_id) is None:
+            raise ValueError(f"Unknown job: {job_id}")
+    return _stream_job(job_id, interval)
+
+
+def _stream_job(job_id, interval):
+    last = None
+    with SessionLocal() as db:
+        while True:
+            status = get_job(db, job_id)
+            db.commit()  # end the read transaction so the next poll sees the workers' commits
+            if status != last:
+                yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+                last = status
+            if status['status'] in [s.value for s in FINISHED]:
+                return
+            time.sleep(interval)
+
+
+def work(poll_interval=1.0, drain=False):
+    # Worker process loop: claim a job, run it, repeat; with drain, return once the queue is empty
+    engine.dispose()  # connections inherited from the parent process must not be shared
+    with SessionLocal() as db:
+        while True:
+            job_id = claim_job(db)
+            if job_id is None:
+                if drain:
+                    return
+                time.sleep(poll_interval)
+                continue
+            logging.getLogger('werkzeug').info(f"Running ingestion job {job_id}")
+            status = run_job(db, job_id)
+            logging.getLogger('werkzeug').info(f"Ingestion job {job_id} {status.value}")
+
+
+def run_workers(workers=DEFAULT_WORKERS, poll_interval=1.0, drain=False, lease_seconds=LEASE_SECONDS):
+    # At most `workers` jobs run at once, one per process
+    if engine.dialect.name == 'sqlite':
+        # SQLite allows a single writer at a time
+        workers = 1
+    with SessionLocal() as db:
+        requeued = requeue_interrupted(db, lease_seconds)
+    if requeued:
+        logging.getLogger('werkzeug').info(f"Requeued interrupted jobs {requeued}")
+    processes = [multiprocessing.Process(target=work, args=(poll_interval, drain), name=f'ingestion-worker-{i}')
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        raise
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run ingestion job workers")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="jobs run at the same time")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between polls of an empty queue")
+    parser.add_argument('--drain', action='store_true', help="exit once the queue is empty")
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS,
+                        help="seconds without a heartbeat before a running job is requeued")
+    parser.add_argument('--enqueue', action='store_true', help="queue a job for every file not added yet first")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        with SessionLocal() as db:
+            print(f"Queued job {enqueue_files(db)}")
+    run_workers(args.workers, args.interval, args.drain, args.lease)
@@ -0,0 +1,101 @@
+import argparse
+import logging
+
+from sqlalchemy import Float, and_, case, cast, func, literal, null, select, true, tuple_, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+
+GENDER_ROWS, GPA_ROWS = 'gender', 'gpa'
+
+
+def _partition_filter(model, partitions):
+    # partitions is a list of (uc_campus_id, academic_year), or None for every row
+    if partitions is None:
+        return true()
+    return tuple_(model.uc_campus_id, model.academic_year).in_(partitions)
+
+
+def _ratio(numerator, denominator):
+    return cast(numerator, Float) / func.nullif(denominator, 0)
+
+
+def metrics_query(partitions=None):
+    # One GROUP BY over the gender totals and GPA rows of the partitions, pivoted with CASE
+    G, P = models.UCAdmissionGender, models.UCAdmissionGPA
+    rows = union_all(
+        select(literal(GENDER_ROWS).label('kind'), G.high_school_id, G.uc_campus_id, G.academic_year, G.admission_type,
+               G.total_applicants.label('total'), cast(null(), Float).label('mean_gpa')).where(_partition_filter(G, partitions)),
+        select(literal(GPA_ROWS).label('kind'), P.high_school_id, P.uc_campus_id, P.academic_year, P.admission_type,
+               null().label('total'), P.mean_gpa).where(_partition_filter(P, partitions)),
+    ).subquery()
+
+    def pivot(kind, admission_type, column):
+        return func.max(case((and_(rows.c.kind == kind, rows.c.admission_type == admission_type), column)))
+
+    applicants = pivot(GENDER_ROWS, 'App', rows.c.total)
+    admits = pivot(GENDER_ROWS, 'Adm', rows.c.total)
+    enrollees = pivot(GENDER_ROWS, 'Enr', rows.c.total)
+    app_gpa = pivot(GPA_ROWS, 'App', rows.c.mean_gpa)
+    adm_gpa = pivot(GPA_ROWS, 'Adm', rows.c.mean_gpa)
+    return select(
+        rows.c.high_school_id, rows.c.uc_campus_id, rows.c.academic_year,
+        applicants.label('applicants'), admits.label('admits'), enrollees.label('enrollees'),
+        _ratio(admits, applicants).label('admit_rate'), _ratio(enrollees, admits).label('yield_rate'),
+        app_gpa.label('app_gpa'), adm_gpa.label('adm_gpa'), pivot(GPA_ROWS, 'Enr', rows.c.mean_gpa).label('enr_gpa'),
+        (adm_gpa - app_gpa).label('gpa_lift'),
+    ).where(rows.c.high_school_id.isnot(None)).group_by(rows.c.high_school_id, rows.c.uc_campus_id, rows.c.academic_year)
+
+
+def refresh_metrics(db: Session, partitions=None):
+    # Rebuilds admission_metrics for the given (uc_campus_id, academic_year) partitions, or all of them
+    if partitions is not None:
+        partitions = sorted(set(partitions))
+        if not partitions:
+            return 0
+    M = models.AdmissionMetrics
+    query = metrics_query(partitions)
+    try:
+        db.query(M).filter(_partition_filter(M, partitions)).delete(synchronize_session=False)
+        result = db.execute(M.__table__.insert().from_select([c.name for c in query.selected_columns], query))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logging.getLogger('werkzeug').info(
+        f"Refreshed {result.rowcount} admission metrics rows for {'all' if partitions is None else len(partitions)} partitions")
+    return result.rowcount
+
+
+def touched_partitions(file_infos):
+    # (campus, year) partitions a set of ingested files can change; ethnicity files do not feed the metrics
+    return {(info['uc_campus_id'], info['year']) for info in file_infos
+            if (info['category'] or '').upper() in ('GENDER', 'GPA') and info['uc_campus_id'] is not None}
+
+
+def _metrics_dict(row):
+    return {column.name: getattr(row, column.name) for column in models.AdmissionMetrics.__table__.columns}
+
+
+def get_admission_metrics(db: Session, high_school_id, uc_campus_id=None, academic_year=None):
+    # Primary-key lookups: the full key is one row, a prefix is an index range
+    M = models.AdmissionMetrics
+    query = db.query(M).filter(M.high_school_id == high_school_id)
+    if uc_campus_id is not None:
+        query = query.filter(M.uc_campus_id == uc_campus_id)
+    if academic_year is not None:
+        query = query.filter(M.academic_year == academic_year)
+    return [_metrics_dict(row) for row in query.order_by(M.uc_campus_id, M.academic_year)]
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the admission_metrics table")
+    parser.add_argument('--campus', type=int, help="uc_campus_id of the partition to refresh")
+    parser.add_argument('--year', type=int, help="academic_year of the partition to refresh")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        partitions = [(args.campus, args.year)] if args.campus is not None and args.year is not None else None
+        print(f"Wrote {refresh_metrics(db, partitions)} admission metrics rows")
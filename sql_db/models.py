@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, DDL, Index, Integer, MetaData, SmallInteger, String, Float, ForeignKey, Boolean, DateTime, Enum, LargeBinary, Table, UniqueConstraint, event
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from .database import Base
+from .transform import ADMISSION_TYPES, ETHNICITY_COLUMNS
 import enum
+import math
 
 class HighSchoolType(enum.Enum):
     CA_PUBLIC = "CA_public"
@@ -10,18 +13,74 @@ class HighSchoolType(enum.Enum):
     FOREIGN = "Foreign"
     ALL = "All"
 
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    SKIPPED = "skipped"  # files only: unchanged since they were last ingested
+
 class Category(enum.Enum):
     GENDER = "Gender"
     ETHNICITY = "Ethnicity"
     GPA = "GPA"
 
+class CodedString(TypeDecorator):
+    """A string from a fixed list stored as its smallint position in the list.
+
+    Python code and query parameters keep using the strings: they are encoded
+    on the way in and decoded on the way out. Raw DBAPI reads (cube.fetch_rows)
+    see the codes.
+    """
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = tuple(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        try:
+            return self.codes[value]
+        except KeyError:
+            raise ValueError(f"Unknown value {value!r}, expected one of {list(self.values)}")
+
+    def process_bind_param(self, value, dialect):
+        return self.encode(value)
+
+    def process_literal_param(self, value, dialect):
+        code = self.encode(value)
+        return 'NULL' if code is None else str(code)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.values[value]
+
+
+class AdmissionType(Base):
+    # Lookup table for the admission_type codes, so they read as names in plain SQL
+    __tablename__ = "admission_types"
+
+    code = Column(SmallInteger, primary_key=True, autoincrement=False)
+    name = Column(String, unique=True, nullable=False)
+
+
+event.listen(AdmissionType.__table__, 'after_create', DDL(
+    "INSERT INTO admission_types (code, name) VALUES " +
+    ", ".join(f"({code}, '{name}')" for code, name in enumerate(ADMISSION_TYPES))))
+
 class HighSchool(Base):
     __tablename__ = "high_schools"
 
     id = Column(Integer, primary_key=True, index=True)
     school_name = Column(String, index=True)
     city = Column(String, index=True)
-    uc_school_name = Column(String, index=True)  # New column
+    uc_school_name = Column(String, index=True, unique=True)  # New column
+    school_code = Column(Integer, index=True)  # numeric suffix of uc_school_name
     county = Column(String)
     state = Column(String)
     country = Column(String, default="United States")
@@ -29,7 +88,7 @@ class HighSchool(Base):
     is_public = Column(Boolean, default=True)
 
     uc_admission_gender = relationship("UCAdmissionGender", back_populates="high_school")
-    uc_admission_ethnicity = relationship("UCAdmissionEthnicity", back_populates="high_school")
+    uc_admission_ethnicity = relationship("UCAdmissionEthnicityCounts", back_populates="high_school")
     uc_admission_gpa = relationship("UCAdmissionGPA", back_populates="high_school")
 
 class UCCampus(Base):
@@ -41,7 +100,7 @@ class UCCampus(Base):
 
     files = relationship("File", back_populates="uc_campus")
     uc_admission_gender = relationship("UCAdmissionGender", back_populates="uc_campus")
-    uc_admission_ethnicity = relationship("UCAdmissionEthnicity", back_populates="uc_campus")
+    uc_admission_ethnicity = relationship("UCAdmissionEthnicityCounts", back_populates="uc_campus")
     uc_admission_gpa = relationship("UCAdmissionGPA", back_populates="uc_campus")
 
 class File(Base):
@@ -54,49 +113,232 @@ class File(Base):
     category = Column(Enum(Category))
     year = Column(Integer)
     is_added_to_db = Column(Boolean, default=False)
+    content_hash = Column(String)  # sha256 of the file when it was last ingested
+    row_count = Column(Integer)  # CSV rows in that version of the file
+    record_count = Column(Integer)  # admission rows written from it
+    last_error = Column(String)
 
     uc_campus = relationship("UCCampus", back_populates="files")
 
 class UCAdmissionGender(Base):
     __tablename__ = "uc_admission_gender"
+    # One row per school/campus/year/admission type; the unique index also serves per-school lookups
+    # On Postgres this and the other admission tables are partitioned by academic_year (see sql_db/partitions.py)
+    natural_key = ('high_school_id', 'uc_campus_id', 'academic_year', 'admission_type')
+    __table_args__ = (UniqueConstraint(*natural_key, name='uq_uc_admission_gender_natural_key'),)
 
     id = Column(Integer, primary_key=True, index=True)
     high_school_id = Column(Integer, ForeignKey("high_schools.id"))
     uc_campus_id = Column(Integer, ForeignKey("uc_campuses.id"))
-    admission_type = Column(String)
+    file_id = Column(Integer, ForeignKey("files.id"), index=True)
+    admission_type = Column(CodedString(ADMISSION_TYPES))
     total_applicants = Column(Integer)
     female_applicants = Column(Integer)
     male_applicants = Column(Integer)
     other_applicants = Column(Integer)
     unknown_gender = Column(Integer)
-    academic_year = Column(Integer)
+    academic_year = Column(SmallInteger)
 
     high_school = relationship("HighSchool", back_populates="uc_admission_gender")
     uc_campus = relationship("UCCampus", back_populates="uc_admission_gender")
 
-class UCAdmissionEthnicity(Base):
-    __tablename__ = "uc_admission_ethnicity"
+class UCAdmissionEthnicityCounts(Base):
+    # Compact layout: one row per school/campus/year/admission type with a count column per ethnicity.
+    # NULL means the cell was empty in the CSV (the long layout had no row for it)
+    __tablename__ = "uc_admission_ethnicity_counts"
+    natural_key = ('high_school_id', 'uc_campus_id', 'academic_year', 'admission_type')
+    __table_args__ = (UniqueConstraint(*natural_key, name='uq_uc_admission_ethnicity_counts_natural_key'),)
 
     id = Column(Integer, primary_key=True, index=True)
     high_school_id = Column(Integer, ForeignKey("high_schools.id"))
     uc_campus_id = Column(Integer, ForeignKey("uc_campuses.id"))
-    admission_type = Column(String)
-    ethnicity = Column(String)
-    count = Column(Integer)
-    academic_year = Column(Integer)
+    file_id = Column(Integer, ForeignKey("files.id"), index=True)
+    admission_type = Column(CodedString(ADMISSION_TYPES))
+    academic_year = Column(SmallInteger)
+    all_ethnicities = Column(Integer)
+    african_american = Column(Integer)
+    american_indian = Column(Integer)
+    hispanic_latinx = Column(Integer)
+    pacific_islander = Column(Integer)
+    asian = Column(Integer)
+    white = Column(Integer)
+    domestic_unknown = Column(Integer)
+    international = Column(Integer)
 
     high_school = relationship("HighSchool", back_populates="uc_admission_ethnicity")
     uc_campus = relationship("UCCampus", back_populates="uc_admission_ethnicity")
 
+
+def ethnicity_view_sql():
+    # The long shape (one row per ethnicity) over the compact table, for readers of uc_admission_ethnicity.
+    # id keeps the old order: the compact row's position, then the ethnicity's position in ETHNICITY_COLUMNS
+    counts = UCAdmissionEthnicityCounts.__tablename__
+    return "CREATE VIEW uc_admission_ethnicity AS\n" + "\nUNION ALL\n".join(
+        f"SELECT id * {len(ETHNICITY_COLUMNS)} + {position} AS id, high_school_id, uc_campus_id, file_id, admission_type, "
+        f"'{label.replace(chr(39), chr(39) * 2)}' AS ethnicity, {column} AS count, academic_year "
+        f"FROM {counts} WHERE {column} IS NOT NULL"
+        for position, (label, column) in enumerate(ETHNICITY_COLUMNS)
+    )
+
+
+# Built with the compact table, so create_all() gives readers the same uc_admission_ethnicity as the migrations
+event.listen(UCAdmissionEthnicityCounts.__table__, 'after_create', DDL(ethnicity_view_sql()))
+event.listen(UCAdmissionEthnicityCounts.__table__, 'before_drop', DDL("DROP VIEW IF EXISTS uc_admission_ethnicity"))
+
+
+class UCAdmissionEthnicity(Base):
+    # Read-only view in the original long layout; writes go to UCAdmissionEthnicityCounts.
+    # Mapped on its own MetaData so create_all() and autogenerate do not treat it as a table
+    __table__ = Table(
+        "uc_admission_ethnicity", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("high_school_id", Integer),
+        Column("uc_campus_id", Integer),
+        Column("file_id", Integer),
+        Column("admission_type", CodedString(ADMISSION_TYPES)),
+        Column("ethnicity", String),
+        Column("count", Integer),
+        Column("academic_year", SmallInteger),
+    )
+    natural_key = ('high_school_id', 'uc_campus_id', 'academic_year', 'admission_type', 'ethnicity')
+
 class UCAdmissionGPA(Base):
     __tablename__ = "uc_admission_gpa"
+    natural_key = ('high_school_id', 'uc_campus_id', 'academic_year', 'admission_type')
+    __table_args__ = (UniqueConstraint(*natural_key, name='uq_uc_admission_gpa_natural_key'),)
 
     id = Column(Integer, primary_key=True, index=True)
     high_school_id = Column(Integer, ForeignKey("high_schools.id"))
     uc_campus_id = Column(Integer, ForeignKey("uc_campuses.id"))
-    admission_type = Column(String)
+    file_id = Column(Integer, ForeignKey("files.id"), index=True)
+    admission_type = Column(CodedString(ADMISSION_TYPES))
     mean_gpa = Column(Float)
-    academic_year = Column(Integer)
+    academic_year = Column(SmallInteger)
     
     high_school = relationship("HighSchool", back_populates="uc_admission_gpa")
-    uc_campus = relationship("UCCampus", back_populates="uc_admission_gpa")
\ No newline at end of file
+    uc_campus = relationship("UCCampus", back_populates="uc_admission_gpa")
+
+class AdmissionMetrics(Base):
+    # Derived from uc_admission_gender/gpa by sql_db.metrics; rebuilt per (campus, year), so no foreign keys
+    __tablename__ = "admission_metrics"
+
+    high_school_id = Column(Integer, primary_key=True)
+    uc_campus_id = Column(Integer, primary_key=True)
+    academic_year = Column(Integer, primary_key=True)
+    applicants = Column(Integer)
+    admits = Column(Integer)
+    enrollees = Column(Integer)
+    admit_rate = Column(Float)  # admits / applicants
+    yield_rate = Column(Float)  # enrollees / admits
+    app_gpa = Column(Float)
+    adm_gpa = Column(Float)
+    enr_gpa = Column(Float)
+    gpa_lift = Column(Float)  # adm_gpa - app_gpa
+
+class AdmissionTrend(Base):
+    # Year-over-year series derived from uc_admission_gender by sql_db.trends; 0 in high_school_id or uc_campus_id
+    # stands for all schools / all campuses. Rebuilt per campus, so no foreign keys, like admission_metrics
+    __tablename__ = "admission_trends"
+
+    high_school_id = Column(Integer, primary_key=True)
+    uc_campus_id = Column(Integer, primary_key=True)
+    academic_year = Column(Integer, primary_key=True)
+    applicants = Column(Integer)
+    admits = Column(Integer)
+    enrollees = Column(Integer)
+    female_applicants = Column(Integer)
+    male_applicants = Column(Integer)
+    admit_rate = Column(Float)  # admits / applicants
+    female_share = Column(Float)  # female_applicants / applicants
+    male_share = Column(Float)  # male_applicants / applicants
+    # Change from the previous academic year
+    applicants_delta = Column(Integer)
+    admits_delta = Column(Integer)
+    enrollees_delta = Column(Integer)
+    admit_rate_delta = Column(Float)
+    # Compound annual growth since the first year of the series
+    applicants_cagr = Column(Float)
+    admits_cagr = Column(Float)
+    enrollees_cagr = Column(Float)
+    admit_rate_avg3 = Column(Float)  # mean admit rate over this and the two previous years
+
+class GeoRollup(Base):
+    # Admission counts summed over the schools of each county, state and country by sql_db.geo;
+    # rebuilt per (campus, year), so no foreign keys, like admission_metrics
+    __tablename__ = "geo_rollups"
+    # The primary key serves one region's lookups; this one a whole level at one campus and year, and the refreshes
+    __table_args__ = (Index('ix_geo_rollups_campus_year_level', 'uc_campus_id', 'academic_year', 'geo_level'),)
+
+    geo_level = Column(String, primary_key=True)  # 'county', 'state' or 'country' of high_schools
+    geo_value = Column(String, primary_key=True)
+    uc_campus_id = Column(Integer, primary_key=True)
+    academic_year = Column(SmallInteger, primary_key=True)
+    admission_type = Column(CodedString(ADMISSION_TYPES), primary_key=True)
+    schools = Column(Integer)  # schools with a gender row
+    total_applicants = Column(Integer)
+    male_applicants = Column(Integer)
+    female_applicants = Column(Integer)
+    other_applicants = Column(Integer)
+    unknown_gender = Column(Integer)
+    all_ethnicities = Column(Integer)
+    african_american = Column(Integer)
+    american_indian = Column(Integer)
+    hispanic_latinx = Column(Integer)
+    pacific_islander = Column(Integer)
+    asian = Column(Integer)
+    white = Column(Integer)
+    domestic_unknown = Column(Integer)
+    international = Column(Integer)
+
+class DataGeneration(Base):
+    # Single row bumped in every transaction that writes admission data (sql_db.generation), so other processes
+    # can tell their in-memory copies are stale
+    __tablename__ = "data_generation"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+event.listen(DataGeneration.__table__, 'after_create', DDL("INSERT INTO data_generation (id, generation) VALUES (1, 0)"))
+
+class HighSchoolProfile(Base):
+    # Finished get_high_school_data_by_id profile per school, maintained by sql_db.profiles; no foreign key, like admission_metrics
+    __tablename__ = "high_school_profiles"
+
+    high_school_id = Column(Integer, primary_key=True)
+    encoding = Column(String, nullable=False)  # Content-Encoding of body
+    raw_size = Column(Integer)  # uncompressed JSON length in bytes
+    body = Column(LargeBinary, nullable=False)
+
+class IngestionJob(Base):
+    # Queued by sql_db.jobs.enqueue_files and run by its worker processes
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED, index=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker_pid = Column(Integer)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    # Refreshed by the running worker; see sql_db.jobs.requeue_interrupted
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(String)
+
+    files = relationship("IngestionJobFile", back_populates="job", order_by="IngestionJobFile.position")
+
+class IngestionJobFile(Base):
+    # Per-file progress of a job: CSV rows parsed, admission rows written and time taken
+    __tablename__ = "ingestion_job_files"
+
+    job_id = Column(Integer, ForeignKey("ingestion_jobs.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id"))
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    rows = Column(Integer)
+    records = Column(Integer)
+    seconds = Column(Float)
+    error = Column(String)
+
+    job = relationship("IngestionJob", back_populates="files")
+    file = relationship("File")
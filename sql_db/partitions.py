@@ -0,0 +1,135 @@
+import argparse
+import logging
+import threading
+
+from sqlalchemy import Column, MetaData, Table, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# On Postgres these are LIST-partitioned by academic_year (alembic revision d3a7c1e9f5b2), one partition per
+# year plus a default one. Elsewhere, or before the migration, they are plain tables and everything here is a no-op
+PARTITIONED_MODELS = [models.UCAdmissionGender, models.UCAdmissionGPA, models.UCAdmissionEthnicityCounts]
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def partition_name(table_name, year):
+    return f"{table_name}_y{int(year)}"
+
+
+def is_partitioned(db: Session, model) -> bool:
+    if db.get_bind().dialect.name != 'postgresql':
+        return False
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name))"
+    ), {'name': model.__tablename__}).scalar()
+
+
+def partition_table(model, name):
+    # Core Table for a partition (or a table about to become one) with the model's column types,
+    # so the loaders' parameter processing (e.g. CodedString) applies to it too
+    with _tables_lock:
+        if name not in _tables:
+            _tables[name] = Table(name, MetaData(), *[Column(column.name, column.type, primary_key=column.primary_key)
+                                                      for column in model.__table__.columns])
+        return _tables[name]
+
+
+def partitions(db: Session, model):
+    # {year: partition name} of the attached year partitions
+    rows = db.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid WHERE pg_inherits.inhparent = to_regclass(:name)"
+    ), {'name': model.__tablename__}).all()
+    # Bounds read like FOR VALUES IN ('2023'); the default partition's is DEFAULT
+    return {int(bound.split('(')[1].strip("')")): name for name, bound in rows if bound.startswith('FOR VALUES IN')}
+
+
+def ensure_partition(db: Session, model, year):
+    # Creates the year's partition if it is missing. Runs on its own connection and commits at once:
+    # CREATE TABLE ... PARTITION OF locks the parent table exclusively, which must not last for a whole load.
+    # Call it before the session touches the table, or the two connections wait on each other
+    name = partition_name(model.__tablename__, year)
+    if db.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None:
+        return name
+    with db.get_bind().connect() as connection:
+        with connection.begin():
+            # Serializes concurrent writers that need the same new year
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': name})
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {model.__tablename__} FOR VALUES IN ({int(year)})"))
+    logging.getLogger('werkzeug').info(f"Created partition {name}")
+    return name
+
+
+def route(db: Session, model, year):
+    # Table the rows of one academic year are written to: the year's partition when the table is partitioned
+    if not is_partitioned(db, model):
+        return model.__table__
+    if year is None:
+        raise ValueError(f"{model.__tablename__} is partitioned by academic_year; rows without a year cannot be stored")
+    return partition_table(model, ensure_partition(db, model, year))
+
+
+def create_swap_table(db: Session, model, year):
+    # Empty table shaped like the year's partition, to be filled and then swapped in by swap_partition.
+    # The CHECK constraint lets ATTACH PARTITION skip scanning it
+    name = ensure_partition(db, model, year)
+    swap = f"{name}_swap"
+    db.execute(text(f"DROP TABLE IF EXISTS {swap}"))
+    db.execute(text(f"CREATE TABLE {swap} (LIKE {name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)"))
+    db.execute(text(f"ALTER TABLE {swap} ADD CONSTRAINT {swap}_year CHECK (academic_year IS NOT NULL AND academic_year = {int(year)})"))
+    return partition_table(model, swap)
+
+
+def swap_partition(db: Session, model, year, swap):
+    # Replaces the year's partition with the swap table, in the caller's transaction: readers see the old
+    # rows until it commits. DETACH holds an exclusive lock on the parent, but only for the swap itself
+    parent, name = model.__tablename__, partition_name(model.__tablename__, year)
+    old_indexes = _indexes(db, name)
+    db.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name}"))
+    db.execute(text(f"DROP TABLE {name}"))
+    db.execute(text(f"ALTER TABLE {swap.name} RENAME TO {name}"))
+    db.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES IN ({int(year)})"))
+    db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {swap.name}_year"))
+    # The swap table's indexes are named after it; give them back the old partition's names
+    for parent_index, index in _indexes(db, name).items():
+        if parent_index in old_indexes and index != old_indexes[parent_index]:
+            db.execute(text(f'ALTER INDEX "{index}" RENAME TO "{old_indexes[parent_index]}"'))
+
+
+def _indexes(db: Session, table_name):
+    # {parent table's index: index} of a partition's indexes attached to the parent's
+    return dict(db.execute(text(
+        "SELECT pg_inherits.inhparent::regclass::text, index.relname FROM pg_index "
+        "JOIN pg_class index ON index.oid = pg_index.indexrelid "
+        "JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid WHERE pg_index.indrelid = to_regclass(:name)"
+    ), {'name': table_name}).all())
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Manage the academic_year partitions of the admission tables")
+    parser.add_argument('--create', type=int, nargs='*', default=[], metavar='YEAR', help="create these years' partitions")
+    parser.add_argument('--reload', type=int, metavar='YEAR', help="reload one year of --category from its files")
+    parser.add_argument('--category', choices=['GENDER', 'ETHNICITY', 'GPA'])
+    args = parser.parse_args()
+    if args.reload is not None and not args.category:
+        parser.error("--reload needs --category")
+
+    with SessionLocal() as db:
+        for year in args.create:
+            for model in PARTITIONED_MODELS:
+                if is_partitioned(db, model):
+                    ensure_partition(db, model, year)
+        if args.reload is not None:
+            from .checkpoint import reload_year
+            print(reload_year(db, args.category, args.reload))
+        for model in PARTITIONED_MODELS:
+            if is_partitioned(db, model):
+                print(model.__tablename__, sorted(partitions(db, model)))
+            else:
+                print(model.__tablename__, "not partitioned")
@@ -1,372 +1,210 @@
+from sqlalchemy import Column, Integer, MetaData, Table, bindparam, select
 from sqlalchemy.orm import Session
-from . import models, crud
+from . import models, crud, transform, bulk_load, school_codes, metrics, cube, ranking, profiles, trends, geo, generation, search
+from . import file_cache
 import pandas as pd
 import os
 from flask import current_app
 import logging
-import chardet
-import re
 
 
 
-def add_gpa_csv_file_to_db(db: Session, file, uc_campus_name, year):
-    logging.getLogger('werkzeug').info(f"In add_gpa_csv_file_to_db file: {file}, {uc_campus_name}, {year}")
+def _read_csv(file, content_hash=None):
+    # Served from the Parquet cache when warm; otherwise decoded (BOM-detected, streamed) and cached
+    df = file_cache.read_cached(file, content_hash=content_hash)
 
-    # Detect file encoding
-    with open(file, 'rb') as raw_file:
-        result = chardet.detect(raw_file.read(10000))
-    
-    # Read the CSV file with detected encoding
-    df = pd.read_csv(file, encoding=result['encoding'], sep='\t')
-    
     # Log the columns and number of rows in the DataFrame
     logging.getLogger('werkzeug').info(f"Columns in the DataFrame: {df.columns.tolist()}")
     logging.getLogger('werkzeug').info(f"Number of rows in the DataFrame: {len(df)}")
+    return df
 
-    # Check if required columns are present
-    required_columns = ['Calculation1', 'School', 'City', 'County/State/Country', 'App GPA', 'Adm GPA', 'Enrl GPA']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        error_msg = f"Missing required columns: {', '.join(missing_columns)}"
-        logging.getLogger('werkzeug').error(error_msg)
-        raise ValueError(error_msg)
 
-    # Get UC campus ID
+def _get_uc_campus_id(db: Session, uc_campus_name):
     uc_campus = crud.get_uc_campus_by_name(db, uc_campus_name)
     if not uc_campus:
         error_msg = f"Invalid UC campus name: {uc_campus_name}"
         logging.getLogger('werkzeug').error(error_msg)
         raise ValueError(error_msg)
-    
-    uc_campus_id = uc_campus.id
-
-    # Collect all GPA records for batch insertion
-    gpa_records = []
-
-    # i = 0   
-    for _, row in df.iterrows():
-        # # # testing purpose
-        # i += 1
-        # if i > 100:
-        #     break
-
-        try:
-            # Create or update high school
-            uc_school_name = row['Calculation1']
-            # Remove leading zeros from the numerical part of the school name
-            if uc_school_name and any(char.isdigit() for char in uc_school_name):
-                match = re.search(r'(\d+)$', uc_school_name)
-                if match:
-                    digits = match.group(1)
-                    stripped_digits = digits.lstrip('0')
-                    uc_school_name = re.sub(r'\d+$', stripped_digits, uc_school_name)
-
-
-            
-            high_school = crud.get_high_school_by_uc_school_name(db, uc_school_name)
-            if not high_school:
-                if pd.isna(row['County/State/Country']) or row['County/State/Country'].upper() == 'N/A':
-                    county = None
-                    state = None
-                    country = 'Unknown'
-                elif row['County/State/Country'] in ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']:
-                    county = None
-                    state = row['County/State/Country']
-                    country = 'United States'
-                else:
-                    county = row['County/State/Country']
-                    state = 'CA'
-                    country = 'United States'
-
-                high_school = crud.create_high_school(db, {
-                    'uc_school_name': uc_school_name,
-                    'school_name': row['School'],
-                    'city': row['City'],
-                    'county': county,
-                    'state': state,
-                    'country': country,
-                    'is_public': True  # Assuming all schools are public, adjust if needed
-                })
-
-            # Create GPA record
-            gpa_types = ['App GPA', 'Adm GPA', 'Enrl GPA']
-            gpa_type_mapping = {
-                'App GPA': 'App',
-                'Adm GPA': 'Adm',
-                'Enrl GPA': 'Enr'
-            }
-            for gpa_type in gpa_types:
-                gpa_value = row.get(gpa_type)
-                if pd.notna(gpa_value):  # Check if the value is not NaN
-                    gpa_records.append({
-                        'high_school_id': high_school.id,
-                        'uc_campus_id': uc_campus_id,
-                        'academic_year': year,
-                        'admission_type': gpa_type_mapping[gpa_type],
-                        'mean_gpa': float(gpa_value),
-                    })
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error processing row: {row}")
-            logging.getLogger('werkzeug').error(f"Error details: {str(e)}")
-            continue
-
-    # Perform batch insertion of GPA records
-    if gpa_records:
-        try:
-            crud.bulk_create_uc_admission_gpa(db, gpa_records)            
-            logging.getLogger('werkzeug').info("All rows processed successfully")
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error bulk creating uc admission gpa: {e}")
-            db.rollback()
+    return uc_campus.id
+
+
+CATEGORY_MODELS = {
+    'GENDER': models.UCAdmissionGender,
+    'ETHNICITY': models.UCAdmissionEthnicityCounts,
+    'GPA': models.UCAdmissionGPA,
+}
+
+
+# CSV rows held in memory at a time by the streaming loaders
+DEFAULT_CHUNK_ROWS = 20000
+
+
+def _admission_frames(df, category, uc_campus_id, year, high_school_type=None):
+    category = category.upper()
+    if category == 'GPA':
+        return transform.gpa_frames(df, uc_campus_id, year)
+    elif category == 'GENDER':
+        return transform.gender_frames(df, uc_campus_id, year)
+    elif category == 'ETHNICITY':
+        return transform.ethnicity_frames(df, uc_campus_id, year, high_school_type)
+    raise ValueError(f"Unsupported category: {category}")
+
+
+def parse_admission_file(file, category, uc_campus_id, year, high_school_type=None, content_hash=None):
+    # Pure parsing step (no database access), safe to run in a worker process.
+    # Returns (schools, records, number of CSV rows). content_hash: the file's hash, if the caller has it
+    df = _read_csv(file, content_hash)
+    schools, records = _admission_frames(df, category, uc_campus_id, year, high_school_type)
+    return schools, records, len(df)
+
+
+def iter_admission_chunks(file, category, uc_campus_id, year, high_school_type=None, chunksize=DEFAULT_CHUNK_ROWS,
+                          content_hash=None):
+    # Same as parse_admission_file, one (schools, records, number of CSV rows) per chunk of at most chunksize rows
+    if category.upper() not in CATEGORY_MODELS:
+        raise ValueError(f"Unsupported category: {category}")
+    for df in file_cache.iter_cached(file, chunksize, content_hash=content_hash):
+        schools, records = _admission_frames(df, category, uc_campus_id, year, high_school_type)
+        yield schools, records, len(df)
+
+
+def write_admission_chunks(db: Session, chunks, category, resolver, on_chunk=None, table=None):
+    # Resolves and writes (schools, records, rows) chunks inside the caller's transaction; only one chunk and one
+    # writer buffer are held at a time. on_chunk(rows, written) runs after each chunk. table overrides the
+    # category's table (see partitions.route). Returns (CSV rows, rows written, ids of the schools written)
+    model = CATEGORY_MODELS[category.upper()]
+    writer, row_count, high_school_ids = None, 0, set()
+    for schools, records, rows in chunks:
+        ids = resolver.resolve(schools)
+        high_school_ids.update(ids.values())
+        records = transform.attach_high_school_ids(records, ids)
+        if writer is None:
+            writer = bulk_load.RecordWriter(db, model, records.columns, conflict_columns=model.natural_key, table=table)
+        writer.write_frame(records)
+        row_count += rows
+        if on_chunk is not None:
+            on_chunk(row_count, writer.written)
+    if writer is not None:
+        writer.flush()
+    return row_count, writer.written if writer is not None else 0, high_school_ids
+
+
+def _file_row(db: Session, file, category, uc_campus_name, year, high_school_type=None):
+    # The file's row in the files table; a file not registered yet is added with the given values
+    file_row = db.query(models.File).filter_by(location=file).first()
+    if file_row is None:
+        file_row = models.File(
+            location=file,
+            category=models.Category[category],
+            uc_campus_id=_get_uc_campus_id(db, uc_campus_name),
+            year=year,
+            high_school_type=models.HighSchoolType[high_school_type.upper()] if high_school_type else models.HighSchoolType.ALL,
+            is_added_to_db=False,
+        )
+        db.add(file_row)
+        db.commit()
+    return file_row
 
-    return True
 
+def _add_csv_file_to_db(db: Session, file, category, uc_campus_name, year, high_school_type=None, resolver=None):
+    # Same path as every other loader: checkpoint.ingest_file replaces the file's previous rows, sets its
+    # checkpoint and refreshes the derived tables; an unchanged file is skipped. Raises if the file failed
+    from .checkpoint import ingest_file
 
-def add_gender_csv_file_to_db(db: Session, file, uc_campus_name, year):
-    logging.getLogger('werkzeug').info(f"In add_gender_csv_file_to_db file: {file}, {uc_campus_name}, {year}")
+    result = ingest_file(db, _file_row(db, file, category, uc_campus_name, year, high_school_type), resolver)
+    logging.getLogger('werkzeug').info(
+        f"{file}: {result['status']}" + (f", {result['rows']} rows read, {result['records']} rows written" if 'rows' in result else ""))
+    return True
 
-    # Detect file encoding
-    with open(file, 'rb') as raw_file:
-        result = chardet.detect(raw_file.read(10000))
-    
-    # Read the CSV file with detected encoding
-    df = pd.read_csv(file, encoding=result['encoding'], sep='\t')
-    
-    # Log the columns and number of rows in the DataFrame
-    logging.getLogger('werkzeug').info(f"Columns in the DataFrame: {df.columns.tolist()}")
-    logging.getLogger('werkzeug').info(f"Number of rows in the DataFrame: {len(df)}")
 
-    # Check if required columns are present
-    required_columns = ['Calculation1', 'School', 'City', 'County/State/ Territory', 'Count', 'All', 'Female', 'Male']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        error_msg = f"Missing required columns: {', '.join(missing_columns)}"
-        logging.getLogger('werkzeug').error(error_msg)
-        raise ValueError(error_msg)
+def add_gpa_csv_file_to_db(db: Session, file, uc_campus_name, year, resolver=None):
+    logging.getLogger('werkzeug').info(f"In add_gpa_csv_file_to_db file: {file}, {uc_campus_name}, {year}")
+    return _add_csv_file_to_db(db, file, 'GPA', uc_campus_name, year, resolver=resolver)
 
-    # Get UC campus ID
-    uc_campus = crud.get_uc_campus_by_name(db, uc_campus_name)
-    if not uc_campus:
-        error_msg = f"Invalid UC campus name: {uc_campus_name}"
-        logging.getLogger('werkzeug').error(error_msg)
-        raise ValueError(error_msg)
-    
-    uc_campus_id = uc_campus.id
-
-    # Collect all gender records for batch insertion
-    gender_records = []
-
-    for _, row in df.iterrows():
-        try:
-            # Create or update high school
-            uc_school_name = row['Calculation1']
-            high_school = crud.get_high_school_by_uc_school_name(db, uc_school_name)
-            if not high_school:
-                if pd.isna(row['County/State/ Territory']) or row['County/State/ Territory'] == 'N/A':
-                    county = None
-                    state = None
-                    country = 'Unknown'
-                elif row['County/State/ Territory'] in ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']:
-                    county = None
-                    state = row['County/State/ Territory']
-                    country = 'United States'
-                else:
-                    county = row['County/State/ Territory']
-                    state = 'CA'
-                    country = 'United States'
-
-                high_school = crud.create_high_school(db, {
-                    'uc_school_name': uc_school_name,
-                    'school_name': row['School'],
-                    'city': row['City'],
-                    'county': county,
-                    'state': state,
-                    'country': country,
-                    'is_public': True  # Assuming all schools are public, adjust if needed
-                })
-
-            # Get admission type from the 'Count' column
-            admission_type = row['Count']
-            
-            # Map CSV columns to database columns
-            total_applicants = int(row['All']) if pd.notna(row['All']) else 0
-            male_applicants = int(row['Male']) if pd.notna(row['Male']) else 0
-            female_applicants = int(row['Female']) if pd.notna(row['Female']) else 0
-            other_applicants = int(row['Other']) if 'Other' in row and pd.notna(row['Other']) else 0
-            unknown_gender = int(row['Unknown']) if 'Unknown' in row and pd.notna(row['Unknown']) else 0
-
-            # If 'Unknown' is not in the CSV, calculate it
-            if 'Unknown' not in row:
-                unknown_gender = total_applicants - male_applicants - female_applicants - other_applicants
-
-            gender_records.append({
-                'high_school_id': high_school.id,
-                'uc_campus_id': uc_campus_id,
-                'admission_type': admission_type,
-                'academic_year': year,
-                'total_applicants': total_applicants,
-                'male_applicants': male_applicants,
-                'female_applicants': female_applicants,
-                'other_applicants': other_applicants,
-                'unknown_gender': unknown_gender
-            })
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error processing row: {row}")
-            logging.getLogger('werkzeug').error(f"Error details: {str(e)}")
-            continue
-
-    # Perform batch insertion of gender records
-    if gender_records:
-        try:
-            crud.bulk_create_uc_admission_gender(db, gender_records)            
-            logging.getLogger('werkzeug').info("All rows processed successfully")
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error bulk creating uc admission gender: {e}")
-            db.rollback()
 
-    return True
+def add_gender_csv_file_to_db(db: Session, file, uc_campus_name, year, resolver=None):
+    logging.getLogger('werkzeug').info(f"In add_gender_csv_file_to_db file: {file}, {uc_campus_name}, {year}")
+    return _add_csv_file_to_db(db, file, 'GENDER', uc_campus_name, year, resolver=resolver)
 
 
-def add_ethnicity_csv_file_to_db(db: Session, file, uc_campus_name, year, high_school_type):
+def add_ethnicity_csv_file_to_db(db: Session, file, uc_campus_name, year, high_school_type, resolver=None):
     logging.getLogger('werkzeug').info(f"In add_ethnicity_csv_file_to_db file: {file}, {uc_campus_name}, {year}, {high_school_type}")
+    return _add_csv_file_to_db(db, file, 'ETHNICITY', uc_campus_name, year, high_school_type, resolver)
 
-    # Detect file encoding
-    with open(file, 'rb') as raw_file:
-        result = chardet.detect(raw_file.read(10000))
-    
-    # Read the tab-delimited CSV file with detected encoding
-    df = pd.read_csv(file, encoding=result['encoding'], sep='\t')
-    
-    # Log the columns and number of rows in the DataFrame
-    logging.getLogger('werkzeug').info(f"Columns in the DataFrame: {df.columns.tolist()}")
-    logging.getLogger('werkzeug').info(f"Number of rows in the DataFrame: {len(df)}")
-    # logging.getLogger('werkzeug').info("First 10 rows of the DataFrame:")
-    # for index, row in df.head(10).iterrows():
-    #     logging.getLogger('werkzeug').info(f"Row {index}: {row.to_dict()}")
-
-    # Check if required columns are present
-    required_columns = ['Calculation1', 'School', 'City', 'County/State/ Territory', 'Count']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        error_msg = f"Missing required columns: {', '.join(missing_columns)}"
-        logging.getLogger('werkzeug').error(error_msg)
-        raise ValueError(error_msg)
-
-    # Get UC campus ID
-    uc_campus = crud.get_uc_campus_by_name(db, uc_campus_name)
-    if not uc_campus:
-        error_msg = f"Invalid UC campus name: {uc_campus_name}"
-        logging.getLogger('werkzeug').error(error_msg)
-        raise ValueError(error_msg)
-    
-    uc_campus_id = uc_campus.id
-
-    # Collect all ethnicity records for batch insertion
-    ethnicity_records = []
-
-    # i = 0
-    for _, row in df.iterrows():
-        # # testing purpose
-        # i += 1
-        # if i > 100:
-        #     break
-
-
-        try:
-            # Create or update high school
-            uc_school_name = row['Calculation1']
-            high_school = crud.get_high_school_by_uc_school_name(db, uc_school_name)
-            if not high_school:
-                if high_school_type.upper() in ['CA_PUBLIC', 'CA_PRIVATE']:
-                    county = row['County/State/ Territory']
-                    state = 'CA'
-                    country = 'United States'
-                elif high_school_type.upper() == 'NON_CA':
-                    county = None
-                    state = row['County/State/ Territory']
-                    country = 'United States'
-                elif high_school_type.upper() == 'FOREIGN':
-                    county = None
-                    state = None
-                    country = row['County/State/ Territory']
-                else:
-                    raise ValueError(f"Invalid high school type: {high_school_type}")
-
-                high_school = crud.create_high_school(db, {
-                    'uc_school_name': uc_school_name,
-                    'school_name': row['School'],
-                    'city': row['City'],
-                    'county': county,
-                    'state': state,
-                    'country': country,
-                    'is_public': high_school_type.upper() == 'CA_PUBLIC'
-                })
-            # Get admission type from the 'Count' column
-            admission_type = row['Count']
-            
-            # Create ethnicity records
-            ethnicities = ['All','African American', 'American Indian', 'Hispanic/ Latinx', 'Pacific Islander', 'Asian', 'White', 'Domestic Unknown', "Int'l"]
-            for ethnicity in ethnicities:
-                count = row.get(ethnicity, 0)  # Use 0 if the column doesn't exist
-                if pd.notna(count):  # Check if the value is not NaN
-                    ethnicity_records.append({
-                        'high_school_id': high_school.id,
-                        'uc_campus_id': uc_campus_id,
-                        'admission_type': admission_type,
-                        'academic_year': year,
-                        'ethnicity': ethnicity,
-                        'count': int(count)
-                    })
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error processing row: {row}")
-            logging.getLogger('werkzeug').error(f"Error details: {str(e)}")
-            continue
-
-    # Perform batch insertion of ethnicity records
-    if ethnicity_records:
-        try:
-            crud.bulk_create_uc_admission_ethnicity(db, ethnicity_records)            
-            logging.getLogger('werkzeug').info("All rows processed successfully")
-        except Exception as e:
-            logging.getLogger('werkzeug').error(f"Error bulk creating uc admission ethnicity: {e}")
-            db.rollback()
 
-    return True
+def _high_school_references():
+    # Every (table, column) with a foreign key to high_schools.id, so merges never orphan rows
+    return [(table, fk.parent) for table in models.Base.metadata.sorted_tables
+            for fk in table.foreign_keys if fk.column.table.name == models.HighSchool.__tablename__]
 
-    
 
 def clean_high_school_table(db: Session):
     logging.getLogger('werkzeug').info("Starting high school table cleanup")
 
-    # Get all high schools
-    high_schools = db.query(models.HighSchool).all()
-
-    deleted_schools = []
-
-    for high_school in high_schools:
-        uc_school_name = high_school.uc_school_name
-
-        # Clean the uc_school_name
-        if uc_school_name and any(char.isdigit() for char in uc_school_name):
-            match = re.search(r'(\d+)$', uc_school_name)
-            if match:
-                digits = match.group(1)
-                stripped_digits = digits.lstrip('0')
-                uc_school_name2 = re.sub(r'\d+$', stripped_digits, uc_school_name)
-
-                # If the cleaned name is different, delete the row
-                if uc_school_name2 != uc_school_name:
-                    logging.getLogger('werkzeug').info(f"Deleting high school: {uc_school_name}")
-                    db.delete(high_school)
-                    deleted_schools.append(uc_school_name)
-
-    # Commit the changes
+    schools = pd.DataFrame(
+        db.query(models.HighSchool.id, models.HighSchool.uc_school_name, models.HighSchool.school_code).all(),
+        columns=['id', 'uc_school_name', 'school_code'],
+    )
+    schools = schools[schools['uc_school_name'].notna()]
+    codes = school_codes.split_school_codes(schools['uc_school_name'])
+    schools = schools.assign(normalized=codes['uc_school_name'], code=codes['school_code'])
+
+    # Per normalized name keep the row already carrying that name, else the oldest one
+    schools['is_normalized'] = schools['uc_school_name'] == schools['normalized']
+    schools = schools.sort_values(['normalized', 'is_normalized', 'id'], ascending=[True, False, True])
+    schools['keep_id'] = schools.groupby('normalized')['id'].transform('first')
+
+    duplicates = schools[schools['id'] != schools['keep_id']]
+    survivors = schools[schools['id'] == schools['keep_id']]
+    updates = survivors[~survivors['is_normalized'] | (survivors['school_code'] != survivors['code'])]
+    deleted_schools = duplicates['uc_school_name'].tolist()
+
+    merge_table = Table(
+        'high_school_merge', MetaData(),
+        Column('id', Integer, primary_key=True), Column('keep_id', Integer),
+        prefixes=['TEMPORARY'],
+    )
     try:
+        connection = db.connection()
+        if len(duplicates):
+            merge_table.create(connection)
+            connection.execute(merge_table.insert(), transform.frame_to_records(duplicates[['id', 'keep_id']]))
+            merged_ids = select(merge_table.c.id)
+            # Repoint admission rows at the surviving school, then drop the duplicates
+            for table, column in _high_school_references():
+                keep_id = select(merge_table.c.keep_id).where(merge_table.c.id == column).scalar_subquery()
+                connection.execute(table.update().where(column.in_(merged_ids)).values({column.name: keep_id}))
+            connection.execute(models.HighSchool.__table__.delete().where(models.HighSchool.id.in_(merged_ids)))
+            merge_table.drop(connection)
+
+        if len(updates):
+            high_schools = models.HighSchool.__table__
+            connection.execute(
+                high_schools.update().where(high_schools.c.id == bindparam('school_id')).values(
+                    uc_school_name=bindparam('normalized'), school_code=bindparam('code')),
+                transform.frame_to_records(updates[['id', 'normalized', 'code']].rename(columns={'id': 'school_id'})),
+            )
+        if len(duplicates) or len(updates):
+            generation.bump(db)
         db.commit()
-        logging.getLogger('werkzeug').info(f"High school table cleanup completed. Deleted {len(deleted_schools)} rows.")
+        crud.invalidate_high_school_data()
+        cube.invalidate_cube()
+        ranking.invalidate_rankings()
+        search.invalidate_index()
+        if len(duplicates):
+            # Metrics and trends are keyed by high_school_id, and the rollups sum by the schools' location,
+            # so merged schools need a rebuild
+            metrics.refresh_metrics(db)
+            trends.refresh_trends(db)
+            geo.refresh_geo_rollups(db)
+        if len(duplicates) or len(updates):
+            # Profiles embed the school names and are keyed by high_school_id
+            profiles.rebuild_profiles(db)
+        logging.getLogger('werkzeug').info(f"High school table cleanup completed. Merged {len(deleted_schools)} rows, updated {len(updates)} rows.")
     except Exception as e:
         db.rollback()
         logging.getLogger('werkzeug').error(f"Error during high school table cleanup: {str(e)}")
+        raise
 
     return deleted_schools
 
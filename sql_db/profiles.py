@@ -0,0 +1,88 @@
+import argparse
+import gzip
+import logging
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+# Profiles are stored gzip compressed, ready to be sent with Content-Encoding: gzip
+PROFILE_ENCODING = 'gzip'
+
+
+def encode_profile(profile):
+    # (uncompressed size, body); mtime=0 keeps the bytes stable, so an unchanged profile compresses to the same blob
+    raw = orjson.dumps(profile)
+    return len(raw), gzip.compress(raw, compresslevel=6, mtime=0)
+
+
+def decode_profile(body):
+    return orjson.loads(gzip.decompress(body))
+
+
+def discard_profiles(db: Session, high_school_ids):
+    # Deletes the stored profiles of the given schools (a list or a SELECT of ids) in the caller's transaction
+    return db.query(models.HighSchoolProfile).filter(
+        models.HighSchoolProfile.high_school_id.in_(high_school_ids)).delete(synchronize_session=False)
+
+
+def _store(db: Session, profiles):
+    rows = []
+    for high_school_id, profile in profiles.items():
+        raw_size, body = encode_profile(profile)
+        rows.append({'high_school_id': high_school_id, 'encoding': PROFILE_ENCODING, 'raw_size': raw_size, 'body': body})
+    if rows:
+        discard_profiles(db, list(profiles))
+        db.execute(models.HighSchoolProfile.__table__.insert(), rows)
+    return len(rows)
+
+
+def refresh_profiles(db: Session, high_school_ids=None):
+    # Builds the given schools' profiles, or every school without a stored one; returns the number written
+    if high_school_ids is None:
+        stored = select(models.HighSchoolProfile.high_school_id)
+        high_school_ids = [row[0] for row in db.query(models.HighSchool.id).filter(models.HighSchool.id.notin_(stored))]
+    high_school_ids = list(high_school_ids)
+    written = 0
+    for start in range(0, len(high_school_ids), crud.HIGH_SCHOOL_DATA_CHUNK_SIZE):
+        chunk = high_school_ids[start:start + crud.HIGH_SCHOOL_DATA_CHUNK_SIZE]
+        written += _store(db, crud.build_high_school_data(db, chunk))
+        db.commit()
+    if written:
+        logging.getLogger('werkzeug').info(f"Refreshed {written} high school profiles")
+    return written
+
+
+def rebuild_profiles(db: Session):
+    db.query(models.HighSchoolProfile).delete(synchronize_session=False)
+    db.commit()
+    return refresh_profiles(db)
+
+
+def get_profile_body(db: Session, high_school_id: int):
+    # (gzip compressed profile JSON, raw size) as stored. None if the school does not exist.
+    # A profile not stored yet is assembled and compressed for this response only: reads never write,
+    # ingestion and `python -m sql_db.profiles` fill the table
+    row = db.query(models.HighSchoolProfile.body, models.HighSchoolProfile.raw_size).filter(
+        models.HighSchoolProfile.high_school_id == high_school_id).first()
+    if row is not None:
+        return row.body, row.raw_size
+    profile = crud.get_high_school_data_by_id(db, high_school_id)
+    if profile is None:
+        return None
+    raw_size, body = encode_profile(profile)
+    return body, raw_size
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Build the high_school_profiles read model")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild every profile instead of only the missing ones")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        written = rebuild_profiles(db) if args.rebuild else refresh_profiles(db)
+        print(f"Wrote {written} high school profiles")
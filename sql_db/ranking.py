@@ -0,0 +1,176 @@
+import threading
+
+import numpy as np
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from . import generation, models
+from .crud import GENDER_FIELDS
+from .cube import ADMISSION_TYPES, fetch_rows
+from .transform import ETHNICITIES, ETHNICITY_COLUMNS
+
+METRICS = GENDER_FIELDS + ETHNICITIES + ['mean_gpa']
+
+
+class Partition:
+    """Schools of one (campus, year, admission_type, metric) ordered best first.
+
+    keys holds the negated values so the ordering is ascending and can be
+    binary searched; ties are ordered by high_school_id.
+    """
+
+    __slots__ = ('school_ids', 'keys')
+
+    def __init__(self, school_ids, keys):
+        self.school_ids, self.keys = school_ids, keys
+
+    def __len__(self):
+        return len(self.school_ids)
+
+    def top(self, n):
+        return [(int(school_id), _native(-key)) for school_id, key in zip(self.school_ids[:n], self.keys[:n])]
+
+    def rank(self, high_school_id):
+        # Competition rank (1 = best) and mid-rank percentile (share of schools below, counting ties as half)
+        positions = np.flatnonzero(self.school_ids == high_school_id)
+        if not len(positions):
+            return None
+        key = self.keys[positions[0]]
+        above = int(np.searchsorted(self.keys, key, 'left'))
+        ties = int(np.searchsorted(self.keys, key, 'right')) - above
+        below = len(self) - above - ties
+        return {
+            'rank': above + 1,
+            'of': len(self),
+            'percentile': round(100.0 * (below + 0.5 * ties) / len(self), 2),
+            'value': _native(-key),
+        }
+
+
+def _native(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+def _facts(db: Session, partitions=None):
+    # (campus, year, type code, metric code, school, value) arrays for every non-null fact of the partitions
+    G, E, P = models.UCAdmissionGender, models.UCAdmissionEthnicityCounts, models.UCAdmissionGPA
+    metric_codes = {metric: i for i, metric in enumerate(METRICS)}
+    parts = []
+
+    def rows(model, *columns):
+        statement = select(model.uc_campus_id, model.academic_year, model.admission_type, model.high_school_id, *columns)
+        if partitions is not None:
+            statement = statement.where(tuple_(model.uc_campus_id, model.academic_year).in_(partitions))
+        result = fetch_rows(db, statement)
+        return list(zip(*result)) if result else None
+
+    def add(columns, metric, values):
+        values = np.asarray(values, dtype=np.float64)
+        types = np.asarray([-1 if t is None else t for t in columns[2]], dtype=np.int64)
+        keep = ~np.isnan(values) & (types >= 0) & (metric >= 0)
+        parts.append(tuple(np.asarray(column, dtype=np.int64)[keep] for column in (columns[0], columns[1])) + (
+            types[keep], np.broadcast_to(metric, values.shape)[keep], np.asarray(columns[3], dtype=np.int64)[keep], values[keep]))
+
+    gender = rows(G, *[getattr(G, field) for field in GENDER_FIELDS])
+    if gender:
+        for i, field in enumerate(GENDER_FIELDS):
+            add(gender, metric_codes[field], gender[4 + i])
+    ethnicity = rows(E, *[getattr(E, column) for _, column in ETHNICITY_COLUMNS])
+    if ethnicity:
+        for i, (label, _) in enumerate(ETHNICITY_COLUMNS):
+            add(ethnicity, metric_codes[label], ethnicity[4 + i])
+    gpa = rows(P, P.mean_gpa)
+    if gpa:
+        add(gpa, metric_codes['mean_gpa'], [np.nan if v is None else v for v in gpa[4]])
+    if not parts:
+        return None
+    return [np.concatenate(column) for column in zip(*parts)]
+
+
+def build_partitions(db: Session, partitions=None):
+    # {(uc_campus_id, academic_year, admission_type, metric): Partition} with one lexsort over all facts
+    facts = _facts(db, partitions)
+    if facts is None:
+        return {}
+    campus, year, admission_type, metric, school, value = facts
+    order = np.lexsort((school, -value, metric, admission_type, year, campus))
+    campus, year, admission_type, metric, school, value = [column[order] for column in facts]
+    starts = np.flatnonzero(np.r_[True, (np.diff(campus) != 0) | (np.diff(year) != 0) |
+                                  (np.diff(admission_type) != 0) | (np.diff(metric) != 0)])
+    ends = np.r_[starts[1:], len(order)]
+    school, keys = school.astype(np.int32), -value
+    return {
+        (int(campus[start]), int(year[start]), ADMISSION_TYPES[admission_type[start]], METRICS[metric[start]]):
+            Partition(school[start:end], keys[start:end])
+        for start, end in zip(starts, ends)
+    }
+
+
+class RankingStore:
+    """Precomputed orderings for every (campus, year, admission_type, metric)."""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, db: Session):
+        return cls(build_partitions(db))
+
+    def refresh(self, db: Session, campus_years):
+        # Rebuilds only the given (uc_campus_id, academic_year) slices, e.g. after a file is ingested
+        campus_years = sorted(set(campus_years))
+        if not campus_years:
+            return
+        rebuilt = build_partitions(db, campus_years)
+        with self._lock:
+            partitions = {key: partition for key, partition in self.partitions.items() if key[:2] not in set(campus_years)}
+            partitions.update(rebuilt)
+            # Swapped in whole, so concurrent readers see either the old or the new orderings
+            self.partitions = partitions
+
+    def _partition(self, uc_campus_id, academic_year, admission_type, metric):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        return self.partitions.get((uc_campus_id, academic_year, admission_type, metric))
+
+    def top(self, uc_campus_id, academic_year, admission_type, metric, n=10):
+        partition = self._partition(uc_campus_id, academic_year, admission_type, metric)
+        return partition.top(n) if partition is not None else []
+
+    def rank(self, high_school_id, uc_campus_id, academic_year, admission_type, metric):
+        partition = self._partition(uc_campus_id, academic_year, admission_type, metric)
+        return partition.rank(high_school_id) if partition is not None else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rankings(db: Session):
+    # Ingestion in another process cannot refresh this store, so it is rebuilt whole once the data generation moved
+    global _store
+    stale = generation.changed(db, 'rankings')
+    with _store_lock:
+        if stale:
+            _store = None
+        if _store is None:
+            _store = RankingStore.load(db)
+        return _store
+
+
+def refresh_rankings(db: Session, campus_years):
+    # Incremental rebuild after ingestion; a store that was never loaded is built on first use instead
+    with _store_lock:
+        store = _store
+    if store is not None:
+        store.refresh(db, campus_years)
+    generation.record('rankings')
+
+
+def invalidate_rankings():
+    global _store
+    with _store_lock:
+        _store = None
+    generation.record('rankings')
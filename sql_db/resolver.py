@@ -0,0 +1,83 @@
+import logging
+import threading
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models, transform
+
+# Keeps each multi-row INSERT well below the 65535 bind parameter limit of Postgres
+INSERT_CHUNK_SIZE = 5000
+
+
+class HighSchoolResolver:
+    """Maps uc_school_name -> high_schools.id for a whole ingestion run.
+
+    The existing ids are loaded with one query the first time a batch is
+    resolved; unseen schools are then inserted in bulk and added to the map,
+    so every later file in the same run resolves its schools in memory.
+    """
+
+    def __init__(self, db: Session, commit: bool = False):
+        # commit=True publishes new schools immediately, for resolvers shared by
+        # several writer sessions that must see each other's schools
+        self.db = db
+        self.commit = commit
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = self.db.execute(
+            select(models.HighSchool.uc_school_name, models.HighSchool.id)
+            .where(models.HighSchool.uc_school_name.isnot(None))
+        ).all()
+        self._ids = dict(rows)
+        logging.getLogger('werkzeug').info(f"Loaded {len(self._ids)} high school ids")
+
+    def invalidate(self):
+        # Call after a rollback: ids inserted in the rolled back transaction are gone
+        with self._lock:
+            self._ids = None
+
+    def resolve(self, schools: pd.DataFrame) -> dict:
+        # schools has one row per uc_school_name with the HighSchool column values
+        with self._lock:
+            if self._ids is None:
+                self.load()
+
+            unseen = schools[~schools['uc_school_name'].isin(self._ids.keys())]
+            if len(unseen):
+                self._ids.update(self._insert(transform.frame_to_records(unseen[transform.HIGH_SCHOOL_COLUMNS])))
+                if self.commit:
+                    self.db.commit()
+
+            return {name: self._ids[name] for name in schools['uc_school_name']}
+
+    def _insert(self, school_records: list) -> dict:
+        table = models.HighSchool.__table__
+        dialect = self.db.get_bind().dialect.name
+        inserted = {}
+        for start in range(0, len(school_records), INSERT_CHUNK_SIZE):
+            chunk = school_records[start:start + INSERT_CHUNK_SIZE]
+            if dialect == 'postgresql':
+                # A school inserted concurrently by another run is returned by the no-op update
+                stmt = postgresql.insert(table).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.uc_school_name],
+                    set_={'uc_school_name': stmt.excluded.uc_school_name},
+                ).returning(table.c.uc_school_name, table.c.id)
+                inserted.update(dict(self.db.execute(stmt).all()))
+            else:
+                if dialect == 'sqlite':
+                    stmt = sqlite.insert(table).values(chunk).on_conflict_do_nothing(index_elements=[table.c.uc_school_name])
+                else:
+                    stmt = table.insert().values(chunk)
+                self.db.execute(stmt)
+                names = [school['uc_school_name'] for school in chunk]
+                inserted.update(dict(self.db.execute(
+                    select(table.c.uc_school_name, table.c.id).where(table.c.uc_school_name.in_(names))
+                ).all()))
+        logging.getLogger('werkzeug').info(f"Inserted {len(school_records)} new high schools")
+        return inserted
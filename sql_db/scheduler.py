@@ -0,0 +1,147 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import checkpoint, geo, metrics, models, profiles, ranking, trends
+from .database import SessionLocal, engine
+from .process_csv_file import parse_admission_file
+from .resolver import HighSchoolResolver
+
+DEFAULT_WRITERS = 2
+
+
+def list_files_to_ingest(db: Session, include_added=True):
+    # Pending files always; already added ones too so that changed files are picked up.
+    # A plain read that locks and marks nothing: run_pending_files is single-runner, and two runs at once would
+    # ingest the same files. Ingestion that has to run concurrently goes through sql_db.jobs, which claims its jobs
+    query = db.query(models.File)
+    if not include_added:
+        query = query.filter(or_(models.File.is_added_to_db == False, models.File.is_added_to_db.is_(None)))  # noqa: E712
+    return [checkpoint.file_info(file) for file in query.order_by(models.File.id).all()]
+
+
+def _parse(file_info):
+    # Runs in a worker process: hash, then decode + transform only if the file changed
+    start = time.perf_counter()
+    content_hash = checkpoint.file_hash(file_info['location'])
+    if checkpoint.is_unchanged(file_info['is_added_to_db'], file_info['content_hash'], content_hash):
+        return None, content_hash, time.perf_counter() - start
+    parsed = parse_admission_file(
+        file_info['location'], file_info['category'], file_info['uc_campus_id'],
+        file_info['year'], file_info['high_school_type'], content_hash,
+    )
+    return parsed, content_hash, time.perf_counter() - start
+
+
+def _write(file_info, parsed, content_hash, resolver):
+    # Runs on one of the writer threads, each with its own session/connection
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        if parsed is None:
+            # Unchanged file: only backfill a missing hash
+            if file_info['content_hash'] is None:
+                db.query(models.File).filter_by(id=file_info['id']).update({'content_hash': content_hash})
+                db.commit()
+            written, high_school_ids = None, set()
+        else:
+            _, written, high_school_ids = checkpoint.commit_file(db, file_info, [parsed], content_hash, resolver)
+    return written, high_school_ids, time.perf_counter() - start
+
+
+def run_pending_files(workers=None, writers=DEFAULT_WRITERS, include_added=True):
+    # Only one run at a time (see list_files_to_ingest)
+    workers = workers or os.cpu_count() or 1
+    if engine.dialect.name == 'sqlite':
+        # SQLite allows a single writer at a time
+        writers = 1
+
+    run_start = time.perf_counter()
+    with SessionLocal() as db:
+        pending = list_files_to_ingest(db, include_added)
+    logging.getLogger('werkzeug').info(f"Checking {len(pending)} files with {workers} parsers and {writers} writers")
+
+    # One resolver for the whole run: new schools are inserted and committed under its lock,
+    # so two files never create the same HighSchool
+    resolver_db = SessionLocal()
+    resolver = HighSchoolResolver(resolver_db, commit=True)
+    results = {file_info['id']: {'file_id': file_info['id'], 'location': file_info['location'], 'status': 'pending'}
+               for file_info in pending}
+
+    # Keep a bounded number of parsed files waiting for a writer so memory stays flat
+    max_in_flight = workers + writers
+    queue = list(pending)
+    parsing, writing = {}, {}
+    high_school_ids = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as parsers, ThreadPoolExecutor(max_workers=writers) as writer_pool:
+            while queue or parsing or writing:
+                while queue and len(parsing) + len(writing) < max_in_flight:
+                    file_info = queue.pop(0)
+                    parsing[parsers.submit(_parse, file_info)] = file_info
+
+                done, _ = wait(list(parsing) + list(writing), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in parsing:
+                        file_info = parsing.pop(future)
+                        result = results[file_info['id']]
+                        try:
+                            parsed, content_hash, result['parse_seconds'] = future.result()
+                        except Exception as e:
+                            result.update({'status': 'error', 'error': str(e)})
+                            logging.getLogger('werkzeug').error(f"Error parsing {file_info['location']}: {e}")
+                            with SessionLocal() as db:
+                                checkpoint.mark_failed(db, file_info['id'], e)
+                            continue
+                        if parsed is None and file_info['content_hash'] is not None:
+                            result['status'] = 'skipped'
+                            continue
+                        if parsed is not None:
+                            result['rows'] = parsed[2]
+                        writing[writer_pool.submit(_write, file_info, parsed, content_hash, resolver)] = file_info
+                    else:
+                        file_info = writing.pop(future)
+                        result = results[file_info['id']]
+                        try:
+                            result['records'], written_ids, result['write_seconds'] = future.result()
+                            high_school_ids.update(written_ids)
+                            result['status'] = 'skipped' if result['records'] is None else 'success'
+                        except Exception as e:
+                            result.update({'status': 'error', 'error': str(e)})
+                            logging.getLogger('werkzeug').error(f"Error writing {file_info['location']}: {e}")
+    finally:
+        resolver_db.close()
+
+    # Only the (campus, year) partitions of files that were written are recomputed
+    written = [file_info for file_info in pending if results[file_info['id']]['status'] == 'success']
+    with SessionLocal() as db:
+        metrics.refresh_metrics(db, metrics.touched_partitions(written))
+        trends.refresh_trends(db, trends.touched_campuses(written))
+        geo.refresh_geo_rollups(db, geo.touched_partitions(written))
+        ranking.refresh_rankings(db, [(file_info['uc_campus_id'], file_info['year']) for file_info in written])
+        # commit_file discarded the affected schools' profiles; only those are rebuilt
+        profiles.refresh_profiles(db, high_school_ids)
+
+    return {
+        'workers': workers,
+        'writers': writers,
+        'total_seconds': time.perf_counter() - run_start,
+        'files': list(results.values()),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest new, changed and previously failed files")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument('--writers', type=int, default=DEFAULT_WRITERS, help="database writer connections")
+    parser.add_argument('--pending-only', action='store_true', help="skip hashing files already added to the db")
+    args = parser.parse_args()
+
+    summary = run_pending_files(args.workers, args.writers, include_added=not args.pending_only)
+    for result in summary['files']:
+        print(f"{result['status']:<8} {result.get('parse_seconds', 0):7.2f}s parse {result.get('write_seconds', 0):7.2f}s write  {os.path.basename(result['location'])}")
+    print(f"{len(summary['files'])} files in {summary['total_seconds']:.2f}s")
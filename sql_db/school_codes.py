@@ -0,0 +1,21 @@
+import pandas as pd
+
+# 'A B MILLER HIGH SCHOOL050944' -> name 'A B MILLER HIGH SCHOOL', code '050944'
+SCHOOL_CODE_PATTERN = r'^(?P<name>.*?)(?P<code>\d+)$'
+
+
+def split_school_codes(uc_school_names: pd.Series) -> pd.DataFrame:
+    # Whole-column split into the school name and its trailing CEEB-style code
+    parts = uc_school_names.str.extract(SCHOOL_CODE_PATTERN)
+    digits = parts['code'].str.lstrip('0')
+    has_code = parts['code'].notna()
+    return pd.DataFrame({
+        # Leading zeros are dropped, so '050944' and '50944' name the same school
+        'uc_school_name': (parts['name'] + digits).where(has_code, uc_school_names),
+        # Python ints (None when there is no code) so every DB driver can bind them
+        'school_code': pd.to_numeric(parts['code']).astype('Int64').astype(object).where(has_code, None),
+    }, index=uc_school_names.index)
+
+
+def normalize_uc_school_names(uc_school_names: pd.Series) -> pd.Series:
+    return split_school_codes(uc_school_names)['uc_school_name']
@@ -0,0 +1,157 @@
+import re
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from . import generation, models
+
+DEFAULT_LIMIT = 10
+# Same default cut-off as pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+# The in-process index picks up new schools incrementally; a full rebuild catches renames/deletes
+INDEX_MAX_AGE = 3600
+
+
+def trigrams(text):
+    # pg_trgm style: lower-cased alphanumeric words padded with two spaces before and one after
+    grams = set()
+    for word in re.findall(r'[a-z0-9]+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """In-process n-gram inverted index over high_schools, used when pg_trgm is not available.
+
+    Posting lists are NumPy arrays of row positions, so scoring a query is a
+    bincount over the lists of its trigrams rather than a scan of every name.
+    """
+
+    def __init__(self):
+        self.ids, self.names, self.sizes = [], [], []
+        self.cities, self.states = [], []
+        self.max_id = 0
+        self.built_at = time.monotonic()
+        self._postings = {}
+        self._arrays = None
+
+    def add(self, high_school_id, school_name, city, state):
+        position = len(self.ids)
+        grams = trigrams(school_name)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(position)
+        self.ids.append(high_school_id)
+        self.names.append((school_name or '').lower())
+        self.sizes.append(len(grams))
+        self.cities.append((city or '').lower())
+        self.states.append((state or '').upper())
+        self.max_id = max(self.max_id, high_school_id)
+        self._arrays = None
+
+    def _freeze(self):
+        if self._arrays is None:
+            postings = {gram: np.asarray(positions, dtype=np.int32) for gram, positions in self._postings.items()}
+            self._arrays = (postings, np.asarray(self.ids), np.asarray(self.sizes, dtype=np.float64),
+                            np.asarray(self.names, dtype=str), np.asarray(self.cities, dtype=object),
+                            np.asarray(self.states, dtype=object))
+        return self._arrays
+
+    def _count(self, postings, grams):
+        lists = [postings[gram] for gram in grams if gram in postings]
+        if not lists:
+            return np.zeros(len(self.ids), dtype=np.int64)
+        return np.bincount(np.concatenate(lists), minlength=len(self.ids))
+
+    def search(self, name, city=None, state=None, limit=DEFAULT_LIMIT, threshold=SIMILARITY_THRESHOLD):
+        # Returns [(high_school_id, score)], substring matches first (like ILIKE), then by similarity
+        postings, ids, sizes, names, cities, states = self._freeze()
+        query = trigrams(name)
+        if not query or not len(ids):
+            return []
+        shared = self._count(postings, query).astype(np.float64)
+        score = shared / (len(query) + sizes - shared)
+
+        mask = np.ones(len(ids), dtype=bool)
+        if city:
+            mask &= cities == city.lower()
+        if state:
+            mask &= states == state.upper()
+
+        # A name containing the query contains all of its unpadded trigrams, so only those
+        # rows need the (C-level) substring test
+        core = {gram for gram in query if ' ' not in gram}
+        maybe_substring = mask & (self._count(postings, core) == len(core))
+        is_substring = np.zeros(len(ids), dtype=bool)
+        positions = np.flatnonzero(maybe_substring)
+        is_substring[positions] = np.char.find(names[positions], name.lower()) >= 0
+
+        selected = np.flatnonzero(mask & (is_substring | (score >= threshold)))
+        order = np.lexsort((-score[selected], ~is_substring[selected]))[:limit]
+        return [(int(ids[position]), float(score[position])) for position in selected[order]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _refresh_index(db: Session):
+    global _index
+    # Ingestion (here or in another process) may have merged or renamed schools
+    stale = generation.changed(db, 'search')
+    with _index_lock:
+        if _index is None or stale or time.monotonic() - _index.built_at > INDEX_MAX_AGE:
+            _index = TrigramIndex()
+        rows = db.query(
+            models.HighSchool.id, models.HighSchool.school_name, models.HighSchool.city, models.HighSchool.state
+        ).filter(models.HighSchool.id > _index.max_id).order_by(models.HighSchool.id).all()
+        for row in rows:
+            _index.add(*row)
+        return _index
+
+
+def schools_inserted():
+    # Ingestion only inserts schools, and the index picks those up by id on its next use
+    generation.record('search')
+
+
+def invalidate_index():
+    # After merges or renames, which the id scan does not see
+    global _index
+    with _index_lock:
+        _index = None
+    generation.record('search')
+
+
+def _search_postgres(db: Session, name, city, state, limit, threshold):
+    # Both % and ILIKE are served by the pg_trgm GIN index on school_name. The % cut-off is a
+    # per-connection setting, and pooled connections are shared, so it is set on every call
+    db.execute(select(func.set_limit(threshold)))
+    school_name = models.HighSchool.school_name
+    pattern = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    is_substring = school_name.ilike(f"%{pattern}%", escape='\\')
+    score = func.similarity(school_name, name)
+    query = db.query(models.HighSchool, score).filter(is_substring | school_name.op('%')(name))
+    if city:
+        query = query.filter(func.lower(models.HighSchool.city) == city.lower())
+    if state:
+        query = query.filter(func.upper(models.HighSchool.state) == state.upper())
+    query = query.order_by(case((is_substring, 1), else_=0).desc(), score.desc()).limit(limit)
+    return [(high_school, float(s)) for high_school, s in query.all()]
+
+
+def search_high_schools(db: Session, name: str, city: str = None, state: str = None,
+                        limit: int = DEFAULT_LIMIT, threshold: float = SIMILARITY_THRESHOLD):
+    # Ranked [(HighSchool, score)] for a school name with optional city/state filters
+    if not name:
+        return []
+    if db.get_bind().dialect.name == 'postgresql':
+        return _search_postgres(db, name, city, state, limit, threshold)
+
+    matches = _refresh_index(db).search(name, city, state, limit, threshold)
+    schools = {school.id: school for school in db.query(models.HighSchool).filter(models.HighSchool.id.in_([i for i, _ in matches]))}
+    # Schools deleted since the index was built are dropped here
+    return [(schools[i], score) for i, score in matches if i in schools]
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+
+from . import school_codes
+
+
+US_STATE_CODES = ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']
+
+# Ethnicity label in the CSVs -> its count column in uc_admission_ethnicity_counts, in CSV order
+ETHNICITY_COLUMNS = [
+    ('All', 'all_ethnicities'),
+    ('African American', 'african_american'),
+    ('American Indian', 'american_indian'),
+    ('Hispanic/ Latinx', 'hispanic_latinx'),
+    ('Pacific Islander', 'pacific_islander'),
+    ('Asian', 'asian'),
+    ('White', 'white'),
+    ('Domestic Unknown', 'domestic_unknown'),
+    ("Int'l", 'international'),
+]
+ETHNICITIES = [label for label, _ in ETHNICITY_COLUMNS]
+
+# A type's position is the smallint code stored in the admission tables' admission_type column
+ADMISSION_TYPES = ['App', 'Adm', 'Enr']
+
+GPA_TYPE_MAPPING = {
+    'App GPA': 'App',
+    'Adm GPA': 'Adm',
+    'Enrl GPA': 'Enr'
+}
+
+GPA_REQUIRED_COLUMNS = ['Calculation1', 'School', 'City', 'County/State/Country', 'App GPA', 'Adm GPA', 'Enrl GPA']
+GENDER_REQUIRED_COLUMNS = ['Calculation1', 'School', 'City', 'County/State/ Territory', 'Count', 'All', 'Female', 'Male']
+ETHNICITY_REQUIRED_COLUMNS = ['Calculation1', 'School', 'City', 'County/State/ Territory', 'Count']
+
+HIGH_SCHOOL_COLUMNS = ['uc_school_name', 'school_code', 'school_name', 'city', 'county', 'state', 'country', 'is_public']
+
+
+def check_required_columns(df: pd.DataFrame, required_columns):
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+
+def _none_if_missing(values: pd.Series) -> pd.Series:
+    # NaN cells become None so they are stored as NULL rather than 'NaN'
+    return values.astype(object).where(values.notna(), None)
+
+
+def classify_location(locations: pd.Series, ignore_case: bool = False) -> pd.DataFrame:
+    # Split the 'County/State/...' column into county/state/country for schools
+    # that come from the gender and GPA files (which mix all school types)
+    text = locations.astype(object).where(locations.notna(), '')
+    compare = text.str.upper() if ignore_case else text
+    is_unknown = locations.isna().to_numpy() | (compare == 'N/A').to_numpy()
+    is_state = ~is_unknown & locations.isin(US_STATE_CODES).to_numpy()
+    is_county = ~is_unknown & ~is_state
+
+    values = locations.astype(object).to_numpy()
+    return pd.DataFrame({
+        'county': np.where(is_county, values, None),
+        'state': np.select([is_state, is_county], [values, 'CA'], default=None),
+        'country': np.where(is_unknown, 'Unknown', 'United States'),
+    }, index=locations.index)
+
+
+def classify_location_by_type(locations: pd.Series, high_school_type: str) -> pd.DataFrame:
+    # Ethnicity files are split by school type, so the column meaning is known up front
+    values = _none_if_missing(locations)
+    empty = pd.Series([None] * len(locations), index=locations.index, dtype=object)
+    school_type = high_school_type.upper()
+    if school_type in ['CA_PUBLIC', 'CA_PRIVATE']:
+        county, state, country = values, pd.Series('CA', index=locations.index), 'United States'
+    elif school_type == 'NON_CA':
+        county, state, country = empty, values, 'United States'
+    elif school_type == 'FOREIGN':
+        county, state, country = empty, empty, values
+    else:
+        raise ValueError(f"Invalid high school type: {high_school_type}")
+    return pd.DataFrame({'county': county, 'state': state, 'country': country}, index=locations.index)
+
+
+def _high_schools(df: pd.DataFrame, location: pd.DataFrame, is_public) -> pd.DataFrame:
+    schools = pd.DataFrame({
+        'uc_school_name': df['uc_school_name'],
+        'school_code': df['school_code'],
+        'school_name': _none_if_missing(df['School']),
+        'city': _none_if_missing(df['City']),
+        'county': _none_if_missing(location['county']),
+        'state': _none_if_missing(location['state']),
+        'country': _none_if_missing(location['country']),
+        'is_public': is_public,
+    }, index=df.index)
+    # The first row of a school decides its attributes, as in the row-by-row loaders
+    return schools.drop_duplicates('uc_school_name', keep='first').reset_index(drop=True)
+
+
+def _with_school_names(df: pd.DataFrame) -> pd.DataFrame:
+    # Every loader keys schools the same way: name + code without leading zeros
+    df = df[df['Calculation1'].notna()]
+    codes = school_codes.split_school_codes(df['Calculation1'].astype(str))
+    return df.assign(uc_school_name=codes['uc_school_name'], school_code=codes['school_code'])
+
+
+def _melt(df: pd.DataFrame, value_columns, labels):
+    # Wide -> long in row-major order (row 0 col 0, row 0 col 1, ...), keeping non-NaN cells
+    columns = []
+    for col in value_columns:
+        if col in df.columns:
+            columns.append(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float))
+        else:
+            columns.append(np.full(len(df), np.nan, dtype=float))
+    values = np.column_stack(columns).ravel() if columns else np.empty(0)
+    keep = ~np.isnan(values)
+    row_index = np.repeat(np.arange(len(df)), len(value_columns))[keep]
+    label_values = np.tile(np.asarray(labels, dtype=object), len(df))[keep]
+    return row_index, label_values, values[keep]
+
+
+def gpa_frames(df: pd.DataFrame, uc_campus_id: int, year: int):
+    check_required_columns(df, GPA_REQUIRED_COLUMNS)
+    df = _with_school_names(df)
+    location = classify_location(df['County/State/Country'], ignore_case=True)
+    schools = _high_schools(df, location, True)
+
+    row_index, admission_types, values = _melt(df, list(GPA_TYPE_MAPPING), list(GPA_TYPE_MAPPING.values()))
+    records = pd.DataFrame({
+        'uc_school_name': df['uc_school_name'].to_numpy()[row_index],
+        'uc_campus_id': uc_campus_id,
+        'academic_year': year,
+        'admission_type': admission_types,
+        'mean_gpa': values,
+    })
+    return schools, records
+
+
+def _counts(df: pd.DataFrame, column) -> np.ndarray:
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy().astype(np.int64)
+
+
+def gender_frames(df: pd.DataFrame, uc_campus_id: int, year: int):
+    check_required_columns(df, GENDER_REQUIRED_COLUMNS)
+    df = _with_school_names(df)
+    location = classify_location(df['County/State/ Territory'])
+    schools = _high_schools(df, location, True)
+
+    total = _counts(df, 'All')
+    male = _counts(df, 'Male')
+    female = _counts(df, 'Female')
+    other = _counts(df, 'Other')
+    # If 'Unknown' is not in the CSV, calculate it
+    unknown = _counts(df, 'Unknown') if 'Unknown' in df.columns else total - male - female - other
+
+    records = pd.DataFrame({
+        'uc_school_name': df['uc_school_name'].to_numpy(),
+        'uc_campus_id': uc_campus_id,
+        'admission_type': df['Count'].to_numpy(),
+        'academic_year': year,
+        'total_applicants': total,
+        'male_applicants': male,
+        'female_applicants': female,
+        'other_applicants': other,
+        'unknown_gender': unknown,
+    })
+    return schools, records
+
+
+def ethnicity_frames(df: pd.DataFrame, uc_campus_id: int, year: int, high_school_type: str):
+    check_required_columns(df, ETHNICITY_REQUIRED_COLUMNS)
+    df = _with_school_names(df)
+    location = classify_location_by_type(df['County/State/ Territory'], high_school_type)
+    schools = _high_schools(df, location, high_school_type.upper() == 'CA_PUBLIC')
+
+    # A missing ethnicity column counts as 0, like row.get(ethnicity, 0) did; an empty cell stays NULL
+    counts = {column: _ethnicity_counts(df, label) for label, column in ETHNICITY_COLUMNS}
+    # Rows without any count had no row in the long layout either
+    keep = ~np.all([values.isna().to_numpy() for values in counts.values()], axis=0)
+    records = pd.DataFrame({
+        'uc_school_name': df['uc_school_name'].to_numpy()[keep],
+        'uc_campus_id': uc_campus_id,
+        'admission_type': df['Count'].to_numpy()[keep],
+        'academic_year': year,
+        **{column: values.to_numpy()[keep] for column, values in counts.items()},
+    })
+    return schools, records
+
+
+def _ethnicity_counts(df: pd.DataFrame, column) -> pd.Series:
+    # Python ints, None for empty cells, so the nullable count columns bind cleanly
+    if column not in df.columns:
+        return pd.Series(0, index=df.index, dtype=object)
+    values = pd.to_numeric(df[column], errors='coerce')
+    return values.astype('Int64').astype(object).where(values.notna(), None)
+
+
+def attach_high_school_ids(records: pd.DataFrame, high_school_ids: dict) -> pd.DataFrame:
+    # Replace the uc_school_name key with the resolved high_school_id, keeping column order
+    ids = records['uc_school_name'].map(high_school_ids)
+    records = records.drop(columns=['uc_school_name'])
+    records.insert(0, 'high_school_id', ids.astype(np.int64))
+    return records
+
+
+def frame_to_records(frame: pd.DataFrame) -> list:
+    # .tolist() yields native Python scalars, which every DB driver can adapt
+    columns = list(frame.columns)
+    return [dict(zip(columns, row)) for row in zip(*(frame[col].tolist() for col in columns))]
@@ -0,0 +1,185 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .bulk_load import RecordWriter
+from .cube import fetch_rows
+from .transform import ADMISSION_TYPES
+
+# 0 in high_school_id / uc_campus_id stands for all of them: (school, 0) is one school across every campus,
+# (0, campus) every school at one campus and (0, 0) the whole system
+ALL = 0
+KEY = ['high_school_id', 'uc_campus_id', 'academic_year']
+COUNTS = ['applicants', 'admits', 'enrollees', 'female_applicants', 'male_applicants']
+DELTA_MEASURES = ['applicants', 'admits', 'enrollees', 'admit_rate']
+CAGR_MEASURES = ['applicants', 'admits', 'enrollees']
+ROLLING_YEARS = 3
+
+
+def _gender_counts(db: Session, campuses=None, high_school_ids=None):
+    # (school, campus, year) rows of applicant/admit/enrollee totals and female/male applicants, with one pivot
+    G = models.UCAdmissionGender
+    statement = select(G.high_school_id, G.uc_campus_id, G.academic_year, G.admission_type,
+                       G.total_applicants, G.female_applicants, G.male_applicants).where(
+        G.high_school_id.isnot(None), G.uc_campus_id.isnot(None), G.academic_year.isnot(None), G.admission_type.isnot(None))
+    if campuses is not None:
+        statement = statement.where(G.uc_campus_id.in_(campuses))
+    if high_school_ids is not None:
+        statement = statement.where(G.high_school_id.in_(high_school_ids))
+    frame = pd.DataFrame(fetch_rows(db, statement), columns=KEY + ['admission_type', 'total', 'female', 'male'])
+    # admission_type arrives as its stored code; types missing from the slice still get their columns
+    wide = frame.set_index(KEY + ['admission_type']).astype(float).unstack('admission_type').reindex(
+        columns=pd.MultiIndex.from_product([['total', 'female', 'male'], range(len(ADMISSION_TYPES))]))
+    app, adm, enr = (ADMISSION_TYPES.index(name) for name in ('App', 'Adm', 'Enr'))
+    return pd.DataFrame({
+        'applicants': wide[('total', app)],
+        'admits': wide[('total', adm)],
+        'enrollees': wide[('total', enr)],
+        'female_applicants': wide[('female', app)],
+        'male_applicants': wide[('male', app)],
+    }, index=wide.index).reset_index()
+
+
+def _stored_counts(db: Session, exclude_campuses):
+    # Per-school, per-campus counts already in admission_trends, except for the given campuses
+    T = models.AdmissionTrend
+    statement = select(*[getattr(T, column) for column in KEY + COUNTS]).where(
+        T.high_school_id != ALL, T.uc_campus_id != ALL, T.uc_campus_id.notin_(exclude_campuses))
+    frame = pd.DataFrame(fetch_rows(db, statement), columns=KEY + COUNTS)
+    frame[COUNTS] = frame[COUNTS].astype(float)
+    return frame
+
+
+def _rollup(counts, levels):
+    # counts plus its sums with each level's columns set to ALL, in one group by; min_count keeps all-missing sums NaN
+    frames = [counts] + [counts.assign(**{column: ALL for column in level}) for level in levels]
+    return pd.concat(frames, ignore_index=True).groupby(KEY)[COUNTS].sum(min_count=1).reset_index()
+
+
+def _nullable(values, integer=False):
+    # NaN -> None (and whole floats -> int) so both loader backends store NULLs in the right column type
+    missing = np.isnan(values)
+    values = np.where(missing, 0, values).astype(np.int64 if integer else np.float64).astype(object)
+    values[missing] = None
+    return values
+
+
+def _rolling_mean(matrix, window):
+    # Mean along the year axis over the last window years that have a value; years are few, so one pass per lag
+    present = ~np.isnan(matrix)
+    values = np.where(present, matrix, 0)
+    sums, counts = np.zeros(matrix.shape), np.zeros(matrix.shape)
+    for lag in range(min(window, matrix.shape[1])):
+        sums[:, lag:] += values[:, :matrix.shape[1] - lag]
+        counts[:, lag:] += present[:, :matrix.shape[1] - lag]
+    return sums / np.where(counts > 0, counts, np.nan)
+
+
+def trend_series(counts):
+    """Trend rows of every (school, campus) series in counts at once.
+
+    Each measure becomes a series x year matrix over the full year range, so the
+    deltas compare calendar neighbours: a missing year leaves the next delta empty.
+    CAGR runs from the first year of a series with a positive value.
+    """
+    columns = ['_row'] + COUNTS
+    counts = counts.assign(_row=1.0).set_index(KEY)[columns]
+    years = np.arange(counts.index.get_level_values('academic_year').min(),
+                      counts.index.get_level_values('academic_year').max() + 1)
+    grid = counts.unstack('academic_year').reindex(columns=pd.MultiIndex.from_product([columns, years]))
+    matrix = {column: grid[column].to_numpy() for column in columns}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        applicants = np.where(matrix['applicants'] > 0, matrix['applicants'], np.nan)
+        matrix['admit_rate'] = matrix['admits'] / applicants
+        matrix['female_share'] = matrix['female_applicants'] / applicants
+        matrix['male_share'] = matrix['male_applicants'] / applicants
+        for measure in DELTA_MEASURES:
+            delta = np.full_like(matrix[measure], np.nan)
+            delta[:, 1:] = np.diff(matrix[measure], axis=1)
+            matrix[f'{measure}_delta'] = delta
+        for measure in CAGR_MEASURES:
+            positive = np.where(matrix[measure] > 0, matrix[measure], np.nan)
+            first = (~np.isnan(positive)).argmax(axis=1)
+            span = (years[None, :] - years[first][:, None]).astype(float)
+            growth = (matrix[measure] / positive[np.arange(len(first)), first][:, None]) ** (1 / span) - 1
+            matrix[f'{measure}_cagr'] = np.where(span > 0, growth, np.nan)
+        matrix['admit_rate_avg3'] = _rolling_mean(matrix['admit_rate'], ROLLING_YEARS)
+
+    series, year = np.nonzero(~np.isnan(matrix['_row']))
+    rows = pd.DataFrame({
+        'high_school_id': grid.index.get_level_values('high_school_id')[series],
+        'uc_campus_id': grid.index.get_level_values('uc_campus_id')[series],
+        'academic_year': years[year],
+    })
+    for column in models.AdmissionTrend.__table__.columns:
+        if column.name not in KEY:
+            rows[column.name] = _nullable(matrix[column.name][series, year], column.type.python_type is int)
+    return rows
+
+
+def refresh_trends(db: Session, campuses=None):
+    # Rebuilds the series of the given uc_campus_ids (each school there and the campus total), or of all of them,
+    # then the cross-campus series, summed from every campus' per-school counts
+    if campuses is not None:
+        campuses = sorted(set(campuses))
+        if not campuses:
+            return 0
+    T = models.AdmissionTrend
+    try:
+        counts = _gender_counts(db, campuses)
+        if campuses is not None:
+            counts = pd.concat([counts, _stored_counts(db, campuses)], ignore_index=True)
+        counts = _rollup(counts, [['high_school_id'], ['uc_campus_id'], ['high_school_id', 'uc_campus_id']])
+        if campuses is not None:
+            counts = counts[counts.uc_campus_id.isin(campuses + [ALL])]
+        rows = trend_series(counts) if len(counts) else counts
+        query = db.query(T)
+        if campuses is not None:
+            query = query.filter(T.uc_campus_id.in_(campuses + [ALL]))
+        query.delete(synchronize_session=False)
+        with RecordWriter(db, T, list(rows.columns)) as writer:
+            writer.write_frame(rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logging.getLogger('werkzeug').info(
+        f"Refreshed {len(rows)} admission trend rows for {'all' if campuses is None else len(campuses)} campuses")
+    return len(rows)
+
+
+def touched_campuses(file_infos):
+    # Campuses whose series a set of ingested files can change; only gender files feed the trends
+    return {info['uc_campus_id'] for info in file_infos
+            if (info['category'] or '').upper() == 'GENDER' and info['uc_campus_id'] is not None}
+
+
+def _trend_dict(row):
+    return {column.name: getattr(row, column.name) for column in models.AdmissionTrend.__table__.columns}
+
+
+def get_trends(db: Session, high_school_id=ALL, uc_campus_id=None):
+    # Stored series of one school (ALL: every school) at one campus (ALL: across campuses), or at each campus
+    # and across them when uc_campus_id is None; a primary-key prefix either way
+    T = models.AdmissionTrend
+    query = db.query(T).filter(T.high_school_id == high_school_id)
+    if uc_campus_id is not None:
+        query = query.filter(T.uc_campus_id == uc_campus_id)
+    return [_trend_dict(row) for row in query.order_by(T.uc_campus_id, T.academic_year)]
+
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the admission_trends table")
+    parser.add_argument('--campus', type=int, nargs='*', help="uc_campus_ids to refresh (default: all)")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(f"Wrote {refresh_trends(db, args.campus)} admission trend rows")
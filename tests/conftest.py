@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+# sql_db.database builds its engine from DATABASE_URL at import time and sql_db.file_cache reads UC_FILE_CACHE_DIR,
+# so both point into a scratch directory before anything from sql_db is imported
+_directory = tempfile.mkdtemp(prefix='uc_admission_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_directory, 'test.db')
+os.environ['UC_FILE_CACHE_DIR'] = os.path.join(_directory, 'cache')
+
+import pandas as pd
+import pytest
+
+from sql_db import crud, cube, discovery, generation, models, ranking, search
+from sql_db.database import SessionLocal, engine
+
+GPA_COLUMNS = ['Calculation1', 'School', 'City', 'County/State/Country', 'App GPA', 'Adm GPA', 'Enrl GPA']
+
+
+@pytest.fixture
+def db():
+    # A fresh schema per test; the in-memory copies of the previous test's data go with it
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    crud.invalidate_high_school_data()
+    cube.invalidate_cube()
+    ranking.invalidate_rankings()
+    search.invalidate_index()
+    generation._seen.clear()
+    generation._own.clear()
+    with SessionLocal() as session:
+        crud.seed_uc_campuses(session)
+        crud.get_campus_names(session, refresh=True)
+        yield session
+
+
+def write_gpa_file(path, rows):
+    # A UTF-16 tab separated export like the bundled ones; rows are (school, code, app gpa, adm gpa, enrl gpa)
+    pd.DataFrame(
+        [[f'{school}{code}', school, 'Irvine', 'Orange', app, adm, enrl] for school, code, app, adm, enrl in rows],
+        columns=GPA_COLUMNS,
+    ).to_csv(path, sep='\t', index=False, encoding='utf-16')
+    return str(path)
+
+
+@pytest.fixture
+def gpa_file(db, tmp_path):
+    # Registered Berkeley 2023 GPA file; write_gpa_file(gpa_file.location, rows) sets its contents
+    location = str(tmp_path / 'FR GPA by Year Berkeley 2023.csv')
+    write_gpa_file(location, [])
+    discovery.register_files(db, [location])
+    return db.query(models.File).filter_by(location=location).one()
+
+
+def stored_gpa(db, file_id=None):
+    # {(uc_school_name, admission_type): mean_gpa} of the stored GPA rows
+    query = db.query(models.HighSchool.uc_school_name, models.UCAdmissionGPA.admission_type, models.UCAdmissionGPA.mean_gpa).join(
+        models.HighSchool, models.HighSchool.id == models.UCAdmissionGPA.high_school_id)
+    if file_id is not None:
+        query = query.filter(models.UCAdmissionGPA.file_id == file_id)
+    return {(name, admission_type): mean_gpa for name, admission_type, mean_gpa in query}
@@ -0,0 +1,64 @@
+import pytest
+
+from sql_db import admission_query, models
+from sql_db.transform import ETHNICITY_COLUMNS
+
+# Per compact row, the ethnicity columns that have a count; the rest stay NULL
+FILLED = [
+    ['all_ethnicities', 'asian', 'white'],
+    ['international'],
+    ['all_ethnicities', 'african_american', 'american_indian', 'hispanic_latinx', 'pacific_islander', 'asian', 'white',
+     'domestic_unknown', 'international'],
+    ['hispanic_latinx'],
+    ['all_ethnicities', 'white'],
+    ['domestic_unknown', 'international'],
+]
+
+
+@pytest.fixture
+def ethnicity_rows(db):
+    schools = [models.HighSchool(uc_school_name=f'SCHOOL{i}', school_name=f'SCHOOL {i}') for i in range(2)]
+    db.add_all(schools)
+    db.flush()
+    for position, columns in enumerate(FILLED):
+        db.add(models.UCAdmissionEthnicityCounts(
+            high_school_id=schools[position % 2].id, uc_campus_id=1 + position % 2, academic_year=2023,
+            admission_type=['App', 'Adm', 'Enr'][position % 3], **{column: 10 + position for column in columns}))
+    db.commit()
+
+
+def view_rows(db, parameters):
+    # What paging over the uc_admission_ethnicity view returns, in one query
+    model, query = admission_query.build_query(db, 'ethnicity', parameters)
+    return [dict(row._mapping) for row in db.execute(query.order_by(model.id))]
+
+
+def all_pages(db, parameters, limit, after=None):
+    rows = []
+    while True:
+        page = admission_query.fetch_page(db, 'ethnicity', parameters, after, limit)
+        assert len(page['rows']) <= limit
+        rows.extend(page['rows'])
+        if page['next_after'] is None:
+            return rows
+        after = page['next_after']
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 7, 100])
+@pytest.mark.parametrize('parameters', [{}, {'ethnicity': 'White,Asian'}, {'ethnicity': "Int'l,Asian"},
+                                        {'campus': '2'}, {'admission_type': 'App', 'ethnicity': 'White'}])
+def test_pages_match_the_view(db, ethnicity_rows, parameters, limit):
+    expected = view_rows(db, parameters)
+    assert all_pages(db, parameters, limit) == expected
+
+
+def test_cursor_inside_a_compact_row(db, ethnicity_rows):
+    expected = view_rows(db, {})
+    # The third compact row expands to every ethnicity; start from the middle of it
+    middle = [row['id'] for row in expected if row['id'] // len(ETHNICITY_COLUMNS) == 3][4]
+    assert all_pages(db, {}, 2, after=middle) == [row for row in expected if row['id'] > middle]
+
+
+def test_unknown_ethnicity_is_an_empty_page(db, ethnicity_rows):
+    assert admission_query.fetch_page(db, 'ethnicity', {'ethnicity': 'Martian'}) == {
+        'query_type': 'ethnicity', 'rows': [], 'next_after': None}
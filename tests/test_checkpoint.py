@@ -0,0 +1,74 @@
+import pytest
+
+from conftest import stored_gpa, write_gpa_file
+from sql_db import checkpoint, file_cache, models
+
+VERSION_1 = [('ALPHA HIGH SCHOOL', '050944', 3.9, 4.1, 4.2), ('BETA HIGH SCHOOL', '123456', 3.5, None, None)]
+VERSION_2 = [('ALPHA HIGH SCHOOL', '050944', 3.8, 4.0, None), ('GAMMA HIGH SCHOOL', '654321', 3.7, 3.9, 4.0)]
+
+
+def test_unchanged_file_is_skipped(db, gpa_file):
+    write_gpa_file(gpa_file.location, VERSION_1)
+
+    result = checkpoint.ingest_file(db, gpa_file)
+    assert result['status'] == 'success'
+    assert result['rows'] == 2 and result['records'] == 4
+    db.refresh(gpa_file)
+    assert gpa_file.is_added_to_db and gpa_file.content_hash == file_cache.file_hash(gpa_file.location)
+    assert gpa_file.record_count == 4 and gpa_file.last_error is None
+
+    assert checkpoint.ingest_file(db, gpa_file) == {'status': 'skipped', 'file_id': gpa_file.id}
+    assert len(stored_gpa(db, gpa_file.id)) == 4
+
+
+def test_changed_file_replaces_its_rows(db, gpa_file):
+    write_gpa_file(gpa_file.location, VERSION_1)
+    checkpoint.ingest_file(db, gpa_file)
+    write_gpa_file(gpa_file.location, VERSION_2)
+
+    assert checkpoint.ingest_file(db, gpa_file)['status'] == 'success'
+    # BETA's rows went with the old version; none of them is left behind
+    assert stored_gpa(db) == {
+        ('ALPHA HIGH SCHOOL50944', 'App'): 3.8,
+        ('ALPHA HIGH SCHOOL50944', 'Adm'): 4.0,
+        ('GAMMA HIGH SCHOOL654321', 'App'): 3.7,
+        ('GAMMA HIGH SCHOOL654321', 'Adm'): 3.9,
+        ('GAMMA HIGH SCHOOL654321', 'Enr'): 4.0,
+    }
+    db.refresh(gpa_file)
+    assert gpa_file.content_hash == file_cache.file_hash(gpa_file.location) and gpa_file.record_count == 5
+
+
+def test_failing_chunk_rolls_the_file_back(db, gpa_file):
+    write_gpa_file(gpa_file.location, VERSION_1)
+    checkpoint.ingest_file(db, gpa_file)
+    before = stored_gpa(db)
+    write_gpa_file(gpa_file.location, VERSION_2)
+
+    def fail_after_first_chunk(rows, written):
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        checkpoint.ingest_file(db, gpa_file, on_chunk=fail_after_first_chunk, chunksize=1)
+    assert stored_gpa(db) == before
+    db.refresh(gpa_file)
+    assert not gpa_file.is_added_to_db and gpa_file.last_error == "disk full"
+
+
+def test_cancelled_file_keeps_its_checkpoint(db, gpa_file):
+    write_gpa_file(gpa_file.location, VERSION_1)
+    checkpoint.ingest_file(db, gpa_file)
+    db.refresh(gpa_file)
+    content_hash = gpa_file.content_hash
+    before = stored_gpa(db)
+    write_gpa_file(gpa_file.location, VERSION_2)
+
+    def cancel(rows, written):
+        raise checkpoint.IngestionCancelled()
+
+    with pytest.raises(checkpoint.IngestionCancelled):
+        checkpoint.ingest_file(db, gpa_file, on_chunk=cancel, chunksize=1)
+    assert stored_gpa(db) == before
+    db.refresh(gpa_file)
+    assert gpa_file.is_added_to_db and gpa_file.content_hash == content_hash and gpa_file.last_error is None
+    assert db.query(models.HighSchool).filter_by(uc_school_name='GAMMA HIGH SCHOOL654321').count() == 0
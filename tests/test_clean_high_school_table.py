@@ -0,0 +1,51 @@
+from sql_db import models, process_csv_file
+
+
+def add_school(db, uc_school_name, school_code=None):
+    school = models.HighSchool(uc_school_name=uc_school_name, school_name='FOO HIGH SCHOOL', school_code=school_code,
+                               city='Irvine', county='Orange', state='CA', country='United States')
+    db.add(school)
+    db.flush()
+    return school.id
+
+
+def add_admission_rows(db, high_school_id, academic_year):
+    # One row per admission table; the duplicate's years differ from the survivor's so the merge hits no natural key
+    db.add_all([
+        models.UCAdmissionGPA(high_school_id=high_school_id, uc_campus_id=1, academic_year=academic_year,
+                              admission_type='App', mean_gpa=3.9),
+        models.UCAdmissionGender(high_school_id=high_school_id, uc_campus_id=1, academic_year=academic_year,
+                                 admission_type='App', total_applicants=10, female_applicants=6, male_applicants=4),
+        models.UCAdmissionEthnicityCounts(high_school_id=high_school_id, uc_campus_id=1, academic_year=academic_year,
+                                          admission_type='App', all_ethnicities=10, asian=10),
+    ])
+
+
+def test_duplicates_are_merged_into_the_normalized_school(db):
+    duplicate_id = add_school(db, 'FOO HIGH SCHOOL050944')
+    survivor_id = add_school(db, 'FOO HIGH SCHOOL50944', 50944)
+    renamed_id = add_school(db, 'BAR ACADEMY007')
+    add_admission_rows(db, duplicate_id, 2022)
+    add_admission_rows(db, survivor_id, 2023)
+    add_admission_rows(db, renamed_id, 2023)
+    db.commit()
+
+    assert process_csv_file.clean_high_school_table(db) == ['FOO HIGH SCHOOL050944']
+
+    schools = {name: (school_id, code) for school_id, name, code in
+               db.query(models.HighSchool.id, models.HighSchool.uc_school_name, models.HighSchool.school_code)}
+    assert schools == {'FOO HIGH SCHOOL50944': (survivor_id, 50944), 'BAR ACADEMY7': (renamed_id, 7)}
+    for model in (models.UCAdmissionGPA, models.UCAdmissionGender, models.UCAdmissionEthnicityCounts):
+        rows = db.query(model.high_school_id, model.academic_year).order_by(model.high_school_id, model.academic_year)
+        assert rows.all() == [(survivor_id, 2022), (survivor_id, 2023), (renamed_id, 2023)]
+    # The derived tables keyed by high_school_id are rebuilt with the merged school's rows
+    assert {row.academic_year for row in db.query(models.AdmissionMetrics).filter_by(high_school_id=survivor_id)} == {2022, 2023}
+    assert db.query(models.AdmissionMetrics).filter_by(high_school_id=duplicate_id).count() == 0
+
+
+def test_clean_table_is_left_alone(db):
+    add_school(db, 'FOO HIGH SCHOOL50944', 50944)
+    db.commit()
+
+    assert process_csv_file.clean_high_school_table(db) == []
+    assert db.query(models.HighSchool.uc_school_name, models.HighSchool.school_code).all() == [('FOO HIGH SCHOOL50944', 50944)]
@@ -0,0 +1,80 @@
+import datetime
+import functools
+
+from conftest import stored_gpa, write_gpa_file
+from sql_db import checkpoint, generation, jobs, models, ranking
+
+VERSION_1 = [('ALPHA HIGH SCHOOL', '050944', 3.9, 4.1, 4.2), ('BETA HIGH SCHOOL', '123456', 3.5, None, None)]
+VERSION_2 = [('ALPHA HIGH SCHOOL', '050944', 3.8, 4.0, None), ('GAMMA HIGH SCHOOL', '654321', 3.7, 3.9, 4.0)]
+
+
+def test_cancel_rolls_back_the_file_in_progress(db, gpa_file, monkeypatch):
+    write_gpa_file(gpa_file.location, VERSION_1)
+    checkpoint.ingest_file(db, gpa_file)
+    db.refresh(gpa_file)
+    content_hash = gpa_file.content_hash
+    before = stored_gpa(db)
+    write_gpa_file(gpa_file.location, VERSION_2)
+
+    job_id = jobs.enqueue_files(db, [gpa_file.id])
+    assert jobs.claim_job(db) == job_id
+    # The cancel arrives once the file started: the check before the file passes, the one after its first chunk does not
+    checks = []
+    monkeypatch.setattr(jobs, '_cancel_requested', lambda db, job_id: checks.append(job_id) or len(checks) > 1)
+    monkeypatch.setattr(checkpoint, 'ingest_file', functools.partial(checkpoint.ingest_file, chunksize=1))
+
+    assert jobs.run_job(db, job_id) == models.JobStatus.CANCELLED
+    job = db.query(models.IngestionJob).filter_by(id=job_id).one()
+    assert [job_file.status for job_file in job.files] == [models.JobStatus.CANCELLED]
+    assert job.finished_at is not None
+    db.refresh(gpa_file)
+    assert gpa_file.is_added_to_db and gpa_file.content_hash == content_hash and gpa_file.last_error is None
+    assert stored_gpa(db) == before
+
+
+def test_queued_job_is_cancelled_at_once(db, gpa_file):
+    job_id = jobs.enqueue_files(db, [gpa_file.id])
+
+    assert jobs.cancel_job(db, job_id) == models.JobStatus.CANCELLED
+    assert jobs.claim_job(db) is None
+    assert jobs.get_job(db, job_id)['files'][0]['status'] == 'cancelled'
+
+
+def test_only_jobs_without_a_recent_heartbeat_are_requeued(db, gpa_file):
+    now = datetime.datetime.utcnow()
+    started = {
+        'dead': (now - datetime.timedelta(hours=2), now - datetime.timedelta(hours=1)),
+        'alive': (now - datetime.timedelta(hours=2), now - datetime.timedelta(seconds=30)),
+        'never_beat': (now - datetime.timedelta(hours=1), None),
+    }
+    ids = {}
+    for name, (started_at, heartbeat_at) in started.items():
+        job = models.IngestionJob(status=models.JobStatus.RUNNING, cancel_requested=False, created_at=started_at,
+                                  started_at=started_at, heartbeat_at=heartbeat_at, worker_pid=1)
+        job.files = [models.IngestionJobFile(position=0, file_id=gpa_file.id, status=models.JobStatus.RUNNING)]
+        db.add(job)
+        db.flush()
+        ids[name] = job.id
+    db.commit()
+
+    assert jobs.requeue_interrupted(db, lease_seconds=600) == [ids['dead'], ids['never_beat']]
+    statuses = dict(db.query(models.IngestionJob.id, models.IngestionJob.status))
+    assert statuses == {ids['dead']: models.JobStatus.QUEUED, ids['alive']: models.JobStatus.RUNNING,
+                        ids['never_beat']: models.JobStatus.QUEUED}
+    assert jobs.requeue_interrupted(db, lease_seconds=600) == []
+
+
+def test_own_ingestion_keeps_the_refreshed_rankings(db, gpa_file, monkeypatch):
+    monkeypatch.setattr(generation, 'CHECK_INTERVAL', 0)
+    write_gpa_file(gpa_file.location, VERSION_1)
+    checkpoint.ingest_file(db, gpa_file)
+    store = ranking.get_rankings(db)
+
+    write_gpa_file(gpa_file.location, VERSION_2)
+    checkpoint.ingest_file(db, gpa_file)
+    assert ranking.get_rankings(db) is store
+
+    # A write this process does not refresh its copies for, as from another process, reloads them
+    generation.bump(db, refreshed=False)
+    db.commit()
+    assert ranking.get_rankings(db) is not store
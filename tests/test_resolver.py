@@ -0,0 +1,49 @@
+import pandas as pd
+
+from sql_db import models, transform
+from sql_db.database import SessionLocal
+from sql_db.resolver import HighSchoolResolver
+
+
+def schools(*uc_school_names):
+    return pd.DataFrame([{
+        'uc_school_name': name, 'school_code': None, 'school_name': name, 'city': 'Irvine',
+        'county': 'Orange', 'state': 'CA', 'country': 'United States', 'is_public': True,
+    } for name in uc_school_names], columns=transform.HIGH_SCHOOL_COLUMNS)
+
+
+def test_unseen_schools_are_inserted_once(db):
+    resolver = HighSchoolResolver(db)
+    first = resolver.resolve(schools('ALPHA1', 'BETA2'))
+    db.commit()
+    second = resolver.resolve(schools('BETA2', 'GAMMA3'))
+    db.commit()
+
+    assert second['BETA2'] == first['BETA2']
+    stored = dict(db.query(models.HighSchool.uc_school_name, models.HighSchool.id))
+    assert stored == {**first, **second}
+
+
+def test_school_inserted_by_another_run_is_reused(db):
+    resolver = HighSchoolResolver(db)
+    resolver.resolve(schools('ALPHA1'))
+    db.commit()
+    # Another run inserts the school after this resolver loaded its ids
+    with SessionLocal() as other:
+        other_id = HighSchoolResolver(other).resolve(schools('BETA2'))['BETA2']
+        other.commit()
+
+    assert resolver.resolve(schools('BETA2')) == {'BETA2': other_id}
+    db.commit()
+    assert db.query(models.HighSchool).filter_by(uc_school_name='BETA2').count() == 1
+
+
+def test_invalidate_forgets_rolled_back_schools(db):
+    resolver = HighSchoolResolver(db)
+    resolver.resolve(schools('ALPHA1'))
+    db.rollback()
+    resolver.invalidate()
+
+    ids = resolver.resolve(schools('ALPHA1'))
+    db.commit()
+    assert db.query(models.HighSchool.id).filter_by(uc_school_name='ALPHA1').scalar() == ids['ALPHA1']